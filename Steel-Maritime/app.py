@@ -1,20 +1,25 @@
+import math
 import os
-from flask import Flask, render_template, request, jsonify
+import click
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload, object_session
 from datetime import datetime, timedelta
 import json
+from db_routing import configure_engines, init_replica_monitor, read_engine, read_only, RoutingSession
+from prediction_result import PredictionJSONProvider
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "maritime-demurrage-key")
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+configure_engines(app)
+app.json = PredictionJSONProvider(app)
 
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+init_replica_monitor(app)
 
 from models import init_models
 models = init_models(db)
@@ -25,13 +30,234 @@ CargoType = models['CargoType']
 Voyage = models['Voyage']
 DemurrageRecord = models['DemurrageRecord']
 
+from migrations import upgrade_database, migration_status
+from exports import export_stream, EXPORT_FORMATS, MAX_CHUNK_SIZE
 from ontology import MaritimeOntology
 from demurrage_model import DemurragePredictor
+from berth_scheduler import BerthScheduler
+from fleet_assignment import FleetAssigner
+from port_simulation import MAX_HORIZON_DAYS, port_parameters, simulate_scenarios, validate_scenarios
+from rescoring import VoyageRescorer
+from distance import PortDistanceService
+from shared_reference import ReferenceDataStore, ReferencePublisher
+from jobs import FINISHED_STATUSES, JobQueue, JobQueueFull
+from laytime import LAYTIME_TERMS, LaytimeCalculator, WeatherCalendar, recompute_actual_demurrage
+from congestion_store import CongestionStore
+from wait_profiles import WaitProfileStore
+from live_feed import DashboardFeed
+from what_if import run_what_if
+from voyage_lifecycle import apply_lifecycle_events
+from prediction_cluster import PredictionCluster, PredictionWorker, start_local_workers
 
 ontology = MaritimeOntology()
 predictor = DemurragePredictor()
+berth_scheduler = BerthScheduler(predictor)
+fleet_assigner = FleetAssigner(predictor)
+rescorer = VoyageRescorer(app, db, models, predictor, ontology).install()
+distance_service = PortDistanceService()
+
+reference_store = ReferenceDataStore(database_url=app.config["SQLALCHEMY_DATABASE_URI"])
+predictor.set_reference_store(reference_store)
+congestion_store = CongestionStore(db, models)
+predictor.set_congestion_store(congestion_store)
+wait_profile_store = WaitProfileStore(db, models)
+dashboard_feed = DashboardFeed(app, db, models).install()
+
+def _prediction_worker_authkey():
+    # Workers run whatever an authenticated peer asks for, so there is deliberately no fallback key.
+    authkey = os.environ.get("PREDICTION_WORKER_AUTHKEY")
+    if not authkey:
+        raise RuntimeError("PREDICTION_WORKER_AUTHKEY must be set, to the same value on the web app and every worker")
+    return authkey.encode()
+
+prediction_cluster = None
+if os.environ.get("PREDICTION_WORKERS"):
+    prediction_cluster = PredictionCluster(
+        os.environ["PREDICTION_WORKERS"].split(","),
+        _prediction_worker_authkey(),
+        timeout=float(os.environ.get("PREDICTION_WORKER_TIMEOUT", 120)),
+        logger=app.logger
+    )
+
+job_queue = JobQueue(
+    app,
+    db,
+    models,
+    max_workers=int(os.environ.get("JOB_WORKERS", 2)),
+    max_pending=int(os.environ.get("JOB_MAX_PENDING", 32)),
+    retention_seconds=float(os.environ.get("JOB_RETENTION_SECONDS", 3600))
+)
+
+@event.listens_for(Port, "after_insert")
+@event.listens_for(Port, "after_update")
+def _track_port_coordinates(mapper, connection, port):
+    # Held until commit so a rolled-back edit never reaches this process's distance cache.
+    session = object_session(port)
+    if session is not None:
+        session.info.setdefault("port_coordinates", []).append((port.id, port.latitude, port.longitude))
+
+@event.listens_for(db.session, "after_commit")
+def _apply_port_coordinates(session):
+    for port_id, latitude, longitude in session.info.pop("port_coordinates", ()):
+        distance_service.mark_port(port_id, latitude, longitude)
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_port_coordinates(session):
+    session.info.pop("port_coordinates", None)
+
+@event.listens_for(Port, "after_insert")
+@event.listens_for(Port, "after_update")
+@event.listens_for(Vessel, "after_insert")
+@event.listens_for(Vessel, "after_update")
+@event.listens_for(CargoType, "after_insert")
+@event.listens_for(CargoType, "after_update")
+@event.listens_for(VesselType, "after_insert")
+@event.listens_for(VesselType, "after_update")
+def _track_reference_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["reference_data_changed"] = True
+
+@event.listens_for(db.session, "after_commit")
+def _republish_reference_data(session):
+    if session.info.pop("reference_data_changed", False):
+        reference_publisher.request()
+
+@event.listens_for(Voyage, "after_insert")
+@event.listens_for(Voyage, "after_update")
+def _track_berth_wait(mapper, connection, voyage):
+    state = inspect(voyage)
+    if not (state.attrs.ata.history.has_changes() or state.attrs.berthing_time.history.has_changes()):
+        return
+    session = object_session(voyage)
+    if session is not None:
+        session.info.setdefault("congestion_observations", []).extend(
+            congestion_store.voyage_observations([voyage])
+        )
+
+@event.listens_for(db.session, "after_commit")
+def _record_berth_waits(session):
+    observations = session.info.pop("congestion_observations", None)
+    if observations:
+        congestion_store.record(observations, source="voyage")
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_berth_waits(session):
+    session.info.pop("congestion_observations", None)
+
+def _attach_reference_data():
+    arrays = reference_store.arrays
+    if "distance_matrix" in arrays:
+        distance_service.attach(arrays["distance_port_ids"], arrays["distance_lats"],
+                                arrays["distance_lons"], arrays["distance_matrix"])
+
+def publish_reference_data():
+    reference_store.publish_from_database(db.engine, models, predictor, ontology, distance_service)
+    _attach_reference_data()
+
+reference_publisher = ReferencePublisher(app, publish_reference_data)
+rescorer.follow(reference_publisher)
+
+@app.before_request
+def _refresh_reference_data():
+    if reference_store.refresh_if_stale():
+        _attach_reference_data()
+    congestion_store.refresh_if_stale()
+    if wait_profile_store.refresh_if_stale():
+        predictor.set_wait_time_profiles(wait_profile_store.profiles)
+
+def _vessel_speed(vessel, override=None):
+    if override is not None and override != "":
+        speed = float(override)
+        if not math.isfinite(speed) or speed <= 0:
+            raise ValueError("speed_knots must be a positive number")
+        return speed
+    speed = reference_store.service_speed(vessel.vessel_type_id) if vessel else None
+    if speed is not None:
+        return speed
+    return ontology.get_service_speed(vessel.vessel_type.name if vessel and vessel.vessel_type else None)
+
+def _resolve_eta(eta_str, departure_str, vessel, origin, dest):
+    if eta_str:
+        return datetime.strptime(eta_str, "%Y-%m-%dT%H:%M")
+    if departure_str and origin and dest:
+        departure = datetime.strptime(departure_str, "%Y-%m-%dT%H:%M")
+        try:
+            return distance_service.estimate_eta(origin.id, dest.id, departure, _vessel_speed(vessel))
+        except KeyError:
+            raise ValueError(f"No route distance from {origin.name} to {dest.name}; give an eta instead")
+    return datetime.utcnow()
+
+def _id(row):
+    return row.id if row is not None else None
+
+def _predict_local(request_objects):
+    vessel, origin, dest, cargo_type, cargo_volume, eta = request_objects
+    return predictor.predict_demurrage(
+        vessel=vessel,
+        origin_port=origin,
+        dest_port=dest,
+        cargo_type=cargo_type,
+        cargo_volume=cargo_volume,
+        eta=eta,
+        ontology=ontology
+    )
+
+def _predict(requests):
+    if prediction_cluster is None:
+        return [_predict_local(r) for r in requests]
+    items = [(_id(vessel), _id(origin), _id(dest), _id(cargo_type), cargo_volume, eta)
+             for vessel, origin, dest, cargo_type, cargo_volume, eta in requests]
+    originals = dict(zip(items, requests))
+    return prediction_cluster.fan_out("predict", items, [item[2] for item in items],
+                                      lambda batch: [_predict_local(originals[item]) for item in batch])
+
+def _sweep_local(request_objects, progress=None):
+    vessel, dest, cargo_type, cargo_volume = request_objects
+    return predictor.get_optimization_recommendations(
+        vessel=vessel,
+        dest_port=dest,
+        cargo_type=cargo_type,
+        cargo_volume=cargo_volume,
+        ontology=ontology,
+        progress=progress
+    )
+
+def _sweep(request_objects, progress=None):
+    if prediction_cluster is None:
+        return _sweep_local(request_objects, progress)
+    vessel, dest, cargo_type, cargo_volume = request_objects
+    item = (_id(vessel), _id(dest), _id(cargo_type), cargo_volume)
+    return prediction_cluster.fan_out("optimize", [item], [item[1]],
+                                      lambda batch: [_sweep_local(request_objects, progress)])[0]
+
+def _simulation_options(params):
+    horizon_days = int(params.get("horizon_days", 365))
+    if not 1 <= horizon_days <= MAX_HORIZON_DAYS:
+        raise ValueError(f"horizon_days must be between 1 and {MAX_HORIZON_DAYS}")
+    workers = params.get("workers")
+    if workers is not None:
+        workers = int(workers)
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        workers = min(workers, os.cpu_count() or 1)
+    validate_scenarios(params.get("scenarios"))
+    return {"horizon_days": horizon_days, "workers": workers, "seed": int(params.get("seed", 0))}
+
+def _apply_wait_time_profiles(profiles):
+    # Stored rather than only set here: the simulation may have run in a job runner, and every
+    # web worker and prediction node picks the profiles up from the table.
+    wait_profile_store.save(profiles)
+    predictor.set_wait_time_profiles(wait_profile_store.profiles)
+
+def _simulate(port_params, scenarios, horizon_days, workers, seed, apply_to_predictor=False):
+    if prediction_cluster is None:
+        return simulate_scenarios(port_params, scenarios=scenarios, horizon_days=horizon_days,
+                                  workers=workers, seed=seed)
+    return prediction_cluster.simulate(port_params, scenarios, horizon_days, seed, workers, apply_to_predictor)
 
 @app.route("/")
+@read_only
 def dashboard():
     vessels = Vessel.query.all()
     ports = Port.query.all()
@@ -49,6 +275,15 @@ def dashboard():
                          total_voyages=total_voyages,
                          avg_delay=round(avg_delay, 1))
 
+@app.route("/api/dashboard/stream")
+def api_dashboard_stream():
+    subscription = dashboard_feed.subscribe()
+    return Response(
+        dashboard_feed.stream(subscription),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route("/voyage/plan", methods=["GET", "POST"])
 def voyage_planning():
     vessels = Vessel.query.all()
@@ -64,23 +299,24 @@ def voyage_planning():
         cargo_volume_str = request.form.get("cargo_volume", "0")
         cargo_volume = float(cargo_volume_str) if cargo_volume_str else 0
         eta_str = request.form.get("eta")
+        departure_str = request.form.get("departure")
         
         vessel = Vessel.query.get(vessel_id)
         origin = Port.query.get(origin_port_id) if origin_port_id else None
         dest = Port.query.get(dest_port_id)
         cargo = CargoType.query.get(cargo_type_id)
         
-        eta = datetime.strptime(eta_str, "%Y-%m-%dT%H:%M") if eta_str else datetime.utcnow()
+        try:
+            eta = _resolve_eta(eta_str, departure_str, vessel, origin, dest)
+        except ValueError as e:
+            return render_template("voyage_planning.html",
+                                 vessels=vessels,
+                                 ports=ports,
+                                 cargo_types=cargo_types,
+                                 prediction=None,
+                                 error=str(e)), 400
         
-        prediction = predictor.predict_demurrage(
-            vessel=vessel,
-            origin_port=origin,
-            dest_port=dest,
-            cargo_type=cargo,
-            cargo_volume=cargo_volume,
-            eta=eta,
-            ontology=ontology
-        )
+        prediction = _predict([(vessel, origin, dest, cargo, cargo_volume, eta)])[0]
         
         voyage = Voyage(
             vessel_id=vessel_id,
@@ -99,7 +335,12 @@ def voyage_planning():
                          vessels=vessels, 
                          ports=ports, 
                          cargo_types=cargo_types,
-                         prediction=prediction)
+                         prediction=prediction.to_dict() if prediction else None)
+
+def _fast_json_response(render_fast, render_fallback):
+    if app.json.compact is False or (app.json.compact is None and app.debug):
+        return jsonify(render_fallback())
+    return app.response_class(render_fast() + "\n", mimetype=app.json.mimetype)
 
 @app.route("/api/predict", methods=["POST"])
 def api_predict():
@@ -113,19 +354,47 @@ def api_predict():
     cargo_volume = float(cargo_volume_val) if cargo_volume_val else 0
     eta_str = data.get("eta")
     
-    eta = datetime.strptime(eta_str, "%Y-%m-%dT%H:%M") if eta_str else datetime.utcnow()
+    try:
+        eta = _resolve_eta(eta_str, data.get("departure"), vessel, origin, dest)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid eta or departure: {e}"}), 400
     
-    prediction = predictor.predict_demurrage(
-        vessel=vessel,
-        origin_port=origin,
-        dest_port=dest,
-        cargo_type=cargo,
-        cargo_volume=cargo_volume,
-        eta=eta,
-        ontology=ontology
-    )
+    prediction = _predict([(vessel, origin, dest, cargo, cargo_volume, eta)])[0]
     
-    return jsonify(prediction)
+    return _fast_json_response(prediction.to_json, prediction.to_dict)
+
+@app.route("/api/predict/batch", methods=["POST"])
+def api_predict_batch():
+    items = request.json.get("predictions", [])
+    
+    vessels = {v.id: v for v in Vessel.query.options(joinedload(Vessel.vessel_type))
+               .filter(Vessel.id.in_({item.get("vessel_id") for item in items})).all()}
+    ports = {p.id: p for p in Port.query.all()}
+    cargo_types = {c.id: c for c in CargoType.query.all()}
+    
+    requests = []
+    for index, item in enumerate(items):
+        vessel = vessels.get(item.get("vessel_id"))
+        origin = ports.get(item.get("origin_port_id"))
+        dest = ports.get(item.get("dest_port_id"))
+        try:
+            eta = _resolve_eta(item.get("eta"), item.get("departure"), vessel, origin, dest)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid eta or departure in prediction {index}: {e}"}), 400
+        requests.append((
+            vessel,
+            origin,
+            dest,
+            cargo_types.get(item.get("cargo_type_id")),
+            float(item.get("cargo_volume") or 0),
+            eta
+        ))
+    predictions = _predict(requests)
+    
+    return _fast_json_response(
+        lambda: '{"predictions":[' + ",".join(p.to_json() for p in predictions) + "]}",
+        lambda: {"predictions": predictions}
+    )
 
 @app.route("/api/optimization", methods=["POST"])
 def api_optimization():
@@ -137,17 +406,277 @@ def api_optimization():
     cargo_volume_val = data.get("cargo_volume", 0)
     cargo_volume = float(cargo_volume_val) if cargo_volume_val else 0
     
-    recommendations = predictor.get_optimization_recommendations(
-        vessel=vessel,
-        dest_port=dest,
-        cargo_type=cargo,
-        cargo_volume=cargo_volume,
-        ontology=ontology
-    )
+    recommendations = _sweep((vessel, dest, cargo, cargo_volume))
     
     return jsonify(recommendations)
 
+def _optimization_job(job, params):
+    # Runners serve no requests, so they pick up shared reference data and profiles here.
+    _refresh_reference_data()
+    items = params.get("requests") or [params]
+    cargo_types = {c.id: c for c in CargoType.query.all()}
+    ports = {p.id: p for p in Port.query.all()}
+    vessels = {v.id: v for v in Vessel.query.options(joinedload(Vessel.vessel_type))
+               .filter(Vessel.id.in_({item.get("vessel_id") for item in items})).all()}
+    
+    results = []
+    for index, item in enumerate(items):
+        job.progress(index, len(items), f"Sweeping arrival times for request {index + 1}")
+        recommendations = _sweep(
+            (vessels.get(item.get("vessel_id")), ports.get(item.get("dest_port_id")),
+             cargo_types.get(item.get("cargo_type_id")), float(item.get("cargo_volume") or 0)),
+            progress=lambda done, total: job.check_cancelled()
+        )
+        recommendations["current_prediction"] = recommendations["current_prediction"].to_dict()
+        partial = {"index": index, "request": item, **recommendations}
+        job.emit(partial)
+        results.append(partial)
+    job.progress(len(items), len(items))
+    return {"results": results}
+
+def _simulation_job(job, params):
+    cargo_types = CargoType.query.all()
+    port_params = [port_parameters(port, cargo_types) for port in Port.query.all()]
+    scenarios = params.get("scenarios") or [{"name": "base"}]
+    options = _simulation_options(params)
+    
+    results = {}
+    for index, scenario in enumerate(scenarios):
+        job.progress(index, len(scenarios), f"Simulating scenario {scenario.get('name', index)}")
+        outcome = _simulate(
+            port_params,
+            scenarios=[{**scenario, "name": scenario.get("name", f"scenario_{index}")}],
+            apply_to_predictor=bool(params.get("apply_to_predictor")) and index == 0,
+            **options
+        )
+        job.emit(outcome)
+        results.update(outcome)
+    job.progress(len(scenarios), len(scenarios))
+    
+    if params.get("apply_to_predictor"):
+        _apply_wait_time_profiles(next(iter(results.values())))
+    return results
+
+job_queue.register("optimization", _optimization_job)
+job_queue.register("simulation", _simulation_job)
+
+@app.route("/api/jobs", methods=["GET", "POST"])
+def api_jobs():
+    if request.method == "GET":
+        return jsonify({"jobs": job_queue.list()})
+    
+    data = request.json or {}
+    try:
+        if not isinstance(data, dict):
+            raise TypeError("Request body must be a JSON object")
+        params = data.get("params") or {}
+        if not isinstance(params, dict):
+            raise TypeError("params must be a JSON object")
+        if data.get("kind") == "simulation":
+            _simulation_options(params)
+        job = job_queue.submit(data.get("kind"), params)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify(job), 202, {"Location": f"/api/jobs/{job['id']}"}
+
+@app.route("/api/jobs/<job_id>", methods=["GET", "DELETE"])
+def api_job(job_id):
+    job = job_queue.cancel(job_id) if request.method == "DELETE" else job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job)
+
+@app.route("/api/jobs/<job_id>/result")
+def api_job_result(job_id):
+    job = job_queue.get(job_id, include_result=True)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if job["status"] not in FINISHED_STATUSES:
+        del job["result"]
+        return jsonify(job), 202
+    return jsonify(job), 200 if job["status"] == "succeeded" else 409
+
+@app.route("/api/jobs/<job_id>/stream")
+def api_job_stream(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return Response(
+        stream_with_context(json.dumps(event) + "\n" for event in job_queue.stream(job_id)),
+        mimetype="application/x-ndjson"
+    )
+
+@app.route("/api/eta", methods=["POST"])
+def api_eta():
+    data = request.json
+    
+    vessel = Vessel.query.get(data.get("vessel_id")) if data.get("vessel_id") else None
+    try:
+        origin_id = int(data["origin_port_id"])
+        dest_id = int(data["dest_port_id"])
+        departure = datetime.strptime(data["departure"], "%Y-%m-%dT%H:%M")
+        speed = _vessel_speed(vessel, data.get("speed_knots"))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid ETA request: {e}"}), 400
+    
+    try:
+        eta = distance_service.estimate_eta(origin_id, dest_id, departure, speed)
+    except KeyError:
+        return jsonify({"error": "Unknown port or port without coordinates"}), 404
+    
+    return jsonify({
+        "distance_nm": round(distance_service.distance_nm(origin_id, dest_id), 1),
+        "speed_knots": speed,
+        "eta": eta.strftime("%Y-%m-%d %H:%M")
+    })
+
+@app.route("/api/eta/bulk", methods=["POST"])
+def api_eta_bulk():
+    items = request.json.get("voyages", [])
+    if not items:
+        return jsonify({"etas": []})
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({"error": "voyages must be a list of objects"}), 400
+    
+    vessel_ids = {item.get("vessel_id") for item in items if item.get("vessel_id")}
+    vessels = {v.id: v for v in Vessel.query.options(joinedload(Vessel.vessel_type))
+               .filter(Vessel.id.in_(vessel_ids)).all()} if vessel_ids else {}
+    
+    try:
+        speeds = [_vessel_speed(vessels.get(item.get("vessel_id")), item.get("speed_knots")) for item in items]
+        etas, distances = distance_service.estimate_etas(
+            [int(item["origin_port_id"]) for item in items],
+            [int(item["dest_port_id"]) for item in items],
+            [item["departure"] for item in items],
+            speeds
+        )
+    except KeyError:
+        return jsonify({"error": "Unknown port or port without coordinates"}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid ETA request: {e}"}), 400
+    
+    return jsonify({"etas": [
+        {"distance_nm": round(float(d), 1), "speed_knots": speed,
+         "eta": str(eta).replace("T", " ")[:16]}
+        for d, speed, eta in zip(distances, speeds, etas)
+    ]})
+
+@app.route("/api/berth-schedule", methods=["POST"])
+def api_berth_schedule():
+    data = request.json
+    
+    port = Port.query.get(data.get("dest_port_id"))
+    if port is None:
+        return jsonify({"error": "Unknown destination port"}), 404
+    
+    voyages = Voyage.query.options(joinedload(Voyage.vessel), joinedload(Voyage.cargo_type))\
+        .filter(Voyage.destination_port_id == port.id, Voyage.status == "planned").all()
+    
+    return jsonify(berth_scheduler.schedule_port(port, voyages, ontology))
+
+@app.route("/api/fleet-assignment", methods=["POST"])
+@read_only
+def api_fleet_assignment():
+    data = request.json or {}
+    
+    ports = {p.id: p for p in Port.query.all()}
+    cargo_types = {c.id: c for c in CargoType.query.all()}
+    query = Vessel.query.options(joinedload(Vessel.vessel_type)).order_by(Vessel.id)
+    if data.get("vessel_ids"):
+        query = query.filter(Vessel.id.in_(data["vessel_ids"]))
+    vessels = query.all()
+    
+    cargoes = []
+    try:
+        for index, item in enumerate(data.get("cargoes", [])):
+            if not isinstance(item, dict):
+                raise ValueError(f"cargo {index} must be an object")
+            if item.get("dest_port_id") not in ports:
+                raise ValueError(f"cargo {item.get('id', index)} has an unknown destination port")
+            cargoes.append({
+                "id": item.get("id", index),
+                "origin_port_id": item.get("origin_port_id"),
+                "dest_port_id": item["dest_port_id"],
+                "cargo_type_id": None if item.get("cargo_type_id") is None else int(item["cargo_type_id"]),
+                "cargo_volume": float(item.get("cargo_volume") or 0),
+                "eta": _resolve_eta(item.get("eta"), None, None, None, None),
+            })
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid cargo: {e}"}), 400
+    
+    return jsonify(fleet_assigner.assign(vessels, cargoes, ports, cargo_types, ontology))
+
+@app.route("/api/simulation", methods=["POST"])
+def api_simulation():
+    data = request.json or {}
+    try:
+        options = _simulation_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid simulation request: {e}"}), 400
+    
+    cargo_types = CargoType.query.all()
+    params = [port_parameters(port, cargo_types) for port in Port.query.all()]
+    results = _simulate(
+        params,
+        scenarios=data.get("scenarios"),
+        apply_to_predictor=bool(data.get("apply_to_predictor")),
+        **options
+    )
+    
+    if data.get("apply_to_predictor"):
+        _apply_wait_time_profiles(next(iter(results.values())))
+    
+    return jsonify(results)
+
+@app.route("/api/voyages/lifecycle", methods=["POST"])
+def api_voyage_lifecycle():
+    data = request.json or {}
+    try:
+        calculator = LaytimeCalculator(
+            terms=data.get("laytime_terms", "SHINC"),
+            nor_turn_hours=float(data.get("nor_turn_hours", 6.0))
+        )
+        stats = apply_lifecycle_events(db, models, calculator, data.get("events", []),
+                                       congestion_store=congestion_store)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid lifecycle event: {e}"}), 400
+    return jsonify(stats)
+
+@app.route("/api/congestion/observations", methods=["POST"])
+def api_congestion_observations():
+    data = request.json or {}
+    try:
+        recorded = congestion_store.record(data.get("observations", []))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid observation: {e}"}), 400
+    return jsonify({"recorded": recorded}), 201
+
+@app.route("/api/ports/<int:port_id>/congestion")
+def api_port_congestion(port_id):
+    if Port.query.get(port_id) is None:
+        return jsonify({"error": "Unknown port"}), 404
+    return jsonify(congestion_store.port_summary(port_id))
+
+@app.route("/api/prediction-cluster")
+def api_prediction_cluster():
+    if prediction_cluster is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **prediction_cluster.status()})
+
+@app.route("/api/what-if", methods=["POST"])
+@read_only
+def api_what_if():
+    data = request.json or {}
+    try:
+        report = run_what_if(db, models, predictor, ontology, data.get("scenarios"),
+                             top_voyages=int(data.get("top_voyages", 10)))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid scenario: {e}"}), 400
+    return jsonify(report)
+
 @app.route("/analytics")
+@read_only
 def analytics():
     demurrage_by_port = db.session.query(
         Port.name,
@@ -187,15 +716,47 @@ def ontology_view():
                          cargo_relationships=cargo_relationships)
 
 @app.route("/fleet")
+@read_only
 def fleet_management():
     vessels = Vessel.query.all()
     return render_template("fleet.html", vessels=vessels)
 
 @app.route("/ports")
+@read_only
 def port_management():
     ports = Port.query.all()
     return render_template("ports.html", ports=ports)
 
+def _parse_export_date(value):
+    return datetime.strptime(value, "%Y-%m-%d") if value else None
+
+def _parse_chunk_size(value):
+    if value is None:
+        return 5000
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"chunk_size must be an integer, got {value!r}")
+
+@app.route("/api/export/<dataset>")
+@read_only
+def api_export(dataset):
+    fmt = request.args.get("format", "csv")
+    try:
+        since = _parse_export_date(request.args.get("since"))
+        until = _parse_export_date(request.args.get("until"))
+        chunks = export_stream(read_engine(db), models, dataset, fmt, since=since, until=until,
+                               chunk_size=_parse_chunk_size(request.args.get("chunk_size")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    extension = "arrows" if fmt == "arrow" else fmt
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={dataset}.{extension}"}
+    )
+
 def seed_database():
     if Vessel.query.first() is not None:
         return
@@ -338,9 +899,271 @@ def seed_database():
     db.session.commit()
     print("Database seeded with sample maritime data.")
 
+@app.cli.command("db-upgrade")
+@click.option("--target", type=int, default=None, help="Stop after this migration version.")
+def db_upgrade_command(target):
+    applied = upgrade_database(db, target=target)
+    for version, description in applied:
+        click.echo(f"Applied {version:04d} {description}")
+    if not applied:
+        click.echo("Database schema is up to date.")
+
+@app.cli.command("db-status")
+def db_status_command():
+    for entry in migration_status(db):
+        state = "applied" if entry["applied"] else "pending"
+        click.echo(f"{entry['version']:04d} [{state}] {entry['description']}")
+
+@app.cli.command("scale-dataset")
+@click.option("--voyages", type=int, default=200000, show_default=True)
+@click.option("--seed", type=int, default=7, show_default=True)
+def scale_dataset_command(voyages, seed):
+    from datagen import generate_scaled_dataset
+    inserted = generate_scaled_dataset(db, models, num_voyages=voyages, seed=seed)
+    click.echo(f"Inserted {inserted} voyages.")
+
+@app.cli.command("check-query-plans")
+@click.option("--scale", type=int, default=0, help="Insert this many synthetic voyages first.")
+def check_query_plans_command(scale):
+    from datagen import generate_scaled_dataset, analyze_tables
+    from query_plans import check_route_query_plans
+    
+    if scale:
+        generate_scaled_dataset(db, models, num_voyages=scale)
+    else:
+        analyze_tables(db)
+    
+    failures = 0
+    for entry in check_route_query_plans(app, db):
+        for violation in entry["violations"]:
+            failures += 1
+            click.echo(f"FAIL {entry['route']}: sequential scan on {violation['table']} "
+                       f"({violation['reason']})\n    {entry['statement']}")
+    if failures:
+        raise SystemExit(1)
+    click.echo("No sequential scans on large tables.")
+
+@app.cli.command("export")
+@click.argument("dataset", type=click.Choice(["voyages", "demurrage"]))
+@click.option("--format", "fmt", type=click.Choice(list(EXPORT_FORMATS)), default="csv", show_default=True)
+@click.option("--since", default=None, help="Inclusive start date (YYYY-MM-DD).")
+@click.option("--until", default=None, help="Exclusive end date (YYYY-MM-DD).")
+@click.option("--chunk-size", type=click.IntRange(min=1), default=5000, show_default=True,
+              help=f"Rows per fetch (capped at {MAX_CHUNK_SIZE}).")
+@click.option("--output", type=click.File("wb"), default="-")
+def export_command(dataset, fmt, since, until, chunk_size, output):
+    chunks = export_stream(db.engine, models, dataset, fmt,
+                           since=_parse_export_date(since), until=_parse_export_date(until),
+                           chunk_size=chunk_size)
+    for chunk in chunks:
+        output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+@app.cli.command("ingest-positions")
+@click.option("--file", "path", default=None, help="NDJSON or CSV file of position reports.")
+@click.option("--listen", default=None, help="HOST:PORT to accept newline-delimited JSON reports on.")
+@click.option("--batch-size", type=int, default=500, show_default=True)
+def ingest_positions_command(path, listen, batch_size):
+    from position_feed import PositionFeedIngestor, file_source, serve_socket
+    
+    ingestor = PositionFeedIngestor(app, db, models, predictor, ontology, batch_size=batch_size,
+                                    congestion_store=congestion_store)
+    if path:
+        stats = ingestor.ingest(file_source(path))
+        click.echo(json.dumps(stats))
+    elif listen:
+        host, _, port = listen.rpartition(":")
+        click.echo(f"Listening for position reports on {host or '127.0.0.1'}:{port}")
+        serve_socket(ingestor, host or "127.0.0.1", int(port))
+    else:
+        raise click.UsageError("Pass --file or --listen")
+
+@app.cli.command("rescore")
+@click.option("--port-id", "port_ids", type=int, multiple=True)
+@click.option("--vessel-id", "vessel_ids", type=int, multiple=True)
+@click.option("--cargo-type-id", "cargo_type_ids", type=int, multiple=True)
+@click.option("--vessel-type-id", "vessel_type_ids", type=int, multiple=True)
+def rescore_command(port_ids, vessel_ids, cargo_type_ids, vessel_type_ids):
+    rescored = rescorer.rescore(port_ids=port_ids, vessel_ids=vessel_ids, cargo_type_ids=cargo_type_ids,
+                                vessel_type_ids=vessel_type_ids)
+    click.echo(f"Re-scored {rescored} open voyages.")
+
+@app.cli.command("recompute-demurrage")
+@click.option("--terms", type=click.Choice(list(LAYTIME_TERMS)), default="SHINC", show_default=True)
+@click.option("--turn-time", type=float, default=6.0, show_default=True, help="NOR turn time in hours.")
+@click.option("--weather", "weather_path", default=None, help="CSV or NDJSON of port_id,start,end weather windows.")
+@click.option("--chunk-size", type=int, default=50000, show_default=True)
+@click.option("--skip-records", is_flag=True, help="Leave demurrage record costs untouched.")
+def recompute_demurrage_command(terms, turn_time, weather_path, chunk_size, skip_records):
+    calculator = LaytimeCalculator(
+        terms=terms,
+        nor_turn_hours=turn_time,
+        weather=WeatherCalendar.from_file(weather_path) if weather_path else None
+    )
+    stats = recompute_actual_demurrage(db, models, calculator, chunk_size=chunk_size,
+                                       update_records=not skip_records)
+    click.echo(json.dumps(stats))
+
+@app.cli.command("backfill-congestion")
+@click.option("--since", default=None, help="Only voyages that arrived on or after this date (YYYY-MM-DD).")
+def backfill_congestion_command(since):
+    recorded = congestion_store.backfill_from_voyages(since=_parse_export_date(since))
+    click.echo(f"Recorded {recorded} berth-wait observations from completed voyages.")
+
+@app.cli.command("backtest")
+@click.option("--predictor", "predictor_spec", default="demurrage_model:DemurragePredictor", show_default=True,
+              help="Predictor class to replay, as module:Class.")
+@click.option("--workers", type=int, default=None, help="Worker processes (default: one per CPU).")
+@click.option("--chunk-size", type=int, default=20000, show_default=True, help="Voyage ids per chunk.")
+@click.option("--since", default=None, help="Only voyages with an ETA on or after this date (YYYY-MM-DD).")
+@click.option("--until", default=None, help="Only voyages with an ETA before this date (YYYY-MM-DD).")
+@click.option("--output", type=click.File("w"), default=None, help="Write the full JSON report here.")
+def backtest_command(predictor_spec, workers, chunk_size, since, until, output):
+    from backtest import load_predictor, run_backtest, GROUPINGS
+    
+    try:
+        load_predictor(predictor_spec)
+    except (ValueError, ImportError, AttributeError) as e:
+        raise click.BadParameter(str(e), param_hint="--predictor")
+    
+    report = run_backtest(
+        db.engine, models, predictor_spec=predictor_spec, workers=workers, chunk_size=chunk_size,
+        since=_parse_export_date(since), until=_parse_export_date(until),
+        progress=lambda done, total: click.echo(f"\r{done}/{total} chunks", nl=False, err=True)
+    )
+    click.echo("", err=True)
+    if output:
+        json.dump(report, output, indent=2)
+    
+    click.echo(f"{report['predictor']}: {report['chunks']} chunks on {report['workers']} workers "
+               f"in {report['elapsed_seconds']}s")
+    if report["overall"]:
+        coverage = report["overall"]["interval_coverage"]
+        click.echo(f"Interval coverage: {coverage['nominal'] if coverage['nominal'] is not None else 'unknown'} "
+                   f"nominal vs {coverage['observed']} observed")
+    columns = ("voyages", "delay_mae_hours", "delay_bias_hours", "observed_coverage", "cost_voyages", "cost_mae",
+               "stored_delay_mae_hours")
+    click.echo(f"{'group':<32}" + "".join(f"{c:>{len(c) + 2}}" for c in columns))
+    rows = [("overall", report["overall"])] if report["overall"] else []
+    for grouping in GROUPINGS:
+        rows += [(f"{grouping}: {entry['name']}", entry) for entry in report[f"by_{grouping}"]]
+    for label, metrics in rows:
+        values = {**metrics, "observed_coverage": metrics["interval_coverage"]["observed"]}
+        click.echo(f"{label[:31]:<32}" + "".join(f"{str(values[c]):>{len(c) + 2}}" for c in columns))
+
+@app.cli.command("load-test")
+@click.option("--url", default="http://127.0.0.1:5000", show_default=True, help="Base URL of the running app.")
+@click.option("--rate", type=click.FloatRange(min=0, min_open=True), default=20.0, show_default=True,
+              help="Target requests per second.")
+@click.option("--duration", type=click.FloatRange(min=0, min_open=True), default=60.0, show_default=True,
+              help="Measured seconds.")
+@click.option("--warmup", type=click.FloatRange(min=0), default=5.0, show_default=True,
+              help="Seconds of traffic before measuring.")
+@click.option("--concurrency", type=click.IntRange(min=1), default=64, show_default=True,
+              help="Maximum requests in flight.")
+@click.option("--mix", default=None, help="Route weights, e.g. predict=40,optimization=5,plan=10,analytics=10,dashboard=35.")
+@click.option("--scale", type=int, default=None, help="Generate voyages until the database holds at least this many.")
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--output", type=click.File("w"), default=None, help="Write the JSON results here.")
+@click.option("--compare", "baseline", type=click.File("r"), default=None, help="Earlier results to compare against.")
+@click.option("--allow-writes", is_flag=True, help="Allow routes that create voyages (plan) against a non-local URL.")
+def load_test_command(url, rate, duration, warmup, concurrency, mix, scale, seed, output, baseline, allow_writes):
+    from loadtest import (LoadTest, RequestFactory, compare_reports, is_local_url, load_reference_ids, parse_mix,
+                          write_routes, PERCENTILES)
+    
+    try:
+        mix = parse_mix(mix)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--mix")
+    writes = write_routes(mix)
+    if writes and not is_local_url(url) and not allow_writes:
+        raise click.UsageError(f"{', '.join(writes)} requests create voyages in {url}'s database; "
+                               f"pass --allow-writes or drop them from --mix (e.g. plan=0)")
+    if writes:
+        click.echo(f"Note: {', '.join(writes)} requests create planned voyages in the target database.", err=True)
+    
+    reference = load_reference_ids(db.engine, models)
+    if scale and reference["voyages"] < scale:
+        from datagen import generate_scaled_dataset
+        click.echo(f"Scaling dataset from {reference['voyages']} to {scale} voyages...", err=True)
+        generate_scaled_dataset(db, models, num_voyages=scale - reference["voyages"], seed=seed)
+        reference = load_reference_ids(db.engine, models)
+    
+    test = LoadTest(url, mix, rate, duration, concurrency=concurrency, warmup=warmup, seed=seed)
+    report = test.run(RequestFactory(reference, seed),
+                      progress=lambda done, total: click.echo(f"\r{done}/{total} requests sent", nl=False, err=True))
+    click.echo("", err=True)
+    report["dataset"] = {"voyages": reference["voyages"]}
+    if output:
+        json.dump(report, output, indent=2)
+    
+    columns = ["requests", "errors", "throughput_rps"] + [f"p{p}_ms" for p in PERCENTILES]
+    click.echo(f"{'route':<14}" + "".join(f"{c:>16}" for c in columns))
+    for name, summary in [("overall", report["overall"])] + list(report["routes"].items()):
+        latency = summary.get("latency_ms", {})
+        values = [summary["requests"], summary["errors"], summary["throughput_rps"]] + \
+                 [latency.get(f"p{p}", "-") for p in PERCENTILES]
+        click.echo(f"{name:<14}" + "".join(f"{str(v):>16}" for v in values))
+    lag = report["client_send_lag_ms"]
+    if lag["p99"] > 100:
+        click.echo(f"Warning: p99 client send lag was {lag['p99']}ms; raise --concurrency for trustworthy latencies.", err=True)
+    
+    if baseline:
+        previous = json.load(baseline)
+        click.echo(f"\nCompared with {previous.get('revision') or 'baseline'} ({previous.get('started_at')}):")
+        for row in compare_reports(report, previous):
+            changes = [f"{metric} {v['baseline']} -> {v['current']}" +
+                       (f" ({v['change_pct']:+.1f}%)" if v["change_pct"] is not None else "")
+                       for metric, v in row.items() if metric != "route"]
+            click.echo(f"  {row['route']:<14}" + "; ".join(changes))
+
+@app.cli.command("job-worker")
+@click.option("--processes", type=click.IntRange(min=1), default=None,
+              help="Runner processes (default: JOB_WORKERS).")
+def job_worker_command(processes):
+    count = processes or job_queue.max_workers
+    click.echo(f"Running background jobs in {count} processes")
+    for pid in job_queue.start_workers(count):
+        os.waitpid(pid, 0)
+
+@app.cli.command("prediction-worker")
+@click.option("--address", default="127.0.0.1:6100", show_default=True,
+              help="host:port (or socket path) this worker listens on.")
+@click.option("--nodes", default=None, help="Comma-separated addresses of every worker (default: PREDICTION_WORKERS).")
+def prediction_worker_command(address, nodes):
+    nodes = (nodes or os.environ.get("PREDICTION_WORKERS") or address).split(",")
+    if address not in nodes:
+        raise click.BadParameter("must be one of the worker nodes", param_hint="--address")
+    try:
+        authkey = _prediction_worker_authkey()
+    except RuntimeError as e:
+        raise click.UsageError(str(e))
+    PredictionWorker(app, db, models, address, nodes, authkey).serve_forever()
+
+@app.cli.command("prediction-cluster")
+@click.option("--workers", type=int, default=os.cpu_count() or 1, show_default=True, help="Local worker processes.")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--base-port", type=int, default=6100, show_default=True)
+def prediction_cluster_command(workers, host, base_port):
+    try:
+        authkey = _prediction_worker_authkey()
+    except RuntimeError as e:
+        raise click.UsageError(str(e))
+    nodes = [f"{host}:{base_port + index}" for index in range(workers)]
+    click.echo(f"Starting {workers} prediction workers; point the web app at them with")
+    click.echo(f"PREDICTION_WORKERS={','.join(nodes)}")
+    for process in start_local_workers(app, db, models, nodes, authkey):
+        process.join()
+
 with app.app_context():
-    db.create_all()
+    upgrade_database(db)
     seed_database()
+    publish_reference_data()
+    congestion_store.refresh()
+    wait_profile_store.refresh()
+    predictor.set_wait_time_profiles(wait_profile_store.profiles)
 
 if __name__ == "__main__":
+    # Only the reloader's serving child starts runners; they exit when it is replaced.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        job_queue.start_workers()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,200 @@
+import importlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import DateTime, Float, Integer, String, column, create_engine, func, select, table
+
+DEFAULT_PREDICTOR = "demurrage_model:DemurragePredictor"
+GROUPINGS = ("port", "cargo_type", "vessel_type")
+
+# Running sums kept per group; merged across chunks and turned into metrics at the end.
+SUM_FIELDS = ("count", "abs_error", "error", "cost_count", "cost_abs_error", "cost_error", "covered",
+              "interval_width", "stored_count", "stored_abs_error")
+
+# A detached description of the columns replayed, so worker processes need no Flask app or models.
+_voyages = table(
+    "voyages",
+    column("id", Integer),
+    column("vessel_id", Integer),
+    column("origin_port_id", Integer),
+    column("destination_port_id", Integer),
+    column("cargo_type_id", Integer),
+    column("cargo_volume", Float),
+    column("eta", DateTime),
+    column("predicted_delay_hours", Float),
+    column("actual_delay_hours", Float),
+    column("actual_demurrage_cost", Float),
+    column("status", String),
+)
+
+_worker = {}
+
+def load_predictor(spec):
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"Predictor must be given as module:Class, got {spec!r}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+def load_reference_data(engine, models):
+    def rows(name):
+        model_table = models[name].__table__
+        with engine.connect() as connection:
+            return {r.id: SimpleNamespace(**r._mapping) for r in connection.execute(select(model_table))}
+    
+    vessel_types = rows("VesselType")
+    vessels = rows("Vessel")
+    for vessel in vessels.values():
+        vessel.vessel_type = vessel_types.get(vessel.vessel_type_id)
+    return {"ports": rows("Port"), "vessels": vessels, "cargo_types": rows("CargoType")}
+
+def _init_worker(database_url, predictor_spec, reference):
+    from ontology import MaritimeOntology
+    
+    _worker["engine"] = create_engine(database_url)
+    _worker["predictor"] = load_predictor(predictor_spec)
+    _worker["ontology"] = MaritimeOntology()
+    _worker.update(reference)
+
+def _delay_interval(prediction):
+    if hasattr(prediction, "delay_min"):
+        return prediction.delay_min, prediction.delay_max
+    return prediction["delay_range"]["min"], prediction["delay_range"]["max"]
+
+def _group_keys(vessel, voyage):
+    return (
+        ("overall", None),
+        ("port", voyage.destination_port_id),
+        ("cargo_type", voyage.cargo_type_id),
+        ("vessel_type", vessel.vessel_type_id if vessel else None),
+    )
+
+def _completed_voyages_query(low, high, since=None, until=None):
+    query = select(_voyages).where(
+        _voyages.c.id.between(low, high),
+        _voyages.c.status == "completed",
+        _voyages.c.actual_delay_hours.isnot(None),
+        _voyages.c.eta.isnot(None),
+    )
+    if since is not None:
+        query = query.where(_voyages.c.eta >= since)
+    if until is not None:
+        query = query.where(_voyages.c.eta < until)
+    return query
+
+def _run_chunk(task):
+    low, high, since, until = task
+    predictor, ontology = _worker["predictor"], _worker["ontology"]
+    ports, vessels, cargo_types = _worker["ports"], _worker["vessels"], _worker["cargo_types"]
+    
+    with _worker["engine"].connect() as connection:
+        voyages = connection.execute(_completed_voyages_query(low, high, since, until)).all()
+    
+    sums = {}
+    for voyage in voyages:
+        vessel = vessels.get(voyage.vessel_id)
+        prediction = predictor.predict_demurrage(
+            vessel=vessel,
+            origin_port=ports.get(voyage.origin_port_id),
+            dest_port=ports.get(voyage.destination_port_id),
+            cargo_type=cargo_types.get(voyage.cargo_type_id),
+            cargo_volume=voyage.cargo_volume or 0,
+            eta=voyage.eta,
+            ontology=ontology
+        )
+        delay_min, delay_max = _delay_interval(prediction)
+        error = prediction["predicted_delay_hours"] - voyage.actual_delay_hours
+        # Voyages without a recorded actual cost only count towards the delay metrics.
+        cost_known = voyage.actual_demurrage_cost is not None
+        cost_error = prediction["predicted_cost"] - voyage.actual_demurrage_cost if cost_known else 0.0
+        stored = voyage.predicted_delay_hours
+        row = (1, abs(error), error, cost_known, abs(cost_error), cost_error,
+               delay_min <= voyage.actual_delay_hours <= delay_max, delay_max - delay_min,
+               stored is not None, abs(stored - voyage.actual_delay_hours) if stored is not None else 0.0)
+        
+        for key in _group_keys(vessel, voyage):
+            totals = sums.get(key)
+            if totals is None:
+                totals = sums[key] = np.zeros(len(SUM_FIELDS))
+            totals += row
+    return sums
+
+def _id_ranges(engine, chunk_size):
+    with engine.connect() as connection:
+        low, high = connection.execute(
+            select(func.min(_voyages.c.id), func.max(_voyages.c.id)).where(_voyages.c.status == "completed")
+        ).one()
+    if low is None:
+        return []
+    return [(start, min(start + chunk_size - 1, high)) for start in range(low, high + 1, chunk_size)]
+
+def _metrics(totals, nominal_coverage=None):
+    values = dict(zip(SUM_FIELDS, totals))
+    count = values["count"]
+    cost_count = values["cost_count"]
+    return {
+        "voyages": int(count),
+        "delay_mae_hours": round(values["abs_error"] / count, 2),
+        "delay_bias_hours": round(values["error"] / count, 2),
+        "cost_voyages": int(cost_count),
+        "cost_mae": round(values["cost_abs_error"] / cost_count, 2) if cost_count else None,
+        "cost_bias": round(values["cost_error"] / cost_count, 2) if cost_count else None,
+        "interval_coverage": {"nominal": nominal_coverage, "observed": round(values["covered"] / count, 4)},
+        "mean_interval_width_hours": round(values["interval_width"] / count, 2),
+        "stored_delay_mae_hours": (round(values["stored_abs_error"] / values["stored_count"], 2)
+                                   if values["stored_count"] else None),
+    }
+
+def run_backtest(engine, models, predictor_spec=DEFAULT_PREDICTOR, workers=None, chunk_size=20000,
+                 since=None, until=None, progress=None):
+    started = time.perf_counter()
+    reference = load_reference_data(engine, models)
+    nominal_coverage = getattr(load_predictor(predictor_spec), "interval_confidence", None)
+    database_url = engine.url.render_as_string(hide_password=False)
+    tasks = [(low, high, since, until) for low, high in _id_ranges(engine, chunk_size)]
+    
+    sums = {}
+    def merge(partial):
+        for key, totals in partial.items():
+            if key in sums:
+                sums[key] += totals
+            else:
+                sums[key] = totals
+    
+    workers = workers if workers is not None else min(len(tasks), os.cpu_count() or 1)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(database_url, predictor_spec, reference)) as executor:
+            for done, partial in enumerate(executor.map(_run_chunk, tasks), start=1):
+                merge(partial)
+                if progress is not None:
+                    progress(done, len(tasks))
+    else:
+        _init_worker(database_url, predictor_spec, reference)
+        for done, task in enumerate(tasks, start=1):
+            merge(_run_chunk(task))
+            if progress is not None:
+                progress(done, len(tasks))
+    
+    names = {
+        "port": {pid: p.name for pid, p in reference["ports"].items()},
+        "cargo_type": {cid: c.name for cid, c in reference["cargo_types"].items()},
+        "vessel_type": {v.vessel_type_id: v.vessel_type.name for v in reference["vessels"].values() if v.vessel_type},
+    }
+    
+    report = {
+        "predictor": predictor_spec,
+        "chunks": len(tasks),
+        "workers": workers,
+        "elapsed_seconds": round(time.perf_counter() - started, 2),
+        "overall": _metrics(sums[("overall", None)], nominal_coverage) if ("overall", None) in sums else None,
+    }
+    for grouping in GROUPINGS:
+        groups = [(group_id, totals) for (kind, group_id), totals in sums.items() if kind == grouping]
+        report[f"by_{grouping}"] = sorted(
+            ({"id": group_id, "name": names[grouping].get(group_id), **_metrics(totals, nominal_coverage)}
+             for group_id, totals in groups),
+            key=lambda entry: entry["voyages"], reverse=True
+        )
+    return report
@@ -0,0 +1,271 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from sqlalchemy import delete, func, insert, or_, select
+
+HOURS_PER_WEEK = 168
+WINDOWS = (7, 30)
+
+# Per-day ring columns.
+WAIT_COUNT, WAIT_SUM, WAITED_COUNT, LEVEL_COUNT, LEVEL_SUM = range(5)
+
+def hour_of_week(moment):
+    return moment.weekday() * 24 + moment.hour
+
+class PortCongestionSeries:
+    def __init__(self, days=30, weeks=8, wait_threshold_hours=2.0):
+        self.days = days
+        self.weeks = weeks
+        self.wait_threshold_hours = wait_threshold_hours
+        self.day_ids = np.full(days, -1, dtype=np.int64)
+        self.day_stats = np.zeros((days, 5))
+        self.week_ids = np.full(weeks, -1, dtype=np.int64)
+        self.hourly_counts = np.zeros((weeks, HOURS_PER_WEEK))
+        self.hourly_waits = np.zeros((weeks, HOURS_PER_WEEK))
+        self._summary_day = None
+        self._summary = None
+    
+    def add(self, observed_at, wait_hours=None, congestion_level=None):
+        self._apply(observed_at, wait_hours, congestion_level, 1)
+    
+    def remove(self, observed_at, wait_hours=None, congestion_level=None):
+        # Takes back a sample added earlier; one whose day or week has rolled out is already gone.
+        self._apply(observed_at, wait_hours, congestion_level, -1)
+    
+    def _apply(self, observed_at, wait_hours, congestion_level, sign):
+        day = observed_at.toordinal()
+        slot = day % self.days
+        if sign > 0 and self.day_ids[slot] < day:
+            self.day_ids[slot] = day
+            self.day_stats[slot] = 0
+        if self.day_ids[slot] == day:
+            stats = self.day_stats[slot]
+            if wait_hours is not None:
+                stats[WAIT_COUNT] += sign
+                stats[WAIT_SUM] += sign * wait_hours
+                stats[WAITED_COUNT] += sign * (wait_hours > self.wait_threshold_hours)
+            if congestion_level is not None:
+                stats[LEVEL_COUNT] += sign
+                stats[LEVEL_SUM] += sign * congestion_level
+        
+        if wait_hours is not None:
+            # Ordinal day 1 is a Monday, so weeks roll over on Monday 00:00.
+            week = (day - 1) // 7
+            week_slot = week % self.weeks
+            if sign > 0 and self.week_ids[week_slot] < week:
+                self.week_ids[week_slot] = week
+                self.hourly_counts[week_slot] = 0
+                self.hourly_waits[week_slot] = 0
+            if self.week_ids[week_slot] == week:
+                self.hourly_counts[week_slot, hour_of_week(observed_at)] += sign
+                self.hourly_waits[week_slot, hour_of_week(observed_at)] += sign * wait_hours
+        self._summary_day = None
+    
+    def summary(self, today):
+        day = today.toordinal()
+        if self._summary_day == day:
+            return self._summary
+        
+        summary = {}
+        for window in WINDOWS:
+            mask = (self.day_ids > day - window) & (self.day_ids <= day)
+            totals = self.day_stats[mask].sum(axis=0)
+            summary[window] = {
+                "wait_observations": int(totals[WAIT_COUNT]),
+                "mean_wait_hours": totals[WAIT_SUM] / totals[WAIT_COUNT] if totals[WAIT_COUNT] else None,
+                "prob_wait": totals[WAITED_COUNT] / totals[WAIT_COUNT] if totals[WAIT_COUNT] else None,
+                "level_observations": int(totals[LEVEL_COUNT]),
+                "mean_congestion_level": totals[LEVEL_SUM] / totals[LEVEL_COUNT] if totals[LEVEL_COUNT] else None,
+            }
+        
+        current_week = (day - 1) // 7
+        live_weeks = (self.week_ids > current_week - self.weeks) & (self.week_ids <= current_week)
+        counts = self.hourly_counts[live_weeks].sum(axis=0)
+        waits = self.hourly_waits[live_weeks].sum(axis=0)
+        summary["hourly_counts"] = counts
+        summary["hourly_mean_wait"] = np.divide(waits, counts, out=np.full(HOURS_PER_WEEK, np.nan), where=counts > 0)
+        summary["overall_mean_wait"] = waits.sum() / counts.sum() if counts.sum() else None
+        
+        self._summary, self._summary_day = summary, day
+        return summary
+
+class CongestionStore:
+    def __init__(self, db, models, days=30, weeks=8, wait_threshold_hours=2.0, min_observations=5,
+                 min_hourly_observations=3, refresh_interval=5.0, port_ids=None, overlap_seconds=300):
+        self.db = db
+        self.Observation = models['PortCongestionObservation']
+        self.Voyage = models['Voyage']
+        self.days = days
+        self.weeks = weeks
+        self.wait_threshold_hours = wait_threshold_hours
+        self.min_observations = min_observations
+        self.min_hourly_observations = min_hourly_observations
+        self.refresh_interval = refresh_interval
+        self.overlap_seconds = overlap_seconds
+        self.port_ids = None if port_ids is None else set(port_ids)
+        self.series = {}
+        self.voyage_samples = {}
+        self._last_id = 0
+        self._recent_ids = {}
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+    
+    def _series_for(self, port_id):
+        series = self.series.get(port_id)
+        if series is None:
+            series = self.series[port_id] = PortCongestionSeries(self.days, self.weeks, self.wait_threshold_hours)
+        return series
+    
+    def refresh(self):
+        table = self.Observation.__table__
+        now = datetime.utcnow()
+        horizon = now - timedelta(days=max(self.days, self.weeks * 7))
+        # Ids are taken at insert but become visible at commit, so a slow writer can commit a row below
+        # _last_id. Rows recorded within the overlap are read again and skipped by id once applied.
+        overlap = now - timedelta(seconds=self.overlap_seconds)
+        query = select(table.c.id, table.c.port_id, table.c.voyage_id, table.c.observed_at, table.c.wait_hours,
+                       table.c.congestion_level, table.c.recorded_at)\
+            .where(or_(table.c.id > self._last_id, table.c.recorded_at >= overlap), table.c.observed_at >= horizon)\
+            .order_by(table.c.id)
+        if self.port_ids is not None:
+            query = query.where(table.c.port_id.in_(self.port_ids))
+        applied = 0
+        with self._lock:
+            with self.db.engine.connect() as connection:
+                rows = connection.execute(query).all()
+            for row_id, port_id, voyage_id, observed_at, wait_hours, congestion_level, recorded_at in rows:
+                if row_id in self._recent_ids:
+                    continue
+                if voyage_id is not None:
+                    # record() replaces a voyage's observation with a new row. Every process sees that
+                    # row here, and must drop the sample it took from the old one.
+                    previous = self.voyage_samples.get(voyage_id)
+                    if previous is not None:
+                        self.series[previous[0]].remove(*previous[1:])
+                    self.voyage_samples[voyage_id] = (port_id, observed_at, wait_hours, congestion_level)
+                self._series_for(port_id).add(observed_at, wait_hours, congestion_level)
+                self._recent_ids[row_id] = recorded_at
+                self._last_id = max(self._last_id, row_id)
+                applied += 1
+            self._recent_ids = {row_id: recorded_at for row_id, recorded_at in self._recent_ids.items()
+                                if recorded_at is not None and recorded_at >= overlap}
+            if applied:
+                self.voyage_samples = {voyage_id: sample for voyage_id, sample in self.voyage_samples.items()
+                                       if sample[1] >= horizon}
+            self._last_refresh = time.monotonic()
+        return applied
+    
+    def refresh_if_stale(self):
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return 0
+        return self.refresh()
+    
+    def record(self, observations, source="snapshot"):
+        rows = []
+        for observation in observations:
+            observed_at = observation.get("observed_at") or datetime.utcnow()
+            if not isinstance(observed_at, datetime):
+                observed_at = datetime.fromisoformat(str(observed_at).replace("Z", "+00:00"))
+            if observed_at.tzinfo is not None:
+                # Observation times are naive UTC; an offset is converted, not just stripped.
+                observed_at = observed_at.astimezone(timezone.utc).replace(tzinfo=None)
+            wait_hours = observation.get("wait_hours")
+            congestion_level = observation.get("congestion_level")
+            if wait_hours is None and congestion_level is None:
+                raise ValueError("Each observation needs wait_hours or congestion_level")
+            if congestion_level is not None and not 0 <= float(congestion_level) <= 1:
+                raise ValueError("congestion_level must be between 0 and 1")
+            if wait_hours is not None and float(wait_hours) < 0:
+                raise ValueError("wait_hours must not be negative")
+            rows.append({
+                "port_id": int(observation["port_id"]),
+                "voyage_id": observation.get("voyage_id"),
+                "observed_at": observed_at,
+                "wait_hours": None if wait_hours is None else float(wait_hours),
+                "congestion_level": None if congestion_level is None else float(congestion_level),
+                "source": observation.get("source", source),
+                "recorded_at": datetime.utcnow(),
+            })
+        if rows:
+            table = self.Observation.__table__
+            voyage_ids = [row["voyage_id"] for row in rows if row["voyage_id"] is not None]
+            with self.db.engine.begin() as connection:
+                last_id = connection.execute(select(func.max(table.c.id))).scalar() or 0
+                connection.execute(insert(table), rows)
+                if voyage_ids:
+                    # A corrected arrival or berthing time replaces that voyage's earlier observation.
+                    # Deleted after the insert so SQLite cannot hand the freed top id to the new row,
+                    # which refresh() would then never read.
+                    connection.execute(delete(table).where(table.c.voyage_id.in_(voyage_ids), table.c.id <= last_id))
+            self.refresh()
+        return len(rows)
+    
+    def voyage_observations(self, voyages):
+        return [
+            {"port_id": v.destination_port_id, "voyage_id": v.id, "observed_at": v.ata,
+             "wait_hours": max(0.0, (v.berthing_time - v.ata).total_seconds() / 3600), "source": "voyage"}
+            for v in voyages
+            if v.ata is not None and v.berthing_time is not None and v.destination_port_id is not None
+        ]
+    
+    def backfill_from_voyages(self, since=None, batch_size=10000):
+        voyages = self.Voyage.__table__
+        observations = self.Observation.__table__
+        already_observed = select(observations.c.voyage_id).where(observations.c.voyage_id.isnot(None))
+        
+        recorded = 0
+        last_id = 0
+        while True:
+            query = select(voyages.c.id, voyages.c.destination_port_id, voyages.c.ata, voyages.c.berthing_time)\
+                .where(voyages.c.id > last_id, voyages.c.ata.isnot(None), voyages.c.berthing_time.isnot(None),
+                       voyages.c.id.notin_(already_observed))\
+                .order_by(voyages.c.id).limit(batch_size)
+            if since is not None:
+                query = query.where(voyages.c.ata >= since)
+            with self.db.engine.connect() as connection:
+                rows = connection.execute(query).all()
+            if not rows:
+                break
+            recorded += self.record(self.voyage_observations(rows), source="voyage")
+            last_id = rows[-1].id
+        return recorded
+    
+    def congestion(self, port_id, moment=None):
+        series = self.series.get(port_id)
+        if series is None:
+            return None
+        summary = series.summary(datetime.utcnow())
+        
+        for window in WINDOWS:
+            stats = summary[window]
+            if stats["wait_observations"] + stats["level_observations"] >= self.min_observations:
+                break
+        else:
+            return None
+        
+        levels = [value for value in (stats["mean_congestion_level"], stats["prob_wait"]) if value is not None]
+        hourly_factor = None
+        if moment is not None and summary["overall_mean_wait"]:
+            bucket = hour_of_week(moment)
+            if summary["hourly_counts"][bucket] >= self.min_hourly_observations:
+                hourly_factor = min(2.0, max(0.5, summary["hourly_mean_wait"][bucket] / summary["overall_mean_wait"]))
+        return {"level": sum(levels) / len(levels), "window_days": window, "hourly_factor": hourly_factor}
+    
+    def port_summary(self, port_id):
+        series = self.series.get(port_id)
+        if series is None:
+            return {"port_id": port_id, "windows": {}, "hour_of_week": []}
+        summary = series.summary(datetime.utcnow())
+        return {
+            "port_id": port_id,
+            "windows": {f"{window}d": {key: round(value, 4) if isinstance(value, float) else value
+                                       for key, value in summary[window].items()}
+                        for window in WINDOWS},
+            "hour_of_week": [
+                {"hour_of_week": bucket, "observations": int(count), "mean_wait_hours": round(float(wait), 2)}
+                for bucket, (count, wait) in enumerate(zip(summary["hourly_counts"], summary["hourly_mean_wait"]))
+                if count
+            ],
+            "current": self.congestion(port_id, datetime.utcnow()),
+        }
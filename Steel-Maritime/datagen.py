@@ -0,0 +1,99 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+
+DELAY_CAUSES = [
+    ("Port Congestion", "congestion"),
+    ("Berth Unavailable", "berth"),
+    ("Weather Delay", "weather"),
+    ("Cargo Operations Delay", "operations"),
+    ("Documentation Issues", "documentation"),
+    ("Draft Restrictions", "draft"),
+    ("Equipment Breakdown", "equipment"),
+]
+
+def generate_scaled_dataset(db, models, num_voyages=200000, batch_size=10000, seed=7):
+    Vessel = models['Vessel']
+    Port = models['Port']
+    CargoType = models['CargoType']
+    Voyage = models['Voyage']
+    DemurrageRecord = models['DemurrageRecord']
+    
+    rng = random.Random(seed)
+    vessels = [(v.id, v.demurrage_rate or 25000) for v in Vessel.query.all()]
+    port_ids = [p.id for p in Port.query.all()]
+    cargo_ids = [c.id for c in CargoType.query.all()]
+    if not vessels or len(port_ids) < 2:
+        raise RuntimeError("Reference data missing; seed the database before scaling it")
+    
+    next_id = (db.session.query(db.func.max(Voyage.id)).scalar() or 0) + 1
+    now = datetime.utcnow()
+    inserted = 0
+    
+    while inserted < num_voyages:
+        voyage_rows = []
+        record_rows = []
+        for voyage_id in range(next_id, next_id + min(batch_size, num_voyages - inserted)):
+            vessel_id, rate = rng.choice(vessels)
+            origin_id, dest_id = rng.sample(port_ids, 2)
+            eta = now - timedelta(days=rng.uniform(-30, 720))
+            completed = eta < now
+            delay = rng.uniform(2, 72)
+            row = {
+                "id": voyage_id,
+                "vessel_id": vessel_id,
+                "origin_port_id": origin_id,
+                "destination_port_id": dest_id,
+                "cargo_type_id": rng.choice(cargo_ids) if cargo_ids else None,
+                "cargo_volume": rng.uniform(10000, 150000),
+                "eta": eta,
+                "ata": None,
+                "berthing_time": None,
+                "departure_time": None,
+                "predicted_delay_hours": delay * rng.uniform(0.7, 1.3),
+                "predicted_demurrage_cost": (delay / 24) * rate * rng.uniform(0.7, 1.3),
+                "actual_delay_hours": None,
+                "actual_demurrage_cost": None,
+                "status": "planned",
+                "created_at": eta - timedelta(days=rng.randint(7, 30)),
+            }
+            if completed:
+                departure = eta + timedelta(hours=delay + rng.uniform(24, 96))
+                row.update({
+                    "ata": eta + timedelta(hours=rng.uniform(-2, 6)),
+                    "berthing_time": eta + timedelta(hours=delay),
+                    "departure_time": departure,
+                    "actual_delay_hours": delay,
+                    "actual_demurrage_cost": (delay / 24) * rate,
+                    "status": "completed",
+                })
+                cause, category = rng.choice(DELAY_CAUSES)
+                record_rows.append({
+                    "voyage_id": voyage_id,
+                    "delay_hours": delay,
+                    "cost": (delay / 24) * rate,
+                    "cause": cause,
+                    "cause_category": category,
+                    "recorded_at": departure,
+                    "notes": None,
+                })
+            voyage_rows.append(row)
+        
+        db.session.execute(insert(Voyage.__table__), voyage_rows)
+        if record_rows:
+            db.session.execute(insert(DemurrageRecord.__table__), record_rows)
+        db.session.commit()
+        
+        inserted += len(voyage_rows)
+        next_id += len(voyage_rows)
+    
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(text("SELECT setval(pg_get_serial_sequence('voyages', 'id'), (SELECT max(id) FROM voyages))"))
+        db.session.commit()
+    analyze_tables(db)
+    return inserted
+
+def analyze_tables(db):
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text("ANALYZE"))
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+REPLICA_BIND = "replica"
+
+POSTGRES_LAG_QUERY = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+def _pool_options(prefix):
+    options = {"pool_recycle": 300, "pool_pre_ping": True}
+    for option, cast in (("pool_size", int), ("max_overflow", int), ("pool_timeout", float)):
+        value = os.environ.get(f"{prefix}_{option.upper()}")
+        if value is not None:
+            options[option] = cast(value)
+    return options
+
+def configure_engines(app):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _pool_options("DB")
+    replica_url = os.environ.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        app.config["SQLALCHEMY_BINDS"] = {
+            REPLICA_BIND: {"url": replica_url, **_pool_options("DB_REPLICA")},
+        }
+    app.config.setdefault("REPLICA_MAX_LAG_SECONDS", float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 30)))
+    app.config.setdefault("REPLICA_CHECK_INTERVAL", float(os.environ.get("REPLICA_CHECK_INTERVAL", 5)))
+
+class ReplicaMonitor:
+    def __init__(self, max_lag_seconds=30, check_interval=5, lag_probe=None):
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.lag_probe = lag_probe or self._probe_lag
+        self.lag_seconds = None
+        self.healthy = False
+        self._checked_at = None
+        self._lock = threading.Lock()
+    
+    def _probe_lag(self, engine):
+        with engine.connect() as connection:
+            if engine.dialect.name != "postgresql":
+                connection.execute(text("SELECT 1"))
+                return 0.0
+            return float(connection.execute(text(POSTGRES_LAG_QUERY)).scalar() or 0)
+    
+    def usable(self, engine):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self.healthy
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                try:
+                    self.lag_seconds = self.lag_probe(engine)
+                    self.healthy = self.lag_seconds <= self.max_lag_seconds
+                except Exception:
+                    self.lag_seconds = None
+                    self.healthy = False
+                self._checked_at = now
+        return self.healthy
+
+def _replica_engine(db):
+    if not has_request_context() or not g.get("db_read_only"):
+        return None
+    engine = db.engines.get(REPLICA_BIND)
+    if engine is None:
+        return None
+    monitor = current_app.extensions.get("replica_monitor")
+    if monitor is not None and not monitor.usable(engine):
+        return None
+    return engine
+
+def read_engine(db):
+    return _replica_engine(db) or db.engine
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            engine = _replica_engine(self._db)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def init_replica_monitor(app, monitor=None):
+    monitor = monitor or ReplicaMonitor(
+        max_lag_seconds=app.config["REPLICA_MAX_LAG_SECONDS"],
+        check_interval=app.config["REPLICA_CHECK_INTERVAL"],
+    )
+    app.extensions["replica_monitor"] = monitor
+    return monitor
+
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
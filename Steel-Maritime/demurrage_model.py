@@ -2,6 +2,19 @@ import numpy as np
 from scipy import stats
 from datetime import datetime, timedelta
 import random
+from prediction_result import (
+    PredictionResult, EMPTY_PREDICTION, EARLY_ARRIVAL, PRE_BOOK_BERTH, SPECIALIZED_EQUIPMENT,
+    WEATHER_BUFFER, ALTERNATIVE_PORTS, SUITABLE_VESSEL, EARLY_DOCUMENTATION
+)
+
+PRIORITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+SCORING_WEIGHTS = ("base_delay_hours", "congestion_weight", "cargo_complexity_weight", "weather_weight",
+                   "port_efficiency_weight", "vessel_compatibility_weight")
+
+SCORING_INPUTS = ("congestion_level", "congestion_multiplier", "cargo_handling", "weather_factor",
+                  "weather_multiplier", "cargo_handling_rate", "num_berths", "vessel_compatibility",
+                  "demurrage_rate")
 
 class DemurragePredictor:
     def __init__(self):
@@ -11,6 +24,20 @@ class DemurragePredictor:
         self.weather_weight = 0.15
         self.port_efficiency_weight = 0.2
         self.vessel_compatibility_weight = 0.15
+        self.interval_confidence = 0.95
+        self.wait_time_profiles = {}
+        self.congestion_store = None
+        self.reference_store = None
+        self._recommendation_sets = {}
+    
+    def set_wait_time_profiles(self, profiles):
+        self.wait_time_profiles = {profile["port_id"]: profile for profile in profiles}
+    
+    def set_congestion_store(self, store):
+        self.congestion_store = store
+    
+    def set_reference_store(self, store):
+        self.reference_store = store
     
     def predict_demurrage(self, vessel, origin_port, dest_port, cargo_type, cargo_volume, eta, ontology):
         if not all([vessel, dest_port]):
@@ -37,7 +64,7 @@ class DemurragePredictor:
         predicted_delay_hours = self.base_delay_hours * (1 + combined_delay_factor * 3)
         
         delay_std = predicted_delay_hours * 0.3
-        confidence_interval = stats.norm.interval(0.95, loc=predicted_delay_hours, scale=delay_std)
+        confidence_interval = stats.norm.interval(self.interval_confidence, loc=predicted_delay_hours, scale=delay_std)
         
         daily_rate = vessel.demurrage_rate if vessel.demurrage_rate else 25000
         predicted_cost = (predicted_delay_hours / 24) * daily_rate
@@ -51,65 +78,68 @@ class DemurragePredictor:
             port_efficiency_score, vessel_compatibility_score, eta, dest_port
         )
         
-        return {
-            "predicted_delay_hours": round(predicted_delay_hours, 1),
-            "delay_range": {
-                "min": round(max(0, confidence_interval[0]), 1),
-                "max": round(confidence_interval[1], 1)
-            },
-            "predicted_cost": round(predicted_cost, 2),
-            "cost_range": {
-                "min": round((max(0, confidence_interval[0]) / 24) * daily_rate, 2),
-                "max": round((confidence_interval[1] / 24) * daily_rate, 2)
-            },
-            "risk_level": risk_level,
-            "risk_factors": {
-                "port_congestion": round(port_congestion_score * 100, 1),
-                "cargo_handling": round(cargo_handling_score * 100, 1),
-                "weather": round(weather_score * 100, 1),
-                "port_efficiency": round((1 - port_efficiency_score) * 100, 1),
-                "vessel_compatibility": round((1 - vessel_compatibility_score) * 100, 1)
-            },
-            "estimated_loading_time_hours": round(loading_time, 1),
-            "recommendations": recommendations,
-            "optimal_arrival_window": self._calculate_optimal_arrival(eta, dest_port),
-            "potential_savings": round(predicted_cost * 0.3, 2)
-        }
+        optimal_arrival = self._calculate_optimal_arrival(eta, dest_port)
+        
+        return PredictionResult(
+            predicted_delay_hours=round(predicted_delay_hours, 1),
+            delay_min=round(max(0, confidence_interval[0]), 1),
+            delay_max=round(confidence_interval[1], 1),
+            predicted_cost=round(predicted_cost, 2),
+            cost_min=round((max(0, confidence_interval[0]) / 24) * daily_rate, 2),
+            cost_max=round((confidence_interval[1] / 24) * daily_rate, 2),
+            risk_level=risk_level,
+            risk_factors=(
+                round(port_congestion_score * 100, 1),
+                round(cargo_handling_score * 100, 1),
+                round(weather_score * 100, 1),
+                round((1 - port_efficiency_score) * 100, 1),
+                round((1 - vessel_compatibility_score) * 100, 1)
+            ),
+            estimated_loading_time_hours=round(loading_time, 1),
+            recommendations=recommendations,
+            arrival_start=optimal_arrival,
+            arrival_end=optimal_arrival + timedelta(hours=4) if optimal_arrival else None,
+            potential_savings=round(predicted_cost * 0.3, 2)
+        )
     
     def _empty_prediction(self):
-        return {
-            "predicted_delay_hours": 0,
-            "delay_range": {"min": 0, "max": 0},
-            "predicted_cost": 0,
-            "cost_range": {"min": 0, "max": 0},
-            "risk_level": "unknown",
-            "risk_factors": {},
-            "estimated_loading_time_hours": 0,
-            "recommendations": [],
-            "optimal_arrival_window": None,
-            "potential_savings": 0
-        }
+        return EMPTY_PREDICTION
     
     def _calculate_congestion_score(self, port, eta):
+        base_congestion, multiplier = self._congestion_inputs(port, eta)
+        return min(1.0, base_congestion * multiplier)
+    
+    def _congestion_inputs(self, port, eta):
         base_congestion = port.avg_congestion_level if port.avg_congestion_level else 0.5
         
+        live = self.congestion_store.congestion(port.id, eta) if self.congestion_store else None
+        profile = self.wait_time_profiles.get(port.id)
+        if live:
+            base_congestion = live["level"]
+        elif profile:
+            base_congestion = profile["prob_wait"]
+        
+        multiplier = 1.0
         if eta:
-            day_of_week = eta.weekday()
-            hour = eta.hour
-            
-            if day_of_week < 5:
-                base_congestion *= 1.1
-            
-            if 8 <= hour <= 18:
-                base_congestion *= 1.15
+            if live and live["hourly_factor"]:
+                multiplier *= live["hourly_factor"]
             else:
-                base_congestion *= 0.9
+                day_of_week = eta.weekday()
+                hour = eta.hour
+                
+                if day_of_week < 5:
+                    multiplier *= 1.1
+                
+                if 8 <= hour <= 18:
+                    multiplier *= 1.15
+                else:
+                    multiplier *= 0.9
             
             month = eta.month
             if month in [3, 4, 9, 10]:
-                base_congestion *= 1.2
+                multiplier *= 1.2
         
-        return min(1.0, base_congestion)
+        return base_congestion, multiplier
     
     def _calculate_cargo_handling_score(self, cargo_type, cargo_volume, ontology):
         if not cargo_type:
@@ -132,20 +162,25 @@ class DemurragePredictor:
         return min(1.0, (complexity * volume_factor - 0.5) / 2)
     
     def _calculate_weather_score(self, port, eta):
+        base_weather, multiplier = self._weather_inputs(port, eta)
+        return min(1.0, (base_weather * multiplier - 0.5) / 1.5)
+    
+    def _weather_inputs(self, port, eta):
         base_weather = port.weather_delay_factor if port.weather_delay_factor else 1.0
         
+        multiplier = 1.0
         if eta:
             month = eta.month
             if month in [12, 1, 2]:
-                base_weather *= 1.4
+                multiplier *= 1.4
             elif month in [6, 7, 8]:
-                base_weather *= 0.8
+                multiplier *= 0.8
         
         lat = port.latitude if port.latitude else 0
         if abs(lat) > 45:
-            base_weather *= 1.2
+            multiplier *= 1.2
         
-        return min(1.0, (base_weather - 0.5) / 1.5)
+        return base_weather, multiplier
     
     def _calculate_port_efficiency_score(self, port, cargo_type, ontology):
         if not port:
@@ -169,10 +204,26 @@ class DemurragePredictor:
         
         return min(1.0, base_efficiency)
     
+    def _port_efficiency_arrays(self, cargo_handling_rate, num_berths):
+        efficiency = np.select(
+            [cargo_handling_rate > 8000, cargo_handling_rate > 5000, cargo_handling_rate != 0],
+            [0.9, 0.75, 0.6],
+            0.7
+        )
+        efficiency = efficiency * np.where(num_berths > 10, 1.1, np.where((num_berths != 0) & (num_berths < 3), 0.85, 1.0))
+        return np.minimum(1.0, efficiency)
+    
     def _calculate_vessel_compatibility(self, vessel, cargo_type, ontology):
         if not vessel or not cargo_type:
             return 0.7
         
+        if self.reference_store is not None:
+            # The published matrix is keyed by ids, which also spares a lazy load of vessel.vessel_type.
+            compiled = self.reference_store.compatibility(getattr(vessel, "vessel_type_id", None),
+                                                          getattr(cargo_type, "id", None))
+            if compiled is not None:
+                return compiled
+        
         if vessel.vessel_type:
             vessel_type_name = vessel.vessel_type.name.lower()
             cargo_category = cargo_type.category.lower() if cargo_type.category else ""
@@ -192,6 +243,65 @@ class DemurragePredictor:
         
         return 0.7
     
+    def scoring_inputs(self, voyages, ports, vessels, cargo_types, ontology):
+        columns = {name: [] for name in SCORING_INPUTS}
+        compatibility = {}
+        for voyage in voyages:
+            port = ports[voyage.destination_port_id]
+            vessel = vessels[voyage.vessel_id]
+            cargo_type = cargo_types.get(voyage.cargo_type_id)
+            congestion_level, congestion_multiplier = self._congestion_inputs(port, voyage.eta)
+            weather_factor, weather_multiplier = self._weather_inputs(port, voyage.eta)
+            pair = (voyage.vessel_id, voyage.cargo_type_id)
+            if pair not in compatibility:
+                compatibility[pair] = self._calculate_vessel_compatibility(vessel, cargo_type, ontology)
+            
+            columns["congestion_level"].append(congestion_level)
+            columns["congestion_multiplier"].append(congestion_multiplier)
+            columns["cargo_handling"].append(
+                self._calculate_cargo_handling_score(cargo_type, voyage.cargo_volume or 0, ontology))
+            columns["weather_factor"].append(weather_factor)
+            columns["weather_multiplier"].append(weather_multiplier)
+            columns["cargo_handling_rate"].append(port.cargo_handling_rate or 0)
+            columns["num_berths"].append(port.num_berths or 0)
+            columns["vessel_compatibility"].append(compatibility[pair])
+            columns["demurrage_rate"].append(vessel.demurrage_rate if vessel.demurrage_rate else 25000)
+        return {name: np.array(values, dtype=float) for name, values in columns.items()}
+    
+    def score_arrays(self, inputs, weights=None):
+        weights = {name: getattr(self, name) for name in SCORING_WEIGHTS} | (weights or {})
+        
+        # Mirrors predict_demurrage for every element at once; inputs and weights broadcast,
+        # so a (scenarios, voyages) stack is scored in one pass.
+        scores = {
+            "congestion": np.minimum(1.0, inputs["congestion_level"] * inputs["congestion_multiplier"]),
+            "cargo_handling": inputs["cargo_handling"],
+            "weather": np.minimum(1.0, (inputs["weather_factor"] * inputs["weather_multiplier"] - 0.5) / 1.5),
+            "port_efficiency": self._port_efficiency_arrays(inputs["cargo_handling_rate"], inputs["num_berths"]),
+            "vessel_compatibility": inputs["vessel_compatibility"],
+        }
+        contributions = {
+            "congestion": weights["congestion_weight"] * scores["congestion"],
+            "cargo_handling": weights["cargo_complexity_weight"] * scores["cargo_handling"],
+            "weather": weights["weather_weight"] * scores["weather"],
+            "port_efficiency": weights["port_efficiency_weight"] * (1 - scores["port_efficiency"]),
+            "vessel_compatibility": weights["vessel_compatibility_weight"] * (1 - scores["vessel_compatibility"]),
+        }
+        combined_delay_factor = sum(contributions.values())
+        predicted_delay_hours = weights["base_delay_hours"] * (1 + combined_delay_factor * 3)
+        hourly_rate = inputs["demurrage_rate"] / 24
+        
+        return {
+            "scores": scores,
+            "contributions": contributions,
+            "combined_delay_factor": combined_delay_factor,
+            "predicted_delay_hours": predicted_delay_hours,
+            "predicted_cost": predicted_delay_hours * hourly_rate,
+            "base_cost": weights["base_delay_hours"] * hourly_rate,
+            "factor_costs": {name: weights["base_delay_hours"] * 3 * value * hourly_rate
+                             for name, value in contributions.items()},
+        }
+    
     def _calculate_risk_level(self, combined_factor):
         if combined_factor < 0.3:
             return "low"
@@ -221,62 +331,34 @@ class DemurragePredictor:
         return loading_hours
     
     def _generate_recommendations(self, congestion, cargo, weather, port_eff, vessel_compat, eta, port):
+        key = (congestion > 0.6, cargo > 0.5, weather > 0.5, port_eff > 0.4, vessel_compat < 0.7)
+        cached = self._recommendation_sets.get(key)
+        if cached is not None:
+            return cached
+        
         recommendations = []
         
-        if congestion > 0.6:
-            recommendations.append({
-                "priority": "high",
-                "category": "scheduling",
-                "action": "Consider arriving 24-48 hours earlier to secure berth slot",
-                "potential_saving": "15-25%"
-            })
-            recommendations.append({
-                "priority": "medium",
-                "category": "communication",
-                "action": "Contact port agent to pre-book berth window",
-                "potential_saving": "10-15%"
-            })
-        
-        if cargo > 0.5:
-            recommendations.append({
-                "priority": "high",
-                "category": "operations",
-                "action": "Pre-arrange specialized equipment and stevedores",
-                "potential_saving": "10-20%"
-            })
-        
-        if weather > 0.5:
-            recommendations.append({
-                "priority": "medium",
-                "category": "planning",
-                "action": "Build weather buffer into schedule",
-                "potential_saving": "5-15%"
-            })
-        
-        if port_eff > 0.4:
-            recommendations.append({
-                "priority": "medium",
-                "category": "alternatives",
-                "action": "Evaluate nearby alternative ports with better efficiency",
-                "potential_saving": "10-30%"
-            })
-        
-        if vessel_compat < 0.7:
-            recommendations.append({
-                "priority": "low",
-                "category": "fleet",
-                "action": "Consider using more suitable vessel type for this cargo",
-                "potential_saving": "5-10%"
-            })
-        
-        recommendations.append({
-            "priority": "medium",
-            "category": "documentation",
-            "action": "Submit all documentation 48 hours before arrival",
-            "potential_saving": "5-10%"
-        })
-        
-        return sorted(recommendations, key=lambda x: {"high": 0, "medium": 1, "low": 2}[x["priority"]])
+        if key[0]:
+            recommendations.append(EARLY_ARRIVAL)
+            recommendations.append(PRE_BOOK_BERTH)
+        
+        if key[1]:
+            recommendations.append(SPECIALIZED_EQUIPMENT)
+        
+        if key[2]:
+            recommendations.append(WEATHER_BUFFER)
+        
+        if key[3]:
+            recommendations.append(ALTERNATIVE_PORTS)
+        
+        if key[4]:
+            recommendations.append(SUITABLE_VESSEL)
+        
+        recommendations.append(EARLY_DOCUMENTATION)
+        
+        cached = tuple(sorted(recommendations, key=lambda x: PRIORITY_ORDER[x.priority]))
+        self._recommendation_sets[key] = cached
+        return cached
     
     def _calculate_optimal_arrival(self, eta, port):
         if not eta:
@@ -292,13 +374,9 @@ class DemurragePredictor:
             days_to_monday = 7 - optimal_time.weekday()
             optimal_time += timedelta(days=days_to_monday)
         
-        return {
-            "start": optimal_time.strftime("%Y-%m-%d %H:%M"),
-            "end": (optimal_time + timedelta(hours=4)).strftime("%Y-%m-%d %H:%M"),
-            "reason": "Lower congestion during early morning weekday arrivals"
-        }
+        return optimal_time
     
-    def get_optimization_recommendations(self, vessel, dest_port, cargo_type, cargo_volume, ontology):
+    def get_optimization_recommendations(self, vessel, dest_port, cargo_type, cargo_volume, ontology, progress=None):
         base_prediction = self.predict_demurrage(
             vessel=vessel,
             origin_port=None,
@@ -327,6 +405,8 @@ class DemurragePredictor:
                     "predicted_cost": prediction["predicted_cost"],
                     "risk_level": prediction["risk_level"]
                 })
+                if progress is not None:
+                    progress(len(time_slots), 14 * 3)
         
         time_slots.sort(key=lambda x: x["predicted_cost"])
         
@@ -0,0 +1,106 @@
+import math
+import threading
+from datetime import timedelta
+import numpy as np
+
+EARTH_RADIUS_NM = 3440.065
+
+# Great-circle legs are shorter than navigable sea routes around land masses,
+# straits and traffic separation schemes; this factor is a fleet-wide average.
+DEFAULT_ROUTE_FACTOR = 1.18
+
+def haversine_nm(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * math.asin(math.sqrt(a))
+
+def haversine_matrix(lats_a, lons_a, lats_b, lons_b):
+    phi_a = np.radians(np.asarray(lats_a, dtype=float))[:, None]
+    phi_b = np.radians(np.asarray(lats_b, dtype=float))[None, :]
+    dlmb = np.radians(np.asarray(lons_b, dtype=float))[None, :] - np.radians(np.asarray(lons_a, dtype=float))[:, None]
+    a = np.sin((phi_b - phi_a) / 2) ** 2 + np.cos(phi_a) * np.cos(phi_b) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+class PortDistanceService:
+    def __init__(self, route_factor=DEFAULT_ROUTE_FACTOR):
+        self.route_factor = route_factor
+        self.port_ids = []
+        self.index = {}
+        self.lats = np.empty(0)
+        self.lons = np.empty(0)
+        self.matrix = np.empty((0, 0))
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def load(self, ports):
+        ports = [p for p in ports if p.latitude is not None and p.longitude is not None]
+        with self._lock:
+            self.port_ids = [p.id for p in ports]
+            self.index = {port_id: i for i, port_id in enumerate(self.port_ids)}
+            self.lats = np.array([p.latitude for p in ports], dtype=float)
+            self.lons = np.array([p.longitude for p in ports], dtype=float)
+            self.matrix = haversine_matrix(self.lats, self.lons, self.lats, self.lons) * self.route_factor
+            self._pending = {}
+        return self
+    
+    def attach(self, port_ids, lats, lons, matrix):
+        with self._lock:
+            self.port_ids = [int(pid) for pid in port_ids]
+            self.index = {port_id: i for i, port_id in enumerate(self.port_ids)}
+            self.lats = lats
+            self.lons = lons
+            self.matrix = matrix
+        return self
+    
+    def mark_port(self, port_id, latitude, longitude):
+        if latitude is None or longitude is None:
+            return
+        with self._lock:
+            self._pending[port_id] = (latitude, longitude)
+    
+    def _apply_pending(self):
+        if not self._pending:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not self.matrix.flags.writeable:
+                self.lats, self.lons, self.matrix = np.array(self.lats), np.array(self.lons), np.array(self.matrix)
+            moved = [(pid, c) for pid, c in pending.items() if pid in self.index]
+            added = [(pid, c) for pid, c in pending.items() if pid not in self.index]
+            
+            if added:
+                n, k = len(self.port_ids), len(added)
+                self.port_ids = self.port_ids + [pid for pid, _ in added]
+                self.index.update({pid: n + i for i, (pid, _) in enumerate(added)})
+                self.lats = np.concatenate([self.lats, [c[0] for _, c in added]])
+                self.lons = np.concatenate([self.lons, [c[1] for _, c in added]])
+                matrix = np.zeros((n + k, n + k))
+                matrix[:n, :n] = self.matrix
+                self.matrix = matrix
+                moved.extend(added)
+            
+            if moved:
+                rows = np.array([self.index[pid] for pid, _ in moved])
+                self.lats[rows] = [c[0] for _, c in moved]
+                self.lons[rows] = [c[1] for _, c in moved]
+                distances = haversine_matrix(self.lats[rows], self.lons[rows], self.lats, self.lons) * self.route_factor
+                self.matrix[rows, :] = distances
+                self.matrix[:, rows] = distances.T
+    
+    def distance_nm(self, origin_id, dest_id):
+        self._apply_pending()
+        return float(self.matrix[self.index[origin_id], self.index[dest_id]])
+    
+    def estimate_eta(self, origin_id, dest_id, departure, speed_knots):
+        hours = self.distance_nm(origin_id, dest_id) / speed_knots
+        return departure + timedelta(hours=hours)
+    
+    def estimate_etas(self, origin_ids, dest_ids, departures, speeds_knots):
+        self._apply_pending()
+        origins = np.array([self.index[pid] for pid in origin_ids], dtype=int)
+        dests = np.array([self.index[pid] for pid in dest_ids], dtype=int)
+        hours = self.matrix[origins, dests] / np.asarray(speeds_knots, dtype=float)
+        departures = np.asarray(departures, dtype="datetime64[s]")
+        return departures + np.round(hours * 3600).astype("timedelta64[s]"), self.matrix[origins, dests]
@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import select
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Rows per fetch; larger values only grow each worker's buffer.
+MAX_CHUNK_SIZE = 50000
+
+EXPORT_DATASETS = {
+    "voyages": ("Voyage", "created_at"),
+    "demurrage": ("DemurrageRecord", "recorded_at"),
+}
+
+def export_query(models, dataset, since=None, until=None):
+    model_name, time_column = EXPORT_DATASETS[dataset]
+    table = models[model_name].__table__
+    query = select(*table.columns).order_by(table.c.id)
+    if since:
+        query = query.where(table.c[time_column] >= since)
+    if until:
+        query = query.where(table.c[time_column] < until)
+    return table, query
+
+def stream_chunks(engine, query, chunk_size=5000):
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for partition in result.partitions():
+            yield partition
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def encode_csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows([[_format_value(v) for v in row] for row in chunk])
+        yield buffer.getvalue()
+
+def encode_ndjson(columns, chunks):
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(dict(zip(columns, (_format_value(v) for v in row)))) + "\n"
+            for row in chunk
+        )
+
+def _arrow_schema(pa, table):
+    fields = []
+    for column in table.columns:
+        python_type = column.type.python_type
+        if python_type is int:
+            arrow_type = pa.int64()
+        elif python_type is float:
+            arrow_type = pa.float64()
+        elif python_type is bool:
+            arrow_type = pa.bool_()
+        elif python_type is datetime:
+            arrow_type = pa.timestamp("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError("The arrow export format requires pyarrow to be installed")
+    return pyarrow
+
+def encode_arrow(pa, table, chunks):
+    schema = _arrow_schema(pa, table)
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+    for chunk in chunks:
+        columns = list(zip(*chunk))
+        writer.write_batch(pa.record_batch(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        ))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate(0)
+    writer.close()
+    yield sink.getvalue()
+
+def export_stream(engine, models, dataset, fmt, since=None, until=None, chunk_size=5000):
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f"Unknown export dataset: {dataset}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    chunk_size = min(chunk_size, MAX_CHUNK_SIZE)
+    
+    pa = _require_pyarrow() if fmt == "arrow" else None
+    table, query = export_query(models, dataset, since, until)
+    chunks = stream_chunks(engine, query, chunk_size)
+    columns = [column.name for column in table.columns]
+    
+    if fmt == "csv":
+        return encode_csv(columns, chunks)
+    if fmt == "ndjson":
+        return encode_ndjson(columns, chunks)
+    return encode_arrow(pa, table, chunks)
@@ -0,0 +1,173 @@
+import time
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+CHECKS = ("compatibility", "deadweight", "draft")
+
+# _calculate_vessel_compatibility scores a known vessel type carrying the wrong cargo category at 0.5.
+INCOMPATIBLE_SCORE = 0.5
+
+class FleetAssigner:
+    def __init__(self, predictor):
+        self.predictor = predictor
+    
+    def _vessel_arrays(self, vessels):
+        type_ids = np.array([v.vessel_type_id if v.vessel_type_id is not None else -1 for v in vessels])
+        type_keys, type_index = np.unique(type_ids, return_inverse=True)
+        return {
+            # Unknown draft or deadweight is not held against a vessel.
+            "draft": np.array([v.draft if v.draft else 0.0 for v in vessels]),
+            "dwt": np.array([v.dwt if v.dwt else np.inf for v in vessels]),
+            "demurrage_rate": np.array([v.demurrage_rate if v.demurrage_rate else 25000 for v in vessels], dtype=float),
+            "type_index": type_index,
+            "type_representatives": [vessels[int(np.argmax(type_ids == key))] for key in type_keys],
+        }
+    
+    def _cargo_arrays(self, cargoes, ports, cargo_types, ontology):
+        predictor = self.predictor
+        columns = {name: [] for name in ("max_draft", "volume", "congestion_level", "congestion_multiplier",
+                                         "cargo_handling", "weather_factor", "weather_multiplier",
+                                         "cargo_handling_rate", "num_berths")}
+        for cargo in cargoes:
+            dest = ports[cargo["dest_port_id"]]
+            origin = ports.get(cargo.get("origin_port_id"))
+            cargo_type = cargo_types.get(cargo.get("cargo_type_id"))
+            volume = cargo.get("cargo_volume") or 0
+            congestion_level, congestion_multiplier = predictor._congestion_inputs(dest, cargo["eta"])
+            weather_factor, weather_multiplier = predictor._weather_inputs(dest, cargo["eta"])
+            
+            columns["max_draft"].append(min(dest.max_draft or np.inf, (origin.max_draft or np.inf) if origin else np.inf))
+            columns["volume"].append(volume)
+            columns["congestion_level"].append(congestion_level)
+            columns["congestion_multiplier"].append(congestion_multiplier)
+            columns["cargo_handling"].append(predictor._calculate_cargo_handling_score(cargo_type, volume, ontology))
+            columns["weather_factor"].append(weather_factor)
+            columns["weather_multiplier"].append(weather_multiplier)
+            columns["cargo_handling_rate"].append(dest.cargo_handling_rate or 0)
+            columns["num_berths"].append(dest.num_berths or 0)
+        
+        arrays = {name: np.array(values, dtype=float) for name, values in columns.items()}
+        type_ids = np.array([cargo.get("cargo_type_id") or -1 for cargo in cargoes])
+        type_keys, arrays["type_index"] = np.unique(type_ids, return_inverse=True)
+        arrays["type_representatives"] = [cargo_types.get(int(key)) for key in type_keys]
+        return arrays
+    
+    def feasibility(self, fleet, cargo, ontology):
+        compatibility = np.array([
+            [self.predictor._calculate_vessel_compatibility(vessel, cargo_type, ontology)
+             for cargo_type in cargo["type_representatives"]]
+            for vessel in fleet["type_representatives"]
+        ]).reshape(len(fleet["type_representatives"]), len(cargo["type_representatives"]))
+        
+        pair_compatibility = compatibility[fleet["type_index"][:, None], cargo["type_index"][None, :]]
+        checks = {
+            "draft": fleet["draft"][:, None] <= cargo["max_draft"][None, :],
+            "deadweight": fleet["dwt"][:, None] >= cargo["volume"][None, :],
+            "compatibility": pair_compatibility > INCOMPATIBLE_SCORE,
+        }
+        return checks, pair_compatibility
+    
+    def _solve(self, vessel_index, cargo_index, costs, vessel_count, cargo_count):
+        # Vessels that share no feasible cargo never compete, so each connected component of the
+        # feasibility graph is an independent, much smaller assignment problem.
+        graph = coo_matrix((np.ones(len(costs)), (vessel_index, vessel_count + cargo_index)),
+                           shape=(vessel_count + cargo_count,) * 2)
+        _, labels = connected_components(graph, directed=False)
+        
+        pair_component = labels[vessel_index]
+        order = np.argsort(pair_component, kind="stable")
+        boundaries = np.flatnonzero(np.diff(pair_component[order])) + 1
+        
+        assigned_vessels, assigned_cargoes = [], []
+        blocks = [pairs for pairs in np.split(order, boundaries) if len(pairs)]
+        for pairs in blocks:
+            rows, row_index = np.unique(vessel_index[pairs], return_inverse=True)
+            cols, col_index = np.unique(cargo_index[pairs], return_inverse=True)
+            # Exceeds any total of feasible costs, so carrying one more cargo always wins.
+            infeasible = costs[pairs].sum() + 1.0
+            matrix = np.full((len(rows), len(cols)), infeasible)
+            matrix[row_index, col_index] = costs[pairs]
+            chosen_rows, chosen_cols = linear_sum_assignment(matrix)
+            keep = matrix[chosen_rows, chosen_cols] < infeasible
+            assigned_vessels.append(rows[chosen_rows[keep]])
+            assigned_cargoes.append(cols[chosen_cols[keep]])
+        
+        if not assigned_vessels:
+            return np.array([], dtype=int), np.array([], dtype=int), 0
+        return np.concatenate(assigned_vessels), np.concatenate(assigned_cargoes), len(blocks)
+    
+    def assign(self, vessels, cargoes, ports, cargo_types, ontology):
+        started = time.perf_counter()
+        if not vessels or not cargoes:
+            return {"assignments": [], "unassigned": [{"cargo_id": c["id"], "reason": "no_vessels"} for c in cargoes],
+                    "total_predicted_cost": 0, "stats": {"vessels": len(vessels), "cargoes": len(cargoes)}}
+        
+        fleet = self._vessel_arrays(vessels)
+        cargo = self._cargo_arrays(cargoes, ports, cargo_types, ontology)
+        checks, pair_compatibility = self.feasibility(fleet, cargo, ontology)
+        feasible = checks["draft"] & checks["deadweight"] & checks["compatibility"]
+        vessel_index, cargo_index = np.nonzero(feasible)
+        
+        # Every feasible pairing is scored in one pass through the predictor's vectorised model.
+        scored = self.predictor.score_arrays({
+            "congestion_level": cargo["congestion_level"][cargo_index],
+            "congestion_multiplier": cargo["congestion_multiplier"][cargo_index],
+            "cargo_handling": cargo["cargo_handling"][cargo_index],
+            "weather_factor": cargo["weather_factor"][cargo_index],
+            "weather_multiplier": cargo["weather_multiplier"][cargo_index],
+            "cargo_handling_rate": cargo["cargo_handling_rate"][cargo_index],
+            "num_berths": cargo["num_berths"][cargo_index],
+            "vessel_compatibility": pair_compatibility[vessel_index, cargo_index],
+            "demurrage_rate": fleet["demurrage_rate"][vessel_index],
+        })
+        costs, delays = scored["predicted_cost"], scored["predicted_delay_hours"]
+        
+        chosen_vessels, chosen_cargoes, block_count = self._solve(
+            vessel_index, cargo_index, costs, len(vessels), len(cargoes))
+        
+        # Pairs are in row-major order, so a (vessel, cargo) key locates each chosen pair's score.
+        pair_keys = vessel_index * len(cargoes) + cargo_index
+        chosen_pairs = np.searchsorted(pair_keys, chosen_vessels * len(cargoes) + chosen_cargoes)
+        
+        assignments = []
+        for v, c, pair in sorted(zip(chosen_vessels.tolist(), chosen_cargoes.tolist(), chosen_pairs.tolist()),
+                                 key=lambda entry: entry[1]):
+            assignments.append({
+                "cargo_id": cargoes[c]["id"],
+                "vessel_id": vessels[v].id,
+                "vessel_name": vessels[v].name,
+                "predicted_delay_hours": round(float(delays[pair]), 1),
+                "predicted_cost": round(float(costs[pair]), 2),
+            })
+        
+        assigned = np.zeros(len(cargoes), dtype=bool)
+        assigned[chosen_cargoes] = True
+        has_option = feasible.any(axis=0)
+        unassigned = []
+        for c in np.flatnonzero(~assigned).tolist():
+            if has_option[c]:
+                unassigned.append({"cargo_id": cargoes[c]["id"], "reason": "fleet_exhausted"})
+            else:
+                # Vessels left after applying each check in turn show which one rules the cargo out.
+                passing = np.ones(len(vessels), dtype=bool)
+                vessels_passing = {}
+                for name in CHECKS:
+                    passing &= checks[name][:, c]
+                    vessels_passing[name] = int(passing.sum())
+                unassigned.append({"cargo_id": cargoes[c]["id"], "reason": "infeasible",
+                                   "vessels_passing": vessels_passing})
+        
+        return {
+            "assignments": assignments,
+            "unassigned": unassigned,
+            "total_predicted_cost": round(float(costs[chosen_pairs].sum()), 2),
+            "stats": {
+                "vessels": len(vessels),
+                "cargoes": len(cargoes),
+                "feasible_pairs": int(len(costs)),
+                "assignment_blocks": block_count,
+                "elapsed_seconds": round(time.perf_counter() - started, 3),
+            },
+        }
@@ -0,0 +1,36 @@
+import os
+import signal
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "4"))
+
+# Dashboard event streams hold a connection open; threads keep them from
+# starving ordinary requests of workers.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+
+# Load the app once in the master so migrations, seeding and the shared
+# reference data segment are built before workers fork and attach to it.
+preload_app = True
+
+def post_fork(server, worker):
+    from app import app, db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def when_ready(server):
+    # Background jobs run in their own processes forked from the preloaded app, so CPU-bound
+    # sweeps never share a GIL with request handling. Set JOB_EXTERNAL_RUNNERS=1 when they
+    # are run elsewhere with `flask job-worker`.
+    if os.environ.get("JOB_EXTERNAL_RUNNERS") == "1":
+        return
+    from app import job_queue
+    server.job_runners = job_queue.start_workers()
+
+def on_exit(server):
+    for pid in getattr(server, "job_runners", []):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,307 @@
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, or_, select, update
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    pass
+
+class JobQueueFull(Exception):
+    pass
+
+def _dumps(value):
+    return json.dumps(value, default=lambda o: o.to_dict() if hasattr(o, "to_dict") else str(o))
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+class Job:
+    def __init__(self, queue, job_id, kind, params):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.done = 0
+        self.total = None
+        self.message = None
+        self._cancelled = False
+        self._checked_at = 0.0
+        self._written_at = 0.0
+    
+    def check_cancelled(self):
+        now = time.monotonic()
+        if not self._cancelled and now - self._checked_at >= self.queue.poll_seconds:
+            self._checked_at = now
+            self._cancelled = self.queue._cancel_requested(self.id)
+        if self._cancelled:
+            raise JobCancelled()
+    
+    def progress(self, done, total=None, message=None):
+        self.check_cancelled()
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        now = time.monotonic()
+        # Tight loops report often; the row is written at most once per poll interval.
+        if now - self._written_at >= self.queue.poll_seconds:
+            self._written_at = now
+            self.queue._update(self.id, done=self.done, total=self.total, message=self.message)
+    
+    def emit(self, partial):
+        self.check_cancelled()
+        self.queue._add_partial(self.id, partial)
+
+class JobQueue:
+    def __init__(self, app, db, models, handlers=None, max_workers=2, max_pending=32, retention_seconds=3600,
+                 max_retained=500, poll_seconds=0.5, stale_seconds=60.0):
+        self.app = app
+        self.db = db
+        self.jobs = models['BackgroundJob'].__table__
+        self.partials = models['BackgroundJobPartial'].__table__
+        self.handlers = dict(handlers or {})
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.max_retained = max_retained
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+    
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+        return handler
+    
+    def _job_query(self):
+        partial_count = select(func.count(self.partials.c.id))\
+            .where(self.partials.c.job_id == self.jobs.c.id).scalar_subquery()
+        return select(self.jobs, partial_count.label("partial_results"))
+    
+    def _to_dict(self, row, include_result=False):
+        data = {
+            "id": row.id,
+            "kind": row.kind,
+            "status": row.status,
+            "cancel_requested": bool(row.cancel_requested),
+            "progress": {
+                "done": row.done,
+                "total": row.total,
+                "fraction": round(row.done / row.total, 4) if row.total else None,
+                "message": row.message,
+            },
+            "partial_results": row.partial_results,
+            "created_at": _isoformat(row.created_at),
+            "started_at": _isoformat(row.started_at),
+            "finished_at": _isoformat(row.finished_at),
+            "error": row.error,
+        }
+        if include_result:
+            data["result"] = json.loads(row.result) if row.result is not None else None
+        return data
+    
+    def submit(self, kind, params=None):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}. Expected one of: {', '.join(sorted(self.handlers))}")
+        
+        job_id = uuid.uuid4().hex
+        with self.db.engine.begin() as connection:
+            self._expire(connection)
+            pending = connection.execute(
+                select(func.count()).select_from(self.jobs).where(self.jobs.c.status.in_((QUEUED, RUNNING)))
+            ).scalar()
+            if pending >= self.max_workers + self.max_pending:
+                raise JobQueueFull(f"Job queue is full ({pending} jobs queued or running)")
+            connection.execute(insert(self.jobs).values(
+                id=job_id, kind=kind, params=_dumps(params or {}), status=QUEUED, cancel_requested=False,
+                done=0, created_at=datetime.utcnow()
+            ))
+        return self.get(job_id)
+    
+    def get(self, job_id, include_result=False):
+        with self.db.engine.connect() as connection:
+            row = connection.execute(self._job_query().where(self.jobs.c.id == job_id)).first()
+        return self._to_dict(row, include_result) if row is not None else None
+    
+    def list(self):
+        with self.db.engine.begin() as connection:
+            self._expire(connection)
+            rows = connection.execute(
+                self._job_query().order_by(self.jobs.c.created_at.desc()).limit(self.max_retained)
+            ).all()
+        return [self._to_dict(row) for row in rows]
+    
+    def cancel(self, job_id):
+        now = datetime.utcnow()
+        with self.db.engine.begin() as connection:
+            connection.execute(update(self.jobs).where(self.jobs.c.id == job_id, self.jobs.c.status == QUEUED)
+                               .values(status=CANCELLED, cancel_requested=True, finished_at=now))
+            connection.execute(update(self.jobs).where(self.jobs.c.id == job_id, self.jobs.c.status == RUNNING)
+                               .values(cancel_requested=True))
+        return self.get(job_id)
+    
+    def _expire(self, connection):
+        now = datetime.utcnow()
+        # A runner that died mid-job stops sending heartbeats; its job would otherwise run forever.
+        connection.execute(update(self.jobs).where(
+            self.jobs.c.status == RUNNING, self.jobs.c.heartbeat_at < now - timedelta(seconds=self.stale_seconds)
+        ).values(status=FAILED, error="Job runner stopped responding", finished_at=now))
+        
+        finished = self.jobs.c.status.in_(FINISHED_STATUSES)
+        kept = select(self.jobs.c.id).where(finished).order_by(self.jobs.c.finished_at.desc())\
+            .limit(self.max_retained).scalar_subquery()
+        cutoff = now - timedelta(seconds=self.retention_seconds)
+        expired_ids = connection.execute(select(self.jobs.c.id).where(
+            finished, or_(self.jobs.c.finished_at < cutoff, self.jobs.c.id.notin_(kept))
+        )).scalars().all()
+        if expired_ids:
+            connection.execute(delete(self.partials).where(self.partials.c.job_id.in_(expired_ids)))
+            connection.execute(delete(self.jobs).where(self.jobs.c.id.in_(expired_ids)))
+    
+    def _update(self, job_id, **values):
+        with self.db.engine.begin() as connection:
+            connection.execute(update(self.jobs).where(self.jobs.c.id == job_id).values(**values))
+    
+    def _add_partial(self, job_id, partial):
+        with self.db.engine.begin() as connection:
+            connection.execute(insert(self.partials).values(job_id=job_id, data=_dumps(partial)))
+    
+    def _cancel_requested(self, job_id):
+        with self.db.engine.connect() as connection:
+            return bool(connection.execute(
+                select(self.jobs.c.cancel_requested).where(self.jobs.c.id == job_id)
+            ).scalar())
+    
+    def stream(self, job_id):
+        partial_cursor = 0
+        done = None
+        while True:
+            # The job row is read before its partials, so a finished job's partials are all visible.
+            with self.db.engine.connect() as connection:
+                row = connection.execute(self._job_query().where(self.jobs.c.id == job_id)).first()
+                partials = connection.execute(
+                    select(self.partials.c.id, self.partials.c.data)
+                    .where(self.partials.c.job_id == job_id, self.partials.c.id > partial_cursor)
+                    .order_by(self.partials.c.id)
+                ).all()
+            if row is None:
+                return
+            for partial_id, data in partials:
+                yield {"event": "partial", "data": json.loads(data)}
+                partial_cursor = partial_id
+            if row.done != done:
+                done = row.done
+                yield {"event": "progress", "data": self._to_dict(row)["progress"]}
+            if row.status in FINISHED_STATUSES:
+                yield {"event": row.status, "data": self._to_dict(row, include_result=True)}
+                return
+            time.sleep(self.poll_seconds)
+    
+    def _claim(self):
+        now = datetime.utcnow()
+        with self.db.engine.begin() as connection:
+            candidates = connection.execute(
+                select(self.jobs.c.id, self.jobs.c.kind, self.jobs.c.params)
+                .where(self.jobs.c.status == QUEUED).order_by(self.jobs.c.created_at).limit(8)
+            ).all()
+            for candidate in candidates:
+                # Only one runner's update still sees the job queued.
+                claimed = connection.execute(
+                    update(self.jobs).where(self.jobs.c.id == candidate.id, self.jobs.c.status == QUEUED)
+                    .values(status=RUNNING, started_at=now, heartbeat_at=now)
+                ).rowcount
+                if claimed:
+                    return candidate
+        return None
+    
+    def _finish(self, job, status, result=None, error=None):
+        self._update(job.id, status=status, done=job.done, total=job.total, message=job.message,
+                     result=_dumps(result) if result is not None else None, error=error,
+                     finished_at=datetime.utcnow())
+    
+    def _run(self, candidate):
+        job = Job(self, candidate.id, candidate.kind, json.loads(candidate.params or "{}"))
+        try:
+            with self.app.app_context():
+                result = self.handlers[job.kind](job, job.params)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            self.app.logger.error("Job %s (%s) failed\n%s", job.id, job.kind, traceback.format_exc())
+            self._finish(job, FAILED, error=str(e) or type(e).__name__)
+        else:
+            self._finish(job, SUCCEEDED, result=result)
+    
+    def _heartbeat(self, current):
+        with self.app.app_context():
+            while True:
+                time.sleep(self.stale_seconds / 4)
+                job_id = current.get("id")
+                if job_id is not None:
+                    try:
+                        self._update(job_id, heartbeat_at=datetime.utcnow())
+                    except Exception:
+                        self.app.logger.exception("Job heartbeat failed")
+    
+    def run_worker(self, exit_with_parent=False):
+        parent = os.getppid()
+        current = {}
+        threading.Thread(target=self._heartbeat, args=(current,), name="job-heartbeat", daemon=True).start()
+        expired_at = 0.0
+        with self.app.app_context():
+            while not (exit_with_parent and os.getppid() != parent):
+                try:
+                    candidate = self._claim()
+                    if candidate is None:
+                        if time.monotonic() - expired_at >= self.stale_seconds / 4:
+                            expired_at = time.monotonic()
+                            with self.db.engine.begin() as connection:
+                                self._expire(connection)
+                        time.sleep(self.poll_seconds)
+                        continue
+                except Exception:
+                    self.app.logger.exception("Claiming a job failed")
+                    time.sleep(self.poll_seconds)
+                    continue
+                current["id"] = candidate.id
+                self._run(candidate)
+                current["id"] = None
+    
+    def start_workers(self, count=None):
+        # Forked so each runner starts from the already-initialised application. Plain forks rather
+        # than multiprocessing.Process: gunicorn workers forked later would inherit the Process
+        # handles and try to join them at exit.
+        pids = []
+        for _ in range(self.max_workers if count is None else count):
+            pid = os.fork()
+            if pid == 0:
+                status = 0
+                try:
+                    _serve_forked(self)
+                except BaseException:
+                    traceback.print_exc()
+                    status = 1
+                finally:
+                    os._exit(status)
+            pids.append(pid)
+        return pids
+
+def _serve_forked(queue):
+    # A runner forked from the gunicorn master must not inherit the arbiter's signal handlers.
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGQUIT, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    with queue.app.app_context():
+        for engine in queue.db.engines.values():
+            engine.dispose(close=False)
+    queue.run_worker(exit_with_parent=True)
@@ -0,0 +1,307 @@
+import csv
+import json
+from datetime import datetime
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+from live_feed import queue_changes
+
+HOURS_PER_WEEK = 168.0
+
+# 1970-01-01 was a Thursday; shifting by three days puts week boundaries on Monday 00:00.
+_EPOCH_TO_MONDAY_HOURS = 72.0
+
+# Hour of the week (from Monday 00:00) after which time no longer counts as laytime.
+LAYTIME_TERMS = {
+    "SHINC": HOURS_PER_WEEK,
+    "SATPM": 132.0,
+    "SHEX": 144.0,
+    "SSHEX": 120.0,
+}
+
+DEFAULT_LOADING_RATE = 5000
+
+def to_hours(values):
+    array = np.asarray(values, dtype="datetime64[s]")
+    hours = array.astype("int64") / 3600.0
+    hours[np.isnat(array)] = np.nan
+    return hours
+
+def from_hours(hours):
+    hours = np.asarray(hours, dtype=float)
+    seconds = np.round(np.nan_to_num(hours) * 3600).astype("int64").astype("datetime64[s]")
+    seconds[np.isnan(hours)] = np.datetime64("NaT")
+    return seconds
+
+def allowed_laytime_hours(cargo_volume, loading_rate):
+    volume = np.nan_to_num(np.asarray(cargo_volume, dtype=float))
+    rate = np.asarray(loading_rate, dtype=float)
+    rate = np.where(np.isnan(rate) | (rate <= 0), DEFAULT_LOADING_RATE, rate)
+    return volume / rate
+
+def weekly_excepted_hours(hours, week_start):
+    # Excepted hours between the epoch and `hours` for a calendar that stops counting
+    # at `week_start` every week: whole weeks plus the tail of the current one.
+    excepted_per_week = HOURS_PER_WEEK - week_start
+    shifted = hours + _EPOCH_TO_MONDAY_HOURS
+    weeks = np.floor(shifted / HOURS_PER_WEEK)
+    into_week = shifted - weeks * HOURS_PER_WEEK
+    return weeks * excepted_per_week + np.clip(into_week - week_start, 0, excepted_per_week)
+
+class WeatherCalendar:
+    def __init__(self, windows=None):
+        self.windows = {}
+        self._cumulative = {}
+        for port_id, spans in (windows or {}).items():
+            self.add(port_id, spans)
+    
+    @classmethod
+    def from_records(cls, records):
+        spans = {}
+        for record in records:
+            start, end = record["start"], record["end"]
+            if isinstance(start, str):
+                start = datetime.fromisoformat(start)
+            if isinstance(end, str):
+                end = datetime.fromisoformat(end)
+            spans.setdefault(int(record["port_id"]), []).append((start, end))
+        return cls(spans)
+    
+    @classmethod
+    def from_file(cls, path):
+        with open(path, newline="") as handle:
+            if path.endswith(".csv"):
+                return cls.from_records(list(csv.DictReader(handle)))
+            return cls.from_records([json.loads(line) for line in handle if line.strip()])
+    
+    def add(self, port_id, spans):
+        if not spans:
+            return
+        starts = to_hours([start for start, _ in spans])
+        ends = to_hours([end for _, end in spans])
+        if port_id in self.windows:
+            starts = np.concatenate([self.windows[port_id][0], starts])
+            ends = np.concatenate([self.windows[port_id][1], ends])
+        
+        order = np.argsort(starts)
+        merged = []
+        for start, end in zip(starts[order], ends[order]):
+            if not end > start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        if merged:
+            merged = np.array(merged)
+            self.windows[port_id] = (merged[:, 0], merged[:, 1])
+        self._cumulative = {key: value for key, value in self._cumulative.items() if key[0] != port_id}
+    
+    def __contains__(self, port_id):
+        return port_id in self.windows
+    
+    def excepted_hours(self, port_id, hours, week_start):
+        # Weather time between the epoch and `hours`, minus whatever the weekly
+        # calendar already excepts, so overlapping exceptions are not counted twice.
+        starts, ends = self.windows[port_id]
+        key = (port_id, week_start)
+        cumulative = self._cumulative.get(key)
+        if cumulative is None:
+            net = (ends - starts) - (weekly_excepted_hours(ends, week_start)
+                                     - weekly_excepted_hours(starts, week_start))
+            cumulative = self._cumulative[key] = np.concatenate([[0.0], np.cumsum(net)])
+        
+        index = np.searchsorted(starts, hours, side="right")
+        last = np.maximum(index - 1, 0)
+        clipped_end = np.minimum(ends[last], hours)
+        partial = (clipped_end - starts[last]) - (weekly_excepted_hours(clipped_end, week_start)
+                                                   - weekly_excepted_hours(starts[last], week_start))
+        return np.where(index > 0, cumulative[last] + partial, 0.0)
+
+class LaytimeCalculator:
+    def __init__(self, terms="SHINC", nor_turn_hours=6.0, weather=None, despatch_ratio=0.5):
+        if terms not in LAYTIME_TERMS:
+            raise ValueError(f"Unsupported laytime terms: {terms}. Expected one of: {', '.join(LAYTIME_TERMS)}")
+        self.terms = terms
+        self.nor_turn_hours = nor_turn_hours
+        self.weather = weather or WeatherCalendar()
+        self.despatch_ratio = despatch_ratio
+    
+    def _port_segments(self, port_ids):
+        # Calls are sorted by port, so each port with weather data is a contiguous slice.
+        if port_ids is None or not self.weather.windows or not len(port_ids):
+            return []
+        boundaries = np.flatnonzero(port_ids[1:] != port_ids[:-1]) + 1
+        starts = np.concatenate([[0], boundaries])
+        stops = np.concatenate([boundaries, [len(port_ids)]])
+        return [(port_ids[start], start, stop) for start, stop in zip(starts, stops)
+                if port_ids[start] in self.weather]
+    
+    def _excepted(self, hours, segments, week_start):
+        excepted = weekly_excepted_hours(hours, week_start)
+        for port_id, start, stop in segments:
+            excepted[start:stop] += self.weather.excepted_hours(port_id, hours[start:stop], week_start)
+        return excepted
+    
+    def _counted(self, start, end, segments, week_start, start_excepted=None):
+        if start_excepted is None:
+            start_excepted = self._excepted(start, segments, week_start)
+        return (end - start) - (self._excepted(end, segments, week_start) - start_excepted)
+    
+    def _laytime_expiry(self, commence, allowed, end, segments, week_start, tolerance=1e-6):
+        # Counted time is monotone in the end point, so bisect for the moment the
+        # allowance runs out; all calls are refined together.
+        start_excepted = self._excepted(commence, segments, week_start)
+        low, high = commence.copy(), end.copy()
+        while len(low) and np.max(high - low) > tolerance:
+            middle = (low + high) / 2
+            exhausted = self._counted(commence, middle, segments, week_start, start_excepted) >= allowed
+            high = np.where(exhausted, middle, high)
+            low = np.where(exhausted, low, middle)
+        return high
+    
+    def compute(self, nor_tendered, berthed, completed, allowed_hours, demurrage_rate, port_ids=None,
+                terms=None, nor_turn_hours=None):
+        nor = to_hours(nor_tendered)
+        berth = to_hours(berthed)
+        end = to_hours(completed)
+        count = len(end)
+        allowed = np.broadcast_to(np.asarray(allowed_hours, dtype=float), count)
+        rate = np.nan_to_num(np.broadcast_to(np.asarray(demurrage_rate, dtype=float), count))
+        turn = np.broadcast_to(np.asarray(self.nor_turn_hours if nor_turn_hours is None else nor_turn_hours,
+                                          dtype=float), count)
+        week_start = LAYTIME_TERMS[terms or self.terms]
+        
+        order = None
+        if port_ids is not None and self.weather.windows:
+            port_ids = np.asarray(port_ids)
+            order = np.argsort(port_ids, kind="stable")
+            port_ids, nor, berth, end, allowed, turn = (
+                port_ids[order], nor[order], berth[order], end[order], allowed[order], turn[order]
+            )
+        else:
+            port_ids = None
+        
+        # Laytime starts when the NOR turn time expires, or on berthing if that comes first.
+        nor = np.where(np.isnan(nor), berth, nor)
+        commence = np.fmin(nor + turn, berth)
+        valid = ~np.isnan(commence) & ~np.isnan(end)
+        commence = np.where(valid, commence, 0.0)
+        end = np.where(valid, np.maximum(end, commence), 0.0)
+        
+        used = self._counted(commence, end, self._port_segments(port_ids), week_start)
+        on_demurrage = valid & (used >= allowed) & (end > commence)
+        
+        expires = np.full(count, np.nan)
+        if on_demurrage.any():
+            expires[on_demurrage] = self._laytime_expiry(
+                commence[on_demurrage], allowed[on_demurrage], end[on_demurrage],
+                self._port_segments(None if port_ids is None else port_ids[on_demurrage]), week_start
+            )
+        # Once on demurrage, always on demurrage: exceptions stop applying after expiry.
+        demurrage_hours = np.where(on_demurrage, end - np.nan_to_num(expires), 0.0)
+        despatch_hours = np.where(valid & ~on_demurrage, allowed - used, 0.0)
+        
+        result = {
+            "valid": valid,
+            "laytime_commenced": np.where(valid, commence, np.nan),
+            "allowed_hours": np.array(allowed),
+            "used_hours": np.where(valid, used, np.nan),
+            "laytime_expired": expires,
+            "demurrage_hours": demurrage_hours,
+            "despatch_hours": despatch_hours,
+        }
+        if order is not None:
+            restore = np.empty_like(order)
+            restore[order] = np.arange(count)
+            result = {name: values[restore] for name, values in result.items()}
+        result["demurrage_cost"] = np.round(result["demurrage_hours"] / 24 * rate, 2)
+        result["despatch_amount"] = np.round(result["despatch_hours"] / 24 * rate * self.despatch_ratio, 2)
+        return result
+
+def _port_call_query(models, after_id, limit):
+    voyages = models['Voyage'].__table__
+    vessels = models['Vessel'].__table__
+    ports = models['Port'].__table__
+    cargo_types = models['CargoType'].__table__
+    return select(
+        voyages.c.id,
+        voyages.c.destination_port_id,
+        voyages.c.cargo_volume,
+        voyages.c.ata,
+        voyages.c.berthing_time,
+        voyages.c.departure_time,
+        vessels.c.demurrage_rate,
+        func.coalesce(ports.c.cargo_handling_rate, cargo_types.c.typical_loading_rate).label("loading_rate"),
+    ).select_from(
+        voyages.join(vessels, vessels.c.id == voyages.c.vessel_id)
+        .join(ports, ports.c.id == voyages.c.destination_port_id)
+        .outerjoin(cargo_types, cargo_types.c.id == voyages.c.cargo_type_id)
+    ).where(
+        voyages.c.id > after_id,
+        voyages.c.departure_time.isnot(None),
+    ).order_by(voyages.c.id).limit(limit)
+
+def spread_record_costs(db, models, voyage_ids):
+    # Spread each voyage's laytime demurrage across its delay records by delay share.
+    voyages = models['Voyage'].__table__
+    records = models['DemurrageRecord'].__table__
+    others = records.alias("other_records")
+    record_total = select(func.sum(others.c.delay_hours))\
+        .where(others.c.voyage_id == records.c.voyage_id).scalar_subquery()
+    voyage_cost = select(voyages.c.actual_demurrage_cost)\
+        .where(voyages.c.id == records.c.voyage_id).scalar_subquery()
+    db.session.execute(
+        update(records).values(cost=voyage_cost * records.c.delay_hours / record_total)
+        .where(records.c.voyage_id.in_(voyage_ids), record_total > 0)
+    )
+
+def recompute_actual_demurrage(db, models, calculator, chunk_size=50000, update_records=True):
+    voyages = models['Voyage'].__table__
+    voyage_update = update(voyages).where(voyages.c.id == bindparam("b_id")).values(
+        actual_demurrage_cost=bindparam("b_cost"),
+    )
+    stats = {"port_calls": 0, "on_demurrage": 0, "total_demurrage_cost": 0.0, "total_despatch": 0.0}
+    
+    last_id = 0
+    while True:
+        with db.engine.connect() as connection:
+            rows = connection.execute(_port_call_query(models, last_id, chunk_size)).all()
+        if not rows:
+            break
+        ids, port_ids, volumes, ata, berthed, departed, rates, loading_rates = zip(*rows)
+        result = calculator.compute(
+            nor_tendered=ata,
+            berthed=berthed,
+            completed=departed,
+            allowed_hours=allowed_laytime_hours(
+                np.array(volumes, dtype=float), np.array(loading_rates, dtype=float)
+            ),
+            demurrage_rate=np.array(rates, dtype=float),
+            port_ids=np.array(port_ids),
+        )
+        
+        valid = result["valid"]
+        costs = result["demurrage_cost"]
+        db.session.execute(voyage_update, [
+            {"b_id": voyage_id, "b_cost": float(cost)}
+            for voyage_id, cost, ok in zip(ids, costs, valid) if ok
+        ])
+        if update_records:
+            spread_record_costs(db, models, select(voyages.c.id).where(
+                voyages.c.id.between(ids[0], ids[-1]),
+                voyages.c.departure_time.isnot(None),
+                voyages.c.actual_demurrage_cost.isnot(None),
+            ))
+            # Record costs were rewritten in bulk; the dashboard reloads its totals on commit.
+            queue_changes(db.session, [["resync"]])
+        db.session.commit()
+        
+        stats["port_calls"] += int(valid.sum())
+        stats["on_demurrage"] += int((result["demurrage_hours"] > 0).sum())
+        stats["total_demurrage_cost"] += float(costs.sum())
+        stats["total_despatch"] += float(result["despatch_amount"].sum())
+        last_id = ids[-1]
+    
+    stats["total_demurrage_cost"] = round(stats["total_demurrage_cost"], 2)
+    stats["total_despatch"] = round(stats["total_despatch"], 2)
+    return stats
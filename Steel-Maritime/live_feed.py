@@ -0,0 +1,335 @@
+import json
+import os
+import queue
+import select as select_module
+import threading
+import time
+from sqlalchemy import event, func, inspect, select, text
+
+NOTIFY_CHANNEL = "dashboard_changes"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more; larger commits ask listeners to resync.
+MAX_NOTIFY_PAYLOAD = 7900
+
+VOYAGE_FIELDS = ("id", "vessel_id", "origin_port_id", "destination_port_id", "cargo_type_id",
+                 "predicted_delay_hours", "predicted_demurrage_cost", "status", "created_at")
+
+def _voyage_row(voyage):
+    row = {name: getattr(voyage, name) for name in VOYAGE_FIELDS}
+    row["created_at"] = row["created_at"].isoformat() if row["created_at"] else None
+    return row
+
+def voyage_change(voyage, **values):
+    row = _voyage_row(voyage)
+    row.update(values)
+    return ["voyage", row, False]
+
+def queue_changes(session, changes):
+    # Core statements bypass the ORM flush events; writers using them queue their changes here
+    # so the after_commit hook publishes them with the rest of the transaction.
+    if changes:
+        session.info.setdefault("dashboard_changes", []).extend(changes)
+
+def _previous(state, attr, current):
+    history = state.attrs[attr].history
+    return history.deleted[0] if history.deleted else current
+
+class Subscription:
+    def __init__(self, max_pending=100):
+        self.events = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+class DashboardFeed:
+    def __init__(self, app, db, models, recent_limit=10, resync_interval=60.0, heartbeat_seconds=15.0,
+                 listen_notify=None):
+        self.app = app
+        self.db = db
+        self.Vessel = models['Vessel']
+        self.Port = models['Port']
+        self.CargoType = models['CargoType']
+        self.Voyage = models['Voyage']
+        self.DemurrageRecord = models['DemurrageRecord']
+        self.recent_limit = recent_limit
+        self.resync_interval = resync_interval
+        self.heartbeat_seconds = heartbeat_seconds
+        if listen_notify is None:
+            listen_notify = os.environ.get("DASHBOARD_LISTEN_NOTIFY", "1") != "0"
+        self.listen_notify = listen_notify
+        
+        self.version = 0
+        self.kpis = {}
+        self.recent = []
+        self.names = {"vessels": {}, "ports": {}, "cargo_types": {}}
+        self._record_totals = {"cost": 0.0, "delay": 0.0, "count": 0}
+        self._subscribers = set()
+        self._inbox = queue.Queue()
+        self._lock = threading.RLock()
+        self._worker = None
+        self._listener = None
+        self._notify = None
+        self._last_sync = 0.0
+        self.stats = {"commits": 0, "deltas": 0, "resyncs": 0, "dropped_subscribers": 0}
+    
+    def install(self):
+        event.listen(self.db.session, "after_flush", self._after_flush)
+        event.listen(self.db.session, "after_commit", self._after_commit)
+        event.listen(self.db.session, "after_rollback", self._after_rollback)
+        return self
+    
+    def _after_flush(self, session, flush_context):
+        changes = session.info.setdefault("dashboard_changes", [])
+        for obj in session.new:
+            if isinstance(obj, self.Voyage):
+                changes.append(["voyage", _voyage_row(obj), True])
+            elif isinstance(obj, self.DemurrageRecord):
+                changes.append(["record", obj.cost or 0.0, obj.delay_hours or 0.0, 1])
+            elif isinstance(obj, self.Vessel):
+                changes.append(["fleet", 1])
+            elif isinstance(obj, (self.Port, self.CargoType)):
+                changes.append(["names"])
+        for obj in session.dirty:
+            if not session.is_modified(obj):
+                continue
+            if isinstance(obj, self.Voyage):
+                changes.append(["voyage", _voyage_row(obj), False])
+            elif isinstance(obj, self.DemurrageRecord):
+                state = inspect(obj)
+                changes.append(["record", (obj.cost or 0.0) - (_previous(state, "cost", obj.cost) or 0.0),
+                                (obj.delay_hours or 0.0) - (_previous(state, "delay_hours", obj.delay_hours) or 0.0), 0])
+            elif isinstance(obj, (self.Vessel, self.Port, self.CargoType)):
+                changes.append(["names"])
+        for obj in session.deleted:
+            if isinstance(obj, self.Voyage):
+                changes.append(["voyage_deleted", obj.id])
+            elif isinstance(obj, self.DemurrageRecord):
+                changes.append(["record", -(obj.cost or 0.0), -(obj.delay_hours or 0.0), -1])
+            elif isinstance(obj, self.Vessel):
+                changes.append(["fleet", -1])
+    
+    def _after_commit(self, session):
+        changes = session.info.pop("dashboard_changes", None)
+        if changes:
+            self.publish(changes)
+    
+    def _after_rollback(self, session):
+        session.info.pop("dashboard_changes", None)
+    
+    @property
+    def notify_enabled(self):
+        if self._notify is None:
+            dialect = self.db.engine.dialect
+            self._notify = self.listen_notify and dialect.name == "postgresql" and dialect.driver == "psycopg2"
+        return self._notify
+    
+    def publish(self, changes):
+        self.stats["commits"] += 1
+        if self.notify_enabled:
+            # Every process sends, even with no screens attached, so workers that do have
+            # subscribers see writes handled elsewhere; they receive their own writes back too.
+            payload = json.dumps(changes, default=str)
+            if len(payload) > MAX_NOTIFY_PAYLOAD:
+                payload = json.dumps([["resync"]])
+            try:
+                with self.db.engine.begin() as connection:
+                    connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                       {"channel": NOTIFY_CHANNEL, "payload": payload})
+                return
+            except Exception:
+                self.app.logger.exception("Dashboard change notification failed; applying locally")
+        if self._worker is not None:
+            # Before the first subscriber there is no state to patch; it is built by a resync.
+            self._inbox.put(changes)
+    
+    def subscribe(self):
+        self._ensure_started()
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers.add(subscription)
+            subscription.events.put(("snapshot", self._snapshot_payload()))
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+    
+    def stream(self, subscription):
+        try:
+            while not subscription.overflowed:
+                try:
+                    name, payload = subscription.events.get(timeout=self.heartbeat_seconds)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {payload['version']}\nevent: {name}\ndata: {json.dumps(payload)}\n\n"
+            # Too far behind to patch incrementally; the browser reconnects and gets a fresh snapshot.
+            yield "event: resync\ndata: {}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+    
+    def _ensure_started(self):
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            with self.app.app_context():
+                if self.notify_enabled:
+                    self._start_listener()
+                self.resync(broadcast=False)
+            self._worker = threading.Thread(target=self._run, name="dashboard-feed", daemon=True)
+            self._worker.start()
+    
+    def _start_listener(self):
+        connection = self.db.engine.raw_connection()
+        driver_connection = connection.driver_connection
+        driver_connection.autocommit = True
+        with driver_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        self._listener = threading.Thread(target=self._listen, args=(connection, driver_connection),
+                                          name="dashboard-listen", daemon=True)
+        self._listener.start()
+    
+    def _listen(self, connection, driver_connection):
+        try:
+            while True:
+                if select_module.select([driver_connection], [], [], self.heartbeat_seconds) == ([], [], []):
+                    continue
+                driver_connection.poll()
+                while driver_connection.notifies:
+                    notification = driver_connection.notifies.pop(0)
+                    self._inbox.put(json.loads(notification.payload))
+        except Exception:
+            self.app.logger.exception("Dashboard change listener stopped; falling back to local changes")
+            self._notify = False
+            self._inbox.put([["resync"]])
+            connection.invalidate()
+    
+    def _run(self):
+        while True:
+            try:
+                changes = self._inbox.get(timeout=self.heartbeat_seconds)
+            except queue.Empty:
+                changes = None
+            with self.app.app_context(), self._lock:
+                try:
+                    if changes is None:
+                        if self._subscribers and time.monotonic() - self._last_sync >= self.resync_interval:
+                            self.resync()
+                    else:
+                        self.apply(changes)
+                except Exception:
+                    self.app.logger.exception("Dashboard feed update failed")
+                finally:
+                    self.db.session.remove()
+    
+    def _load_names(self):
+        session = self.db.session
+        self.names = {
+            "vessels": dict(session.query(self.Vessel.id, self.Vessel.name).all()),
+            "ports": dict(session.query(self.Port.id, self.Port.code).all()),
+            "cargo_types": dict(session.query(self.CargoType.id, self.CargoType.name).all()),
+        }
+    
+    def _display_row(self, row):
+        return {
+            **row,
+            "vessel_name": self.names["vessels"].get(row["vessel_id"]),
+            "origin_code": self.names["ports"].get(row["origin_port_id"]),
+            "destination_code": self.names["ports"].get(row["destination_port_id"]),
+            "cargo_name": self.names["cargo_types"].get(row["cargo_type_id"]),
+        }
+    
+    def resync(self, broadcast=True):
+        session = self.db.session
+        Record = self.DemurrageRecord
+        cost, delay, count = session.query(func.coalesce(func.sum(Record.cost), 0),
+                                           func.coalesce(func.sum(Record.delay_hours), 0),
+                                           func.count(Record.id)).one()
+        self._record_totals = {"cost": float(cost), "delay": float(delay), "count": int(count)}
+        self._load_names()
+        voyages = session.execute(
+            select(*(self.Voyage.__table__.c[name] for name in VOYAGE_FIELDS))
+            .order_by(self.Voyage.created_at.desc()).limit(self.recent_limit)
+        ).all()
+        self.recent = [self._display_row(_voyage_row(v)) for v in voyages]
+        self.kpis = {
+            "total_voyages": session.query(func.count(self.Voyage.id)).scalar(),
+            "fleet_size": len(self.names["vessels"]),
+        }
+        self._refresh_record_kpis()
+        self._last_sync = time.monotonic()
+        self.stats["resyncs"] += 1
+        if broadcast:
+            self._broadcast("snapshot", self._snapshot_payload())
+    
+    def _refresh_record_kpis(self):
+        totals = self._record_totals
+        self.kpis["total_demurrage"] = round(totals["cost"], 2)
+        self.kpis["avg_delay"] = round(totals["delay"] / totals["count"], 1) if totals["count"] else 0
+    
+    def apply(self, changes):
+        if any(change[0] in ("resync", "voyage_deleted") for change in changes):
+            # A removed voyage can pull an older one into the recent list; reload instead of guessing.
+            self.resync()
+            return
+        
+        upserted, removed = {}, []
+        for change in changes:
+            kind = change[0]
+            if kind == "record":
+                self._record_totals["cost"] += change[1]
+                self._record_totals["delay"] += change[2]
+                self._record_totals["count"] += change[3]
+            elif kind == "fleet":
+                self.kpis["fleet_size"] += change[1]
+                self._load_names()
+            elif kind == "names":
+                self._load_names()
+            elif kind == "voyage":
+                row, is_new = change[1], change[2]
+                if is_new:
+                    self.kpis["total_voyages"] += 1
+                    if row["vessel_id"] not in self.names["vessels"]:
+                        self._load_names()
+                existing = next((i for i, r in enumerate(self.recent) if r["id"] == row["id"]), None)
+                if existing is not None:
+                    self.recent[existing] = self._display_row(row)
+                elif is_new or len(self.recent) < self.recent_limit or \
+                        (row["created_at"] or "") > (self.recent[-1]["created_at"] or ""):
+                    self.recent.append(self._display_row(row))
+                else:
+                    continue
+                upserted[row["id"]] = row
+        self._refresh_record_kpis()
+        
+        self.recent.sort(key=lambda r: r["created_at"] or "", reverse=True)
+        for row in self.recent[self.recent_limit:]:
+            removed.append(row["id"])
+            upserted.pop(row["id"], None)
+        del self.recent[self.recent_limit:]
+        
+        self.version += 1
+        self.stats["deltas"] += 1
+        self._broadcast("delta", {
+            "version": self.version,
+            "kpis": self.kpis,
+            "voyages": {
+                "upsert": [r for r in self.recent if r["id"] in upserted],
+                "remove": removed,
+                "order": [r["id"] for r in self.recent],
+            },
+        })
+    
+    def _snapshot_payload(self):
+        return {"version": self.version, "kpis": dict(self.kpis), "voyages": list(self.recent)}
+    
+    def _broadcast(self, name, payload):
+        if name == "snapshot":
+            self.version += 1
+            payload["version"] = self.version
+        with self._lock:
+            for subscription in list(self._subscribers):
+                try:
+                    subscription.events.put_nowait((name, payload))
+                except queue.Full:
+                    subscription.overflowed = True
+                    self._subscribers.discard(subscription)
+                    self.stats["dropped_subscribers"] += 1
@@ -0,0 +1,232 @@
+import http.client
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+import numpy as np
+from sqlalchemy import func, select
+
+ROUTES = {
+    "predict": ("POST", "/api/predict"),
+    "optimization": ("POST", "/api/optimization"),
+    "plan": ("POST", "/voyage/plan"),
+    "analytics": ("GET", "/analytics"),
+    "dashboard": ("GET", "/"),
+}
+
+# Roughly what a working day looks like: API clients and open dashboards dominate, planners
+# submit the occasional voyage and a few people run the heavy reports.
+DEFAULT_MIX = {"predict": 40, "optimization": 5, "plan": 10, "analytics": 10, "dashboard": 35}
+
+PERCENTILES = (50, 95, 99)
+
+# Routes that create rows on the server under test.
+WRITE_ROUTES = ("plan",)
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+def parse_mix(spec):
+    if not spec:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route {name!r}; choose from {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+        if mix[name] < 0:
+            raise ValueError(f"Weight for {name} must not be negative")
+    if not sum(mix.values()):
+        raise ValueError("The traffic mix needs at least one positive weight")
+    return mix
+
+def is_local_url(base_url):
+    return (urlsplit(base_url).hostname or "127.0.0.1") in LOCAL_HOSTS
+
+def write_routes(mix):
+    return [name for name in WRITE_ROUTES if mix.get(name)]
+
+def load_reference_ids(engine, models):
+    with engine.connect() as connection:
+        ids = {name: connection.execute(select(models[model].id)).scalars().all()
+               for name, model in (("vessel_ids", "Vessel"), ("port_ids", "Port"), ("cargo_type_ids", "CargoType"))}
+        ids["voyages"] = connection.execute(select(func.count(models['Voyage'].id))).scalar()
+    if not ids["vessel_ids"] or len(ids["port_ids"]) < 2 or not ids["cargo_type_ids"]:
+        raise ValueError("The database needs vessels, at least two ports and cargo types to generate traffic")
+    return ids
+
+class RequestFactory:
+    def __init__(self, reference, seed=0):
+        self.reference = reference
+        self.rng = random.Random(seed)
+    
+    def _voyage(self):
+        rng = self.rng
+        origin, dest = rng.sample(self.reference["port_ids"], 2)
+        eta = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=rng.randint(24, 24 * 30))
+        return {
+            "vessel_id": rng.choice(self.reference["vessel_ids"]),
+            "origin_port_id": origin,
+            "dest_port_id": dest,
+            "cargo_type_id": rng.choice(self.reference["cargo_type_ids"]),
+            "cargo_volume": round(rng.uniform(10000, 150000)),
+            "eta": eta.strftime("%Y-%m-%dT%H:%M"),
+        }
+    
+    def build(self, route):
+        method, path = ROUTES[route]
+        if route in ("predict", "optimization"):
+            return method, path, json.dumps(self._voyage()).encode(), {"Content-Type": "application/json"}
+        if route == "plan":
+            return method, path, urlencode(self._voyage()).encode(), {"Content-Type": "application/x-www-form-urlencoded"}
+        return method, path, None, {}
+
+class LoadTest:
+    def __init__(self, base_url, mix, rate, duration, concurrency=32, warmup=0.0, timeout=30.0, seed=0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        url = urlsplit(base_url)
+        self.base_url = base_url
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.mix = mix
+        self.rate = rate
+        self.duration = duration
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.timeout = timeout
+        self.seed = seed
+        self._local = threading.local()
+        self._samples = []
+        self._started_at = None
+    
+    def schedule(self):
+        # Open-loop Poisson arrivals: the offered load does not back off when the server slows down.
+        rng = np.random.default_rng(self.seed)
+        count = int(self.rate * (self.warmup + self.duration) * 1.2) + 16
+        offsets = np.cumsum(rng.exponential(1 / self.rate, count))
+        offsets = offsets[offsets < self.warmup + self.duration]
+        names = list(self.mix)
+        weights = np.array([self.mix[name] for name in names], dtype=float)
+        routes = rng.choice(len(names), size=len(offsets), p=weights / weights.sum())
+        return [(float(offset), names[route]) for offset, route in zip(offsets, routes)]
+    
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+            return connection, False
+        return connection, True
+    
+    def _send(self, route, request, scheduled):
+        method, path, body, headers = request
+        sent = time.perf_counter()
+        status, error = None, None
+        while True:
+            connection, reused = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                if response.will_close:
+                    connection.close()
+                    self._local.connection = None
+                break
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                self._local.connection = None
+                # The server may drop an idle keep-alive connection; only a fresh one counts as a failure.
+                if not reused:
+                    error = type(e).__name__
+                    break
+        finished = time.perf_counter()
+        # Measured from the scheduled send time so a backed-up client cannot hide server slowness.
+        self._samples.append((route, scheduled, (finished - scheduled) * 1000, (sent - scheduled) * 1000, status, error))
+    
+    def run(self, factory, progress=None):
+        plan = self.schedule()
+        requests = [factory.build(route) for _, route in plan]
+        self._samples = []
+        self._started_at = datetime.utcnow().replace(microsecond=0)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="loadtest") as executor:
+            for index, ((offset, route), request) in enumerate(zip(plan, requests)):
+                scheduled = started + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._send, route, request, scheduled)
+                if progress is not None and index % 100 == 0:
+                    progress(index, len(plan))
+        elapsed = time.perf_counter() - started
+        return self.report(started, elapsed)
+    
+    def report(self, started, elapsed):
+        measured_from = started + self.warmup
+        samples = [s for s in self._samples if s[1] >= measured_from]
+        window = max(elapsed - self.warmup, 1e-9)
+        
+        routes = {}
+        for name in self.mix:
+            routes[name] = _route_summary([s for s in samples if s[0] == name], window)
+        lags = np.array([s[3] for s in samples]) if samples else np.zeros(1)
+        return {
+            "started_at": self._started_at.isoformat(),
+            "revision": _git_revision(),
+            "config": {"base_url": self.base_url, "mix": self.mix, "target_rps": self.rate, "duration_seconds": self.duration,
+                       "warmup_seconds": self.warmup, "concurrency": self.concurrency, "seed": self.seed},
+            "overall": _route_summary(samples, window),
+            # Time requests waited for a free client thread; if high, raise --concurrency before trusting latencies.
+            "client_send_lag_ms": {"p99": round(float(np.percentile(lags, 99)), 1), "max": round(float(lags.max()), 1)},
+            "routes": routes,
+        }
+
+def _route_summary(samples, window):
+    latencies = np.array([s[2] for s in samples if s[5] is None and s[4] < 400])
+    statuses = {}
+    for s in samples:
+        key = s[5] or str(s[4])
+        statuses[key] = statuses.get(key, 0) + 1
+    summary = {
+        "requests": len(samples),
+        "errors": len(samples) - len(latencies),
+        "throughput_rps": round(len(latencies) / window, 2),
+        "statuses": statuses,
+    }
+    if len(latencies):
+        summary["latency_ms"] = {
+            "mean": round(float(latencies.mean()), 1),
+            **{f"p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))},
+            "max": round(float(latencies.max()), 1),
+        }
+    return summary
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def compare_reports(current, baseline):
+    rows = []
+    for name in ["overall"] + [route for route in current["routes"] if route in baseline["routes"]]:
+        now = current["overall"] if name == "overall" else current["routes"][name]
+        then = baseline["overall"] if name == "overall" else baseline["routes"][name]
+        row = {"route": name}
+        for metric in ["throughput_rps"] + [f"p{p}" for p in PERCENTILES]:
+            if metric == "throughput_rps":
+                old, new = then.get(metric), now.get(metric)
+            else:
+                old, new = then.get("latency_ms", {}).get(metric), now.get("latency_ms", {}).get(metric)
+            row[metric] = {"baseline": old, "current": new,
+                           "change_pct": round((new / old - 1) * 100, 1) if old and new is not None else None}
+        rows.append(row)
+    return rows
@@ -0,0 +1,178 @@
+from datetime import datetime
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, inspect, text
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def _create_index(connection, metadata, table_name, index_name):
+    table = metadata.tables[table_name]
+    for index in table.indexes:
+        if index.name == index_name:
+            index.create(bind=connection, checkfirst=True)
+            return
+    raise KeyError(f"Index {index_name} is not declared on {table_name}")
+
+def _baseline_metadata():
+    # The schema as it stood before versioned migrations. Later changes belong in their own
+    # migrations, so this must not follow the current models.
+    metadata = MetaData()
+    Table("vessel_types", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("name", String(100), nullable=False),
+          Column("category", String(50)),
+          Column("typical_dwt_min", Float),
+          Column("typical_dwt_max", Float),
+          Column("loading_rate_factor", Float))
+    Table("vessels", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("name", String(200), nullable=False),
+          Column("imo_number", String(20), unique=True),
+          Column("vessel_type_id", Integer, ForeignKey("vessel_types.id")),
+          Column("dwt", Float),
+          Column("loa", Float),
+          Column("beam", Float),
+          Column("draft", Float),
+          Column("demurrage_rate", Float),
+          Column("created_at", DateTime))
+    Table("ports", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("name", String(200), nullable=False),
+          Column("code", String(10)),
+          Column("country", String(100)),
+          Column("latitude", Float),
+          Column("longitude", Float),
+          Column("avg_congestion_level", Float),
+          Column("avg_berth_wait_hours", Float),
+          Column("num_berths", Integer),
+          Column("max_draft", Float),
+          Column("cargo_handling_rate", Float),
+          Column("weather_delay_factor", Float))
+    Table("cargo_types", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("name", String(100), nullable=False),
+          Column("category", String(50)),
+          Column("handling_complexity", Float),
+          Column("requires_special_equipment", Boolean),
+          Column("is_hazardous", Boolean),
+          Column("typical_loading_rate", Float))
+    Table("voyages", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("vessel_id", Integer, ForeignKey("vessels.id"), nullable=False),
+          Column("origin_port_id", Integer, ForeignKey("ports.id")),
+          Column("destination_port_id", Integer, ForeignKey("ports.id"), nullable=False),
+          Column("cargo_type_id", Integer, ForeignKey("cargo_types.id")),
+          Column("cargo_volume", Float),
+          Column("eta", DateTime),
+          Column("ata", DateTime),
+          Column("berthing_time", DateTime),
+          Column("departure_time", DateTime),
+          Column("predicted_delay_hours", Float),
+          Column("predicted_demurrage_cost", Float),
+          Column("actual_delay_hours", Float),
+          Column("actual_demurrage_cost", Float),
+          Column("status", String(50)),
+          Column("created_at", DateTime))
+    Table("demurrage_records", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("voyage_id", Integer, ForeignKey("voyages.id"), nullable=False),
+          Column("delay_hours", Float, nullable=False),
+          Column("cost", Float, nullable=False),
+          Column("cause", String(200)),
+          Column("cause_category", String(50)),
+          Column("recorded_at", DateTime),
+          Column("notes", Text))
+    Table("port_capabilities", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("port_id", Integer, ForeignKey("ports.id"), nullable=False),
+          Column("cargo_type_id", Integer, ForeignKey("cargo_types.id"), nullable=False),
+          Column("efficiency_rating", Float),
+          Column("has_specialized_equipment", Boolean))
+    Table("vessel_cargo_compatibility", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("vessel_type_id", Integer, ForeignKey("vessel_types.id"), nullable=False),
+          Column("cargo_type_id", Integer, ForeignKey("cargo_types.id"), nullable=False),
+          Column("compatibility_score", Float))
+    return metadata
+
+@migration(1, "Baseline schema")
+def _baseline_schema(db, connection):
+    _baseline_metadata().create_all(bind=connection)
+
+@migration(2, "Composite indexes for voyage and demurrage access paths")
+def _access_path_indexes(db, connection):
+    _create_index(connection, db.metadata, "voyages", "ix_voyages_destination_port_id_created_at")
+    _create_index(connection, db.metadata, "voyages", "ix_voyages_vessel_id_created_at")
+    _create_index(connection, db.metadata, "voyages", "ix_voyages_created_at")
+    _create_index(connection, db.metadata, "demurrage_records", "ix_demurrage_records_voyage_id_recorded_at")
+    _create_index(connection, db.metadata, "demurrage_records", "ix_demurrage_records_recorded_at")
+
+@migration(3, "Index voyages by cargo type for dependency re-scoring")
+def _cargo_type_index(db, connection):
+    _create_index(connection, db.metadata, "voyages", "ix_voyages_cargo_type_id")
+
+@migration(4, "Port congestion observation time series")
+def _port_congestion_observations(db, connection):
+    db.metadata.tables["port_congestion_observations"].create(bind=connection, checkfirst=True)
+
+@migration(5, "Shared background job state")
+def _background_jobs(db, connection):
+    db.metadata.tables["background_jobs"].create(bind=connection, checkfirst=True)
+    db.metadata.tables["background_job_partials"].create(bind=connection, checkfirst=True)
+
+@migration(6, "Persisted simulation wait-time profiles")
+def _port_wait_profiles(db, connection):
+    db.metadata.tables["port_wait_profiles"].create(bind=connection, checkfirst=True)
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+def applied_versions(connection):
+    if not inspect(connection).has_table("schema_migrations"):
+        return set()
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+def pending_migrations(connection):
+    applied = applied_versions(connection)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+def upgrade_database(db, target=None):
+    applied = []
+    with db.engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+        _ensure_version_table(connection)
+        
+        for version, description, fn in pending_migrations(connection):
+            if target is not None and version > target:
+                break
+            fn(db, connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {"version": version, "description": description, "applied_at": datetime.utcnow()}
+            )
+            applied.append((version, description))
+    return applied
+
+def migration_status(db):
+    with db.engine.connect() as connection:
+        applied = applied_versions(connection)
+    return [
+        {"version": version, "description": description, "applied": version in applied}
+        for version, description, _ in MIGRATIONS
+    ]
+
+@migration(7, "Index congestion observations by recording time for overlapping refreshes")
+def _congestion_recorded_at_index(db, connection):
+    _create_index(connection, db.metadata, "port_congestion_observations", "ix_port_congestion_observations_recorded_at")
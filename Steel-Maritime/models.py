@@ -85,6 +85,13 @@ def init_models(db):
         created_at = db.Column(db.DateTime, default=datetime.utcnow)
         
         demurrage_records = db.relationship("DemurrageRecord", backref="voyage", lazy=True)
+        
+        __table_args__ = (
+            db.Index("ix_voyages_destination_port_id_created_at", "destination_port_id", "created_at"),
+            db.Index("ix_voyages_vessel_id_created_at", "vessel_id", "created_at"),
+            db.Index("ix_voyages_created_at", "created_at"),
+            db.Index("ix_voyages_cargo_type_id", "cargo_type_id"),
+        )
 
     class DemurrageRecord(db.Model):
         __tablename__ = "demurrage_records"
@@ -97,6 +104,11 @@ def init_models(db):
         cause_category = db.Column(db.String(50))
         recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
         notes = db.Column(db.Text)
+        
+        __table_args__ = (
+            db.Index("ix_demurrage_records_voyage_id_recorded_at", "voyage_id", "recorded_at"),
+            db.Index("ix_demurrage_records_recorded_at", "recorded_at"),
+        )
 
     class PortCapability(db.Model):
         __tablename__ = "port_capabilities"
@@ -120,6 +132,64 @@ def init_models(db):
         
         vessel_type = db.relationship("VesselType", backref="cargo_compatibilities")
         cargo_type = db.relationship("CargoType", backref="vessel_compatibilities")
+
+    class PortCongestionObservation(db.Model):
+        __tablename__ = "port_congestion_observations"
+        
+        id = db.Column(db.Integer, primary_key=True)
+        port_id = db.Column(db.Integer, db.ForeignKey("ports.id"), nullable=False)
+        voyage_id = db.Column(db.Integer, db.ForeignKey("voyages.id"))
+        observed_at = db.Column(db.DateTime, nullable=False)
+        wait_hours = db.Column(db.Float)
+        congestion_level = db.Column(db.Float)
+        source = db.Column(db.String(50), default="snapshot")
+        recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+        
+        __table_args__ = (
+            db.Index("ix_port_congestion_observations_port_id_observed_at", "port_id", "observed_at"),
+            db.Index("ix_port_congestion_observations_voyage_id", "voyage_id"),
+            db.Index("ix_port_congestion_observations_recorded_at", "recorded_at"),
+        )
+
+    class BackgroundJob(db.Model):
+        __tablename__ = "background_jobs"
+        
+        id = db.Column(db.String(32), primary_key=True)
+        kind = db.Column(db.String(50), nullable=False)
+        params = db.Column(db.Text)
+        status = db.Column(db.String(20), nullable=False, default="queued")
+        cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+        done = db.Column(db.Integer, nullable=False, default=0)
+        total = db.Column(db.Integer)
+        message = db.Column(db.String(500))
+        result = db.Column(db.Text)
+        error = db.Column(db.Text)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+        started_at = db.Column(db.DateTime)
+        finished_at = db.Column(db.DateTime)
+        heartbeat_at = db.Column(db.DateTime)
+        
+        __table_args__ = (
+            db.Index("ix_background_jobs_status_created_at", "status", "created_at"),
+        )
+
+    class BackgroundJobPartial(db.Model):
+        __tablename__ = "background_job_partials"
+        
+        id = db.Column(db.Integer, primary_key=True)
+        job_id = db.Column(db.String(32), db.ForeignKey("background_jobs.id"), nullable=False)
+        data = db.Column(db.Text, nullable=False)
+        
+        __table_args__ = (
+            db.Index("ix_background_job_partials_job_id_id", "job_id", "id"),
+        )
+
+    class PortWaitProfile(db.Model):
+        __tablename__ = "port_wait_profiles"
+        
+        port_id = db.Column(db.Integer, db.ForeignKey("ports.id"), primary_key=True)
+        profile = db.Column(db.Text, nullable=False)
+        updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     return {
         'VesselType': VesselType,
@@ -129,5 +199,9 @@ def init_models(db):
         'Voyage': Voyage,
         'DemurrageRecord': DemurrageRecord,
         'PortCapability': PortCapability,
-        'VesselCargoCompatibility': VesselCargoCompatibility
+        'VesselCargoCompatibility': VesselCargoCompatibility,
+        'PortCongestionObservation': PortCongestionObservation,
+        'BackgroundJob': BackgroundJob,
+        'BackgroundJobPartial': BackgroundJobPartial,
+        'PortWaitProfile': PortWaitProfile
     }
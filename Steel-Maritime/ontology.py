@@ -9,6 +9,7 @@ class MaritimeOntology:
                 "category": "dry_bulk",
                 "subtypes": ["Handysize", "Handymax", "Supramax", "Panamax", "Capesize", "VLOC"],
                 "compatible_cargo": ["iron_ore", "coal", "grain", "bauxite", "phosphate", "cement"],
+                "service_speed_knots": 13.5,
                 "loading_characteristics": {
                     "typical_rate_factor": 1.0,
                     "weather_sensitivity": "moderate",
@@ -20,6 +21,7 @@ class MaritimeOntology:
                 "category": "liquid",
                 "subtypes": ["Product Tanker", "Aframax", "Suezmax", "VLCC", "ULCC"],
                 "compatible_cargo": ["crude_oil", "refined_products", "chemicals", "lng", "lpg"],
+                "service_speed_knots": 14.0,
                 "loading_characteristics": {
                     "typical_rate_factor": 1.2,
                     "weather_sensitivity": "low",
@@ -31,6 +33,7 @@ class MaritimeOntology:
                 "category": "containerized",
                 "subtypes": ["Feeder", "Panamax", "Post-Panamax", "New Panamax", "Ultra Large"],
                 "compatible_cargo": ["container", "reefer_container", "special_container"],
+                "service_speed_knots": 18.0,
                 "loading_characteristics": {
                     "typical_rate_factor": 0.8,
                     "weather_sensitivity": "moderate",
@@ -42,6 +45,7 @@ class MaritimeOntology:
                 "category": "break_bulk",
                 "subtypes": ["Multipurpose", "Heavy Lift", "Ro-Ro"],
                 "compatible_cargo": ["project_cargo", "steel", "machinery", "vehicles", "general"],
+                "service_speed_knots": 12.5,
                 "loading_characteristics": {
                     "typical_rate_factor": 0.6,
                     "weather_sensitivity": "high",
@@ -274,6 +278,12 @@ class MaritimeOntology:
                     })
         return relationships
     
+    def get_service_speed(self, vessel_type_name, default=13.0):
+        for vessel_data in self.vessel_types.values():
+            if vessel_type_name and vessel_data["name"].lower() == vessel_type_name.lower():
+                return vessel_data["service_speed_knots"]
+        return default
+    
     def get_compatibility_score(self, vessel_type_key, cargo_type_key):
         if vessel_type_key not in self.vessel_types:
             return 0.5
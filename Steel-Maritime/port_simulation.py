@@ -0,0 +1,228 @@
+import heapq
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+ARRIVAL, DEPARTURE, WEATHER_START, WEATHER_END = 0, 1, 2, 3
+
+HOURS_PER_DAY = 24.0
+MAX_HORIZON_DAYS = 3650
+
+# Accepted ranges for scenario overrides. The berth cap and the berthing overhead floor also bound
+# the arrival rate, and with it the size of the arrays simulate_port allocates.
+OVERRIDE_LIMITS = {
+    "num_berths": (1, 100),
+    "cargo_handling_rate": (1.0, 1e6),
+    "avg_congestion_level": (0.0, 1.0),
+    "weather_delay_factor": (0.0, 10.0),
+    "mean_cargo_volume": (1.0, 1e7),
+    "berthing_overhead_hours": (0.5, 1000.0),
+}
+COMPLEXITY_LIMITS = (0.1, 10.0)
+MAX_COMPLEXITIES = 100
+
+def port_parameters(port, cargo_types, mean_cargo_volume=60000, berthing_overhead_hours=2.0):
+    complexities = [c.handling_complexity or 1.0 for c in cargo_types] or [1.0]
+    return {
+        "port_id": port.id,
+        "name": port.name,
+        "num_berths": max(1, port.num_berths or 1),
+        "cargo_handling_rate": port.cargo_handling_rate or 5000,
+        "avg_congestion_level": port.avg_congestion_level if port.avg_congestion_level is not None else 0.5,
+        "weather_delay_factor": port.weather_delay_factor or 1.0,
+        "complexities": complexities,
+        "mean_cargo_volume": mean_cargo_volume,
+        "berthing_overhead_hours": berthing_overhead_hours,
+    }
+
+def _month_of(hours):
+    return (np.asarray(hours) // (HOURS_PER_DAY * 30.44)).astype(int) % 12 + 1
+
+def _generate_weather(rng, params, horizon_hours, storms_per_month=1.0, mean_storm_hours=10.0):
+    factor = params["weather_delay_factor"]
+    expected = storms_per_month * factor * horizon_hours / (HOURS_PER_DAY * 30.44)
+    starts = np.sort(rng.uniform(0, horizon_hours, rng.poisson(expected * 1.5)))
+    months = _month_of(starts)
+    seasonal = np.where(np.isin(months, [12, 1, 2]), 1.4, np.where(np.isin(months, [6, 7, 8]), 0.8, 1.0))
+    starts = starts[rng.uniform(0, 1.5, len(starts)) < seasonal]
+    durations = rng.exponential(mean_storm_hours * factor, len(starts))
+    
+    windows = []
+    for start, duration in zip(starts, durations):
+        end = start + duration
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    return windows
+
+def simulate_port(params, horizon_days=365, seed=0, service_cv=0.3):
+    rng = np.random.default_rng(seed)
+    horizon_hours = horizon_days * HOURS_PER_DAY
+    num_berths = params["num_berths"]
+    
+    complexity = np.mean(params["complexities"])
+    mean_service = (params["mean_cargo_volume"] / params["cargo_handling_rate"] * complexity
+                    + params["berthing_overhead_hours"])
+    utilization = min(0.98, max(0.05, params["avg_congestion_level"]))
+    arrival_rate = utilization * num_berths / mean_service
+    
+    inter_arrivals = rng.exponential(1 / arrival_rate, int(arrival_rate * horizon_hours * 1.2) + 16)
+    arrivals = np.cumsum(inter_arrivals)
+    arrivals = arrivals[arrivals < horizon_hours]
+    
+    sigma = np.sqrt(np.log(1 + service_cv ** 2))
+    volumes = rng.lognormal(np.log(params["mean_cargo_volume"]) - sigma ** 2 / 2, sigma, len(arrivals))
+    complexities = rng.choice(params["complexities"], len(arrivals))
+    services = volumes / params["cargo_handling_rate"] * complexities + params["berthing_overhead_hours"]
+    
+    events = [(t, ARRIVAL, i) for i, t in enumerate(arrivals.tolist())]
+    for start, end in _generate_weather(rng, params, horizon_hours):
+        events.append((start, WEATHER_START, 0))
+        events.append((end, WEATHER_END, 0))
+    heapq.heapify(events)
+    
+    services = services.tolist()
+    arrival_times = arrivals.tolist()
+    waits = np.zeros(len(arrivals))
+    queue = []
+    queue_head = 0
+    busy = {}
+    generation = [0] * num_berths
+    idle = list(range(num_berths))
+    weather_down = False
+    weather_started = 0.0
+    busy_hours = 0.0
+    downtime_hours = 0.0
+    
+    def start_service(now, vessel):
+        berth = idle.pop()
+        waits[vessel] = now - arrival_times[vessel]
+        busy[berth] = [vessel, now + services[vessel]]
+        heapq.heappush(events, (now + services[vessel], DEPARTURE, (berth, generation[berth])))
+    
+    while events:
+        now, kind, payload = heapq.heappop(events)
+        
+        if kind == ARRIVAL:
+            queue.append(payload)
+        elif kind == DEPARTURE:
+            berth, gen = payload
+            if gen != generation[berth] or berth not in busy:
+                continue
+            vessel, _ = busy.pop(berth)
+            busy_hours += services[vessel]
+            idle.append(berth)
+        elif kind == WEATHER_START:
+            weather_down = True
+            weather_started = now
+            for berth in busy:
+                generation[berth] += 1
+        else:
+            weather_down = False
+            paused = now - weather_started
+            downtime_hours += paused
+            for berth, entry in busy.items():
+                entry[1] += paused
+                heapq.heappush(events, (entry[1], DEPARTURE, (berth, generation[berth])))
+        
+        if not weather_down:
+            while idle and queue_head < len(queue):
+                start_service(now, queue[queue_head])
+                queue_head += 1
+    
+    return summarize_waits(params, waits[:queue_head], busy_hours, downtime_hours, horizon_hours, len(arrivals))
+
+def summarize_waits(params, waits, busy_hours, downtime_hours, horizon_hours, arrivals):
+    if len(waits) == 0:
+        waits = np.zeros(1)
+    percentiles = np.percentile(waits, [50, 90, 95, 99])
+    return {
+        "port_id": params["port_id"],
+        "port": params["name"],
+        "arrivals": int(arrivals),
+        "mean_wait_hours": round(float(waits.mean()), 2),
+        "p50_wait_hours": round(float(percentiles[0]), 2),
+        "p90_wait_hours": round(float(percentiles[1]), 2),
+        "p95_wait_hours": round(float(percentiles[2]), 2),
+        "p99_wait_hours": round(float(percentiles[3]), 2),
+        "prob_wait": round(float((waits > 0.01).mean()), 4),
+        "berth_utilization": round(busy_hours / (horizon_hours * params["num_berths"]), 4),
+        "weather_downtime_hours": round(downtime_hours, 1),
+    }
+
+def _check_number(name, value, low, high, integer=False):
+    if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+        raise ValueError(f"{name} must be {'an integer' if integer else 'a number'}")
+    if not (math.isfinite(value) and low <= value <= high):
+        raise ValueError(f"{name} must be between {low:g} and {high:g}")
+
+def validate_scenarios(scenarios):
+    if scenarios is None:
+        return
+    if not isinstance(scenarios, list):
+        raise ValueError("scenarios must be a list")
+    for index, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ValueError(f"scenario {index} must be an object")
+        if not isinstance(scenario.get("name", ""), str):
+            raise ValueError(f"scenario {index} name must be a string")
+        if "seed" in scenario and (isinstance(scenario["seed"], bool) or not isinstance(scenario["seed"], int)):
+            raise ValueError(f"scenario {index} seed must be an integer")
+        overrides = scenario.get("overrides", {})
+        if not isinstance(overrides, dict):
+            raise ValueError(f"scenario {index} overrides must map port ids to objects")
+        for port_id, values in overrides.items():
+            try:
+                int(port_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"scenario {index} override key {port_id!r} is not a port id")
+            if not isinstance(values, dict):
+                raise ValueError(f"scenario {index} overrides for port {port_id} must be an object")
+            for key, value in values.items():
+                name = f"scenario {index} port {port_id} {key}"
+                if key == "complexities":
+                    if not isinstance(value, list) or not 1 <= len(value) <= MAX_COMPLEXITIES:
+                        raise ValueError(f"{name} must be a list of 1 to {MAX_COMPLEXITIES} numbers")
+                    for item in value:
+                        _check_number(name, item, *COMPLEXITY_LIMITS)
+                elif key in OVERRIDE_LIMITS:
+                    _check_number(name, value, *OVERRIDE_LIMITS[key], integer=key == "num_berths")
+                else:
+                    raise ValueError(f"{name} is not a simulation parameter; choose from "
+                                     f"{', '.join(sorted([*OVERRIDE_LIMITS, 'complexities']))}")
+
+def _apply_overrides(params, overrides):
+    params = dict(params)
+    params.update(overrides.get(params["port_id"], overrides.get(str(params["port_id"]), {})))
+    return params
+
+def _run_task(task):
+    scenario_name, params, horizon_days, seed = task
+    return scenario_name, simulate_port(params, horizon_days=horizon_days, seed=seed)
+
+def simulate_scenarios(port_params, scenarios=None, horizon_days=365, workers=None, seed=0, port_indexes=None):
+    scenarios = scenarios or [{"name": "base"}]
+    tasks = []
+    for s_index, scenario in enumerate(scenarios):
+        overrides = scenario.get("overrides", {})
+        for p_index, params in enumerate(port_params):
+            tasks.append((
+                scenario.get("name", f"scenario_{s_index}"),
+                _apply_overrides(params, overrides),
+                horizon_days,
+                scenario.get("seed", seed) * 100003 + (port_indexes[p_index] if port_indexes else p_index),
+            ))
+    
+    workers = workers if workers is not None else min(len(tasks), os.cpu_count() or 1)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(_run_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        outcomes = [_run_task(task) for task in tasks]
+    
+    results = {}
+    for scenario_name, summary in outcomes:
+        results.setdefault(scenario_name, []).append(summary)
+    return results
@@ -0,0 +1,278 @@
+import csv
+import json
+import queue
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import joinedload
+from distance import haversine_nm
+from live_feed import queue_changes, voyage_change
+
+ACTIVE_STATUSES = ("planned", "in_progress")
+
+def parse_message(raw):
+    if isinstance(raw, (bytes, str)):
+        raw = json.loads(raw)
+    timestamp = raw.get("timestamp")
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    elif timestamp is not None and not isinstance(timestamp, datetime):
+        raise TypeError("timestamp must be an ISO 8601 string")
+    if isinstance(timestamp, datetime) and timestamp.tzinfo is not None:
+        # Voyage times are naive UTC; an offset report is converted, not just stripped.
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    imo = str(raw["imo"]).strip().upper()
+    return {
+        "imo": imo if imo.startswith("IMO") else f"IMO{imo}",
+        "lat": float(raw["lat"]),
+        "lon": float(raw["lon"]),
+        "sog": float(raw.get("sog") or 0),
+        "timestamp": timestamp or datetime.utcnow(),
+    }
+
+def file_source(path):
+    with open(path, newline="") as handle:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(handle)
+        else:
+            for line in handle:
+                if line.strip():
+                    yield line
+
+def queue_source(message_queue, sentinel=None):
+    while True:
+        message = message_queue.get()
+        if message is sentinel:
+            return
+        yield message
+
+class PositionFeedIngestor:
+    def __init__(self, app, db, models, predictor, ontology, batch_size=500, flush_interval=1.0,
+                 max_pending=10000, min_speed_knots=2.0, arrival_radius_nm=5.0, rescore_threshold_hours=1.0,
+                 congestion_store=None):
+        self.app = app
+        self.db = db
+        self.Vessel = models['Vessel']
+        self.Port = models['Port']
+        self.Voyage = models['Voyage']
+        self.predictor = predictor
+        self.ontology = ontology
+        self.congestion_store = congestion_store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.min_speed_knots = min_speed_knots
+        self.arrival_radius_nm = arrival_radius_nm
+        self.rescore_threshold_hours = rescore_threshold_hours
+        
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.vessel_ids = {}
+        self.last_applied = {}
+        self.stats = {"received": 0, "deduplicated": 0, "stale": 0, "updated": 0, "rescored": 0,
+                      "unknown_vessel": 0, "rejected": 0, "batches": 0, "failed_batches": 0}
+        self._stopping = threading.Event()
+        self._consumer = None
+    
+    def submit(self, raw, timeout=None):
+        try:
+            message = parse_message(raw)
+        except (KeyError, TypeError, ValueError):
+            self.stats["rejected"] += 1
+            return False
+        self.pending.put(message, timeout=timeout)
+        self.stats["received"] += 1
+        return True
+    
+    def start(self):
+        self._stopping.clear()
+        self._consumer = threading.Thread(target=self._consume, name="position-feed", daemon=True)
+        self._consumer.start()
+        return self
+    
+    def stop(self):
+        self._stopping.set()
+        if self._consumer:
+            self._consumer.join()
+    
+    def ingest(self, source):
+        self.start()
+        try:
+            for raw in source:
+                self.submit(raw)
+        finally:
+            self.stop()
+        return self.stats
+    
+    def _drain(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _consume(self):
+        while not (self._stopping.is_set() and self.pending.empty()):
+            batch = self._drain()
+            if not batch:
+                continue
+            with self.app.app_context():
+                # A failed batch is dropped rather than ending the consumer; otherwise the queue fills
+                # and submit() blocks forever.
+                try:
+                    self.apply_batch(batch)
+                except Exception:
+                    self.app.logger.exception("Position feed batch of %d messages failed", len(batch))
+                    self.db.session.rollback()
+                    self.stats["failed_batches"] += 1
+    
+    def _deduplicate(self, batch):
+        latest = {}
+        stale = 0
+        for message in batch:
+            # Reports can arrive out of order across batches; one older than what was already
+            # applied for the vessel would move its ETA backwards.
+            applied = self.last_applied.get(message["imo"])
+            if applied is not None and message["timestamp"] < applied:
+                stale += 1
+                continue
+            current = latest.get(message["imo"])
+            if current is None or message["timestamp"] >= current["timestamp"]:
+                latest[message["imo"]] = message
+        self.stats["stale"] += stale
+        self.stats["deduplicated"] += len(batch) - stale - len(latest)
+        return latest
+    
+    def _resolve_vessels(self, imos):
+        missing = [imo for imo in imos if imo not in self.vessel_ids]
+        if missing:
+            rows = self.db.session.query(self.Vessel.imo_number, self.Vessel.id)\
+                .filter(self.Vessel.imo_number.in_(missing)).all()
+            self.vessel_ids.update(dict(rows))
+        return {imo: self.vessel_ids[imo] for imo in imos if imo in self.vessel_ids}
+    
+    def _active_voyages(self, vessel_ids):
+        voyages = self.Voyage.query.options(
+            joinedload(self.Voyage.vessel),
+            joinedload(self.Voyage.destination_port),
+            joinedload(self.Voyage.cargo_type),
+        ).filter(self.Voyage.vessel_id.in_(vessel_ids), self.Voyage.status.in_(ACTIVE_STATUSES))\
+         .order_by(self.Voyage.eta).all()
+        
+        by_vessel = {}
+        for voyage in voyages:
+            by_vessel.setdefault(voyage.vessel_id, voyage)
+        return by_vessel
+    
+    def _project(self, voyage, message):
+        port = voyage.destination_port
+        if port is None or port.latitude is None or port.longitude is None:
+            return None
+        
+        distance = haversine_nm(message["lat"], message["lon"], port.latitude, port.longitude)
+        if distance <= self.arrival_radius_nm:
+            return {"status": "arrived", "eta": voyage.eta or message["timestamp"], "ata": message["timestamp"]}
+        
+        speed = max(message["sog"], self.min_speed_knots)
+        eta = message["timestamp"] + timedelta(hours=distance / speed)
+        return {"status": "in_progress", "eta": eta, "ata": None}
+    
+    def apply_batch(self, batch):
+        latest = self._deduplicate(batch)
+        vessel_ids = self._resolve_vessels(list(latest))
+        self.stats["unknown_vessel"] += len(latest) - len(vessel_ids)
+        if not vessel_ids:
+            return 0
+        
+        voyages = self._active_voyages(list(vessel_ids.values()))
+        rows = []
+        feed_changes = []
+        observations = []
+        for imo, vessel_id in vessel_ids.items():
+            voyage = voyages.get(vessel_id)
+            if voyage is None:
+                continue
+            projection = self._project(voyage, latest[imo])
+            if projection is None:
+                continue
+            
+            row = {
+                "b_id": voyage.id,
+                "b_eta": projection["eta"],
+                "b_ata": projection["ata"],
+                "b_status": projection["status"],
+                "b_delay": voyage.predicted_delay_hours,
+                "b_cost": voyage.predicted_demurrage_cost,
+            }
+            shift = abs((projection["eta"] - voyage.eta).total_seconds()) / 3600 if voyage.eta else None
+            if shift is None or shift >= self.rescore_threshold_hours or projection["status"] != voyage.status:
+                prediction = self.predictor.predict_demurrage(
+                    vessel=voyage.vessel,
+                    origin_port=None,
+                    dest_port=voyage.destination_port,
+                    cargo_type=voyage.cargo_type,
+                    cargo_volume=voyage.cargo_volume or 0,
+                    eta=projection["eta"],
+                    ontology=self.ontology
+                )
+                row["b_delay"] = prediction["predicted_delay_hours"]
+                row["b_cost"] = prediction["predicted_cost"]
+                self.stats["rescored"] += 1
+            rows.append(row)
+            
+            feed_changes.append(voyage_change(voyage, status=row["b_status"], predicted_delay_hours=row["b_delay"],
+                                              predicted_demurrage_cost=row["b_cost"]))
+            if voyage.ata is None and row["b_ata"] is not None:
+                observations.append(SimpleNamespace(id=voyage.id, destination_port_id=voyage.destination_port_id,
+                                                    ata=row["b_ata"], berthing_time=voyage.berthing_time))
+        
+        if rows:
+            table = self.Voyage.__table__
+            self.db.session.execute(
+                update(table).where(table.c.id == bindparam("b_id")).values(
+                    eta=bindparam("b_eta"),
+                    ata=func.coalesce(table.c.ata, bindparam("b_ata")),
+                    status=bindparam("b_status"),
+                    predicted_delay_hours=bindparam("b_delay"),
+                    predicted_demurrage_cost=bindparam("b_cost"),
+                ),
+                rows
+            )
+            # Core statements bypass the ORM flush events, so queue what they would have recorded
+            # for the commit hooks that feed the dashboard and the congestion series.
+            queue_changes(self.db.session, feed_changes)
+            if observations and self.congestion_store is not None:
+                self.db.session.info.setdefault("congestion_observations", []).extend(
+                    self.congestion_store.voyage_observations(observations)
+                )
+            self.db.session.commit()
+        
+        for imo in vessel_ids:
+            self.last_applied[imo] = latest[imo]["timestamp"]
+        self.stats["updated"] += len(rows)
+        self.stats["batches"] += 1
+        return len(rows)
+
+class _LineHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                self.server.ingestor.submit(line)
+
+def serve_socket(ingestor, host="127.0.0.1", port=10110):
+    server = socketserver.ThreadingTCPServer((host, port), _LineHandler)
+    server.daemon_threads = True
+    server.ingestor = ingestor
+    ingestor.start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        ingestor.stop()
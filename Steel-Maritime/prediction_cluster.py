@@ -0,0 +1,309 @@
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import select
+from backtest import load_reference_data
+from congestion_store import CongestionStore
+from wait_profiles import WaitProfileStore
+from demurrage_model import DemurragePredictor
+from ontology import MaritimeOntology
+from port_simulation import simulate_scenarios
+from prediction_result import PredictionResult
+
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+def parse_address(address):
+    if "/" in address:
+        return address
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+def _encode(value):
+    if isinstance(value, PredictionResult):
+        return {"__prediction__": value.to_state()}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot send {type(value).__name__} to a prediction worker")
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__prediction__" in obj:
+        return PredictionResult.from_state(obj["__prediction__"])
+    return obj
+
+# Messages are JSON rather than the pickles Connection.send uses, so a peer can only ever
+# hand over ids, numbers and timestamps, never objects to reconstruct.
+def send_message(connection, message):
+    connection.send_bytes(json.dumps(message, default=_encode).encode())
+
+def recv_message(connection):
+    return json.loads(connection.recv_bytes(MAX_MESSAGE_BYTES), object_hook=_decode)
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    def __init__(self, nodes, replicas=64):
+        self.nodes = list(dict.fromkeys(nodes))
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+        points = sorted((_hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+    
+    def node_for(self, key):
+        return self._owners[bisect.bisect(self._points, _hash(key)) % len(self._points)]
+    
+    def partition(self, keys):
+        groups = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(self.node_for(key), []).append(position)
+        return groups
+
+def simulate_partition(items, scenarios, horizon_days, seed, workers):
+    # Seeds follow each port's position in the full port list, so a partitioned run reproduces
+    # the single-process one exactly.
+    outcome = simulate_scenarios([params for _, params in items], scenarios=scenarios, horizon_days=horizon_days,
+                                 workers=workers, seed=seed, port_indexes=[index for index, _ in items])
+    return [{name: summaries[position] for name, summaries in outcome.items()} for position in range(len(items))]
+
+class PredictionCluster:
+    def __init__(self, nodes, authkey, timeout=120.0, replicas=64, logger=None):
+        self.ring = HashRing(nodes, replicas)
+        self.authkey = authkey
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self._connections = {node: queue.LifoQueue() for node in self.ring.nodes}
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self.ring.nodes), thread_name_prefix="prediction-rpc")
+        self.stats = {"calls": 0, "items": 0, "fallbacks": 0}
+    
+    def call(self, node, method, *args):
+        pool = self._connections[node]
+        try:
+            connection = pool.get_nowait()
+        except queue.Empty:
+            connection = Client(parse_address(node), authkey=self.authkey)
+        try:
+            send_message(connection, [method, args])
+            if not connection.poll(self.timeout):
+                raise TimeoutError(f"no reply to {method} within {self.timeout:.0f}s")
+            status, result = recv_message(connection)
+        except BaseException:
+            connection.close()
+            raise
+        pool.put(connection)
+        if status != "ok":
+            raise RuntimeError(result)
+        return result
+    
+    def fan_out(self, method, items, keys, local, *args):
+        if not items:
+            return []
+        groups = self.ring.partition(keys)
+        
+        def send(node, positions):
+            try:
+                return self.call(node, method, [items[i] for i in positions], *args)
+            except (OSError, EOFError, TimeoutError, RuntimeError, ValueError, AuthenticationError) as e:
+                return e
+        
+        futures = [(node, positions, self._executor.submit(send, node, positions))
+                   for node, positions in groups.items()]
+        results = [None] * len(items)
+        for node, positions, future in futures:
+            partial = future.result()
+            if isinstance(partial, Exception):
+                # An unreachable node must not fail the request; this process holds the full predictor.
+                self.logger.warning("Prediction worker %s failed %s (%s); serving %d items locally",
+                                    node, method, partial, len(positions))
+                self.stats["fallbacks"] += 1
+                partial = local([items[i] for i in positions], *args)
+            for position, result in zip(positions, partial):
+                results[position] = result
+        self.stats["calls"] += 1
+        self.stats["items"] += len(items)
+        return results
+    
+    def simulate(self, port_params, scenarios, horizon_days, seed, workers=None, apply_to_predictor=False):
+        per_port = self.fan_out(
+            "simulate", list(enumerate(port_params)), [params["port_id"] for params in port_params],
+            lambda batch, *args: simulate_partition(batch, *args[:4]),
+            scenarios, horizon_days, seed, workers, apply_to_predictor
+        )
+        results = {}
+        for port_results in per_port:
+            for name, summary in port_results.items():
+                results.setdefault(name, []).append(summary)
+        return results
+    
+    def status(self):
+        nodes = []
+        for node in self.ring.nodes:
+            try:
+                nodes.append({"node": node, "healthy": True, **self.call(node, "stats")})
+            except (OSError, EOFError, TimeoutError, RuntimeError, ValueError, AuthenticationError) as e:
+                nodes.append({"node": node, "healthy": False, "error": str(e)})
+        return {"nodes": nodes, **self.stats}
+
+class PredictionWorker:
+    def __init__(self, app, db, models, address, nodes, authkey, reference_ttl=30.0, replicas=64, logger=None):
+        self.app = app
+        self.db = db
+        self.models = models
+        self.address = address
+        self.ring = HashRing(nodes, replicas)
+        self.authkey = authkey
+        self.reference_ttl = reference_ttl
+        self.logger = logger or app.logger
+        self.predictor = DemurragePredictor()
+        self.ontology = MaritimeOntology()
+        self.owned_port_ids = set()
+        self.ports = {}
+        self.vessels = {}
+        self.cargo_types = {}
+        self.congestion_store = None
+        self.wait_profile_store = WaitProfileStore(db, models)
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "items": 0, "foreign_ports": 0}
+    
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._loaded_at < self.reference_ttl:
+                return
+            reference = load_reference_data(self.db.engine, self.models)
+            owned = {port_id for port_id in reference["ports"] if self.ring.node_for(port_id) == self.address}
+            if owned != self.owned_port_ids or self.congestion_store is None:
+                # Only this worker's ports are kept warm; the rest of the ring holds the others.
+                self.congestion_store = CongestionStore(self.db, self.models, port_ids=owned)
+                self.congestion_store.refresh()
+                self.predictor.set_congestion_store(self.congestion_store)
+            self.owned_port_ids = owned
+            self.ports = {port_id: port for port_id, port in reference["ports"].items() if port_id in owned}
+            self.vessels = reference["vessels"]
+            self.cargo_types = reference["cargo_types"]
+            self._loaded_at = time.monotonic()
+    
+    def _port(self, port_id):
+        port = self.ports.get(port_id)
+        if port is None and port_id is not None:
+            # Requests for ports owned elsewhere (e.g. while the ring is being resized) are still served.
+            table = self.models['Port'].__table__
+            with self.db.engine.connect() as connection:
+                row = connection.execute(select(table).where(table.c.id == port_id)).first()
+            if row is not None:
+                port = self.ports[port_id] = SimpleNamespace(**row._mapping)
+                self.stats["foreign_ports"] += 1
+        return port
+    
+    def rpc_predict(self, items):
+        return [
+            self.predictor.predict_demurrage(
+                vessel=self.vessels.get(vessel_id),
+                origin_port=self.ports.get(origin_port_id),
+                dest_port=self._port(dest_port_id),
+                cargo_type=self.cargo_types.get(cargo_type_id),
+                cargo_volume=cargo_volume,
+                eta=eta,
+                ontology=self.ontology
+            )
+            for vessel_id, origin_port_id, dest_port_id, cargo_type_id, cargo_volume, eta in items
+        ]
+    
+    def rpc_optimize(self, items):
+        return [
+            self.predictor.get_optimization_recommendations(
+                vessel=self.vessels.get(vessel_id),
+                dest_port=self._port(dest_port_id),
+                cargo_type=self.cargo_types.get(cargo_type_id),
+                cargo_volume=cargo_volume,
+                ontology=self.ontology
+            )
+            for vessel_id, dest_port_id, cargo_type_id, cargo_volume in items
+        ]
+    
+    def rpc_simulate(self, items, scenarios, horizon_days, seed, workers, apply_to_predictor):
+        results = simulate_partition(items, scenarios, horizon_days, seed, workers)
+        if apply_to_predictor and results:
+            first = next(iter(results[0]))
+            self.predictor.set_wait_time_profiles([port_results[first] for port_results in results])
+        return results
+    
+    def rpc_stats(self):
+        return {
+            "owned_ports": sorted(self.owned_port_ids),
+            "cached_ports": len(self.ports),
+            "congestion_series": len(self.congestion_store.series) if self.congestion_store else 0,
+            **self.stats,
+        }
+    
+    def _serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    method, args = recv_message(connection)
+                except (EOFError, OSError, ValueError):
+                    return
+                handler = getattr(self, f"rpc_{method}", None) if isinstance(method, str) else None
+                try:
+                    if handler is None:
+                        raise ValueError(f"unknown method {method!r}")
+                    with self.app.app_context():
+                        self.refresh()
+                        self.congestion_store.refresh_if_stale()
+                        if self.wait_profile_store.refresh_if_stale():
+                            self.predictor.set_wait_time_profiles(self.wait_profile_store.profiles)
+                        result = handler(*args)
+                    self.stats["requests"] += 1
+                    self.stats["items"] += len(args[0]) if args else 0
+                    reply = ("ok", result)
+                except Exception as e:
+                    self.logger.exception("Prediction worker %s failed %s", self.address, method)
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    send_message(connection, reply)
+                except (EOFError, OSError):
+                    return
+    
+    def serve_forever(self):
+        with self.app.app_context():
+            self.refresh(force=True)
+        with Listener(parse_address(self.address), backlog=64, authkey=self.authkey) as listener:
+            self.logger.info("Prediction worker %s serving %d ports", self.address, len(self.owned_port_ids))
+            while True:
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, OSError) as e:
+                    self.logger.warning("Rejected prediction worker connection: %s", e)
+                    continue
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+def _serve_forked(app, db, models, address, nodes, authkey):
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    PredictionWorker(app, db, models, address, nodes, authkey).serve_forever()
+
+def start_local_workers(app, db, models, nodes, authkey):
+    # Forked so each worker starts from the already-initialised application.
+    context = multiprocessing.get_context("fork")
+    processes = []
+    for address in nodes:
+        process = context.Process(target=_serve_forked, args=(app, db, models, address, nodes, authkey),
+                                  name=f"prediction-worker-{address}")
+        process.start()
+        processes.append(process)
+    return processes
@@ -0,0 +1,82 @@
+import json
+from sqlalchemy import event
+
+LARGE_TABLES = {"voyages", "demurrage_records"}
+
+ROUTE_CHECKS = [
+    ("GET", "/", None),
+    ("GET", "/analytics", None),
+    ("GET", "/fleet", None),
+    ("GET", "/ports", None),
+    ("POST", "/api/predict", {"vessel_id": 1, "origin_port_id": 1, "dest_port_id": 2,
+                              "cargo_type_id": 1, "cargo_volume": 50000}),
+]
+
+class QueryCapture:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+    
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((statement, parameters))
+    
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+    
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return False
+
+def _walk_plan(node, ancestors=()):
+    yield node, ancestors
+    for child in node.get("Plans", []):
+        yield from _walk_plan(child, ancestors + (node,))
+
+def find_sequential_scans(plan, large_tables=LARGE_TABLES):
+    violations = []
+    for node, ancestors in _walk_plan(plan):
+        if node.get("Node Type") != "Seq Scan" or node.get("Relation Name") not in large_tables:
+            continue
+        
+        reason = None
+        if node.get("Filter"):
+            reason = f"filtered by {node['Filter']}"
+        elif any(a.get("Node Type") == "Limit" for a in ancestors):
+            reason = "full scan feeding a LIMIT"
+        elif ancestors and ancestors[-1].get("Node Type") == "Nested Loop" \
+                and node.get("Parent Relationship") == "Inner":
+            reason = "rescanned as the inner side of a nested loop"
+        
+        if reason:
+            violations.append({"table": node["Relation Name"], "reason": reason})
+    return violations
+
+def explain(connection, statement, parameters):
+    result = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+def check_route_query_plans(app, db, routes=ROUTE_CHECKS):
+    if db.engine.dialect.name != "postgresql":
+        raise RuntimeError("Query plan checks require PostgreSQL EXPLAIN output")
+    
+    client = app.test_client()
+    report = []
+    for method, path, payload in routes:
+        with QueryCapture(db.engine) as capture:
+            response = client.open(path, method=method, json=payload)
+        
+        with db.engine.connect() as connection:
+            for statement, parameters in capture.statements:
+                violations = find_sequential_scans(explain(connection, statement, parameters))
+                report.append({
+                    "route": f"{method} {path}",
+                    "status_code": response.status_code,
+                    "statement": " ".join(statement.split()),
+                    "violations": violations,
+                })
+    return report
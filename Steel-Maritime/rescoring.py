@@ -0,0 +1,188 @@
+import threading
+import time
+from sqlalchemy import bindparam, event, inspect, or_, select, update
+from sqlalchemy.orm import joinedload
+from live_feed import queue_changes, voyage_change
+
+OPEN_STATUSES = ("planned", "in_progress")
+
+WATCHED_ATTRIBUTES = {
+    "Port": ("avg_congestion_level", "avg_berth_wait_hours", "weather_delay_factor",
+             "num_berths", "cargo_handling_rate", "latitude"),
+    "Vessel": ("demurrage_rate", "vessel_type_id"),
+    "CargoType": ("handling_complexity", "category", "requires_special_equipment",
+                  "is_hazardous", "typical_loading_rate"),
+    # The name decides the compiled compatibility and the service speed.
+    "VesselType": ("name",),
+}
+
+class VoyageRescorer:
+    def __init__(self, app, db, models, predictor, ontology, batch_size=500, debounce_seconds=2.0, retry_seconds=30.0):
+        self.app = app
+        self.db = db
+        self.Voyage = models['Voyage']
+        self.Vessel = models['Vessel']
+        self.watched = {models[name]: (name, attrs) for name, attrs in WATCHED_ATTRIBUTES.items()}
+        self.predictor = predictor
+        self.ontology = ontology
+        self.batch_size = batch_size
+        self.debounce_seconds = debounce_seconds
+        self.retry_seconds = retry_seconds
+        self.reference_publisher = None
+        
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {name: {} for name in WATCHED_ATTRIBUTES}
+        self._worker = None
+        self.stats = {"passes": 0, "rescored": 0, "failed_passes": 0}
+    
+    def install(self):
+        event.listen(self.db.session, "before_flush", self._before_flush)
+        event.listen(self.db.session, "after_commit", self._after_commit)
+        event.listen(self.db.session, "after_rollback", self._after_rollback)
+        return self
+    
+    def follow(self, reference_publisher):
+        # Predictions read the published reference arrays, so a change is re-scored only once the
+        # generation that includes it is out.
+        self.reference_publisher = reference_publisher
+        reference_publisher.add_listener(self._wakeup.set)
+        return self
+    
+    def _before_flush(self, session, flush_context, instances):
+        changed = session.info.setdefault("rescore_pending", [])
+        for obj in session.dirty:
+            watched = self.watched.get(type(obj))
+            if watched is None:
+                continue
+            name, attrs = watched
+            state = inspect(obj)
+            if any(state.attrs[attr].history.has_changes() for attr in attrs):
+                changed.append((name, obj.id))
+    
+    def _after_commit(self, session):
+        changed = session.info.pop("rescore_pending", None)
+        if changed:
+            self.mark_changed(changed)
+    
+    def _after_rollback(self, session):
+        session.info.pop("rescore_pending", None)
+    
+    def mark_changed(self, changed):
+        ticket = 0 if self.reference_publisher is None else self.reference_publisher.request()
+        with self._lock:
+            for name, row_id in changed:
+                self._pending[name][row_id] = ticket
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="voyage-rescorer", daemon=True)
+                self._worker.start()
+        if self.reference_publisher is None:
+            self._wakeup.set()
+    
+    def _take_pending(self):
+        published = 0 if self.reference_publisher is None else self.reference_publisher.published
+        with self._lock:
+            ready = {}
+            for name, row_ids in self._pending.items():
+                ready[name] = {row_id for row_id, ticket in row_ids.items() if ticket <= published}
+                for row_id in ready[name]:
+                    del row_ids[row_id]
+            return ready
+    
+    def _restore_pending(self, pending):
+        with self._lock:
+            for name, row_ids in pending.items():
+                for row_id in row_ids:
+                    self._pending[name][row_id] = 0
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Let a burst of edits settle so it is served by one pass.
+            while self._wakeup.wait(self.debounce_seconds):
+                self._wakeup.clear()
+            pending = self._take_pending()
+            if not any(pending.values()):
+                continue
+            failed = False
+            with self.app.app_context():
+                try:
+                    self.rescore(port_ids=pending["Port"], vessel_ids=pending["Vessel"],
+                                 cargo_type_ids=pending["CargoType"], vessel_type_ids=pending["VesselType"])
+                except Exception:
+                    # The ids go back in the queue; an uncaught error would kill this thread and
+                    # silently drop them along with every later change.
+                    self.app.logger.exception("Re-scoring pass failed; retrying in %.0fs", self.retry_seconds)
+                    self.db.session.rollback()
+                    self._restore_pending(pending)
+                    self.stats["failed_passes"] += 1
+                    failed = True
+            if failed:
+                time.sleep(self.retry_seconds)
+                self._wakeup.set()
+    
+    def affected_voyages_query(self, port_ids=(), vessel_ids=(), cargo_type_ids=(), vessel_type_ids=()):
+        Voyage = self.Voyage
+        conditions = []
+        if port_ids:
+            conditions.append(Voyage.destination_port_id.in_(list(port_ids)))
+        if vessel_ids:
+            conditions.append(Voyage.vessel_id.in_(list(vessel_ids)))
+        if cargo_type_ids:
+            conditions.append(Voyage.cargo_type_id.in_(list(cargo_type_ids)))
+        if vessel_type_ids:
+            conditions.append(Voyage.vessel_id.in_(
+                select(self.Vessel.id).where(self.Vessel.vessel_type_id.in_(list(vessel_type_ids)))
+            ))
+        if not conditions:
+            return None
+        return Voyage.query.options(
+            joinedload(Voyage.vessel),
+            joinedload(Voyage.origin_port),
+            joinedload(Voyage.destination_port),
+            joinedload(Voyage.cargo_type),
+        ).filter(Voyage.status.in_(OPEN_STATUSES), or_(*conditions)).order_by(Voyage.id)
+    
+    def rescore(self, port_ids=(), vessel_ids=(), cargo_type_ids=(), vessel_type_ids=()):
+        query = self.affected_voyages_query(port_ids, vessel_ids, cargo_type_ids, vessel_type_ids)
+        if query is None:
+            return 0
+        
+        table = self.Voyage.__table__
+        statement = update(table).where(table.c.id == bindparam("b_id")).values(
+            predicted_delay_hours=bindparam("b_delay"),
+            predicted_demurrage_cost=bindparam("b_cost"),
+        )
+        
+        rescored = 0
+        last_id = 0
+        while True:
+            voyages = query.filter(self.Voyage.id > last_id).limit(self.batch_size).all()
+            if not voyages:
+                break
+            rows = []
+            changes = []
+            for voyage in voyages:
+                prediction = self.predictor.predict_demurrage(
+                    vessel=voyage.vessel,
+                    origin_port=voyage.origin_port,
+                    dest_port=voyage.destination_port,
+                    cargo_type=voyage.cargo_type,
+                    cargo_volume=voyage.cargo_volume or 0,
+                    eta=voyage.eta,
+                    ontology=self.ontology
+                )
+                rows.append({"b_id": voyage.id, "b_delay": prediction["predicted_delay_hours"],
+                             "b_cost": prediction["predicted_cost"]})
+                changes.append(voyage_change(voyage, predicted_delay_hours=prediction["predicted_delay_hours"],
+                                             predicted_demurrage_cost=prediction["predicted_cost"]))
+            last_id = voyages[-1].id
+            self.db.session.execute(statement, rows)
+            queue_changes(self.db.session, changes)
+            self.db.session.commit()
+            self.db.session.expunge_all()
+            rescored += len(rows)
+        
+        self.stats["passes"] += 1
+        self.stats["rescored"] += rescored
+        return rescored
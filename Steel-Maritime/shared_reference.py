@@ -0,0 +1,206 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+
+def _default_directory(database_url=None):
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    name = "steel-maritime-reference"
+    if database_url:
+        # Deployments on one host must not share arrays built from different databases.
+        identity = make_url(database_url).render_as_string(hide_password=True)
+        name = f"{name}-{hashlib.sha1(identity.encode()).hexdigest()[:12]}"
+    return os.path.join(base, name)
+
+def compile_compatibility(predictor, ontology, vessel_types, cargo_types):
+    matrix = np.empty((len(vessel_types), len(cargo_types)))
+    for i, vessel_type in enumerate(vessel_types):
+        vessel = SimpleNamespace(vessel_type=SimpleNamespace(name=vessel_type["name"] or ""))
+        for j, cargo in enumerate(cargo_types):
+            matrix[i, j] = predictor._calculate_vessel_compatibility(
+                vessel, SimpleNamespace(category=cargo["category"]), ontology
+            )
+    return matrix
+
+class ReferenceDataStore:
+    def __init__(self, directory=None, check_interval=1.0, keep_generations=2, database_url=None):
+        self.directory = directory or os.environ.get("REFERENCE_DATA_DIR") or _default_directory(database_url)
+        self.check_interval = check_interval
+        self.keep_generations = keep_generations
+        self.generation = None
+        self.manifest = {}
+        self.arrays = {}
+        self._manifest_stamp = None
+        self._last_check = 0.0
+        self._vessel_type_index = {}
+        self._cargo_type_index = {}
+    
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+    
+    def publish_from_database(self, engine, models, predictor, ontology, distance_service=None):
+        tables = {name: models[name].__table__ for name in ("Port", "Vessel", "CargoType", "VesselType")}
+        with engine.connect() as connection:
+            rows = {name: [dict(r._mapping) for r in connection.execute(select(table).order_by(table.c.id))]
+                    for name, table in tables.items()}
+        
+        arrays = {
+            "vessel_type_ids": np.array([r["id"] for r in rows["VesselType"]], dtype="i8"),
+            "cargo_type_ids": np.array([r["id"] for r in rows["CargoType"]], dtype="i8"),
+            "compatibility": compile_compatibility(predictor, ontology, rows["VesselType"], rows["CargoType"]),
+            "vessel_type_speeds": np.array([ontology.get_service_speed(r["name"]) for r in rows["VesselType"]]),
+        }
+        if distance_service is not None:
+            distance_service.load([SimpleNamespace(**r) for r in rows["Port"]])
+            arrays["distance_port_ids"] = np.array(distance_service.port_ids, dtype="i8")
+            arrays["distance_lats"] = distance_service.lats
+            arrays["distance_lons"] = distance_service.lons
+            arrays["distance_matrix"] = distance_service.matrix
+        
+        metadata = {
+            "port_names": [r["name"] for r in rows["Port"]],
+            "vessel_names": [r["name"] for r in rows["Vessel"]],
+            "cargo_categories": [r["category"] for r in rows["CargoType"]],
+            "vessel_type_names": [r["name"] for r in rows["VesselType"]],
+            "route_factor": distance_service.route_factor if distance_service is not None else None,
+        }
+        return self.publish(arrays, metadata)
+    
+    def publish(self, arrays, metadata=None):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            current = self._read_manifest() or {}
+            generation = current.get("generation", 0) + 1
+            path = os.path.join(self.directory, f"gen-{generation:08d}")
+            os.makedirs(path, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+            
+            manifest = {
+                "generation": generation,
+                "path": path,
+                "arrays": sorted(arrays),
+                "metadata": metadata or {},
+                "published_at": time.time(),
+                "publisher_pid": os.getpid(),
+            }
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".json")
+            with os.fdopen(fd, "w") as handle:
+                json.dump(manifest, handle)
+            os.replace(tmp_path, self.manifest_path)
+            self._prune(generation)
+        self.attach()
+        return generation
+    
+    def _prune(self, generation):
+        for entry in os.listdir(self.directory):
+            if entry.startswith("gen-") and int(entry[4:]) <= generation - self.keep_generations:
+                # Workers still mapping an old generation keep their pages until they re-attach.
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+    
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as handle:
+                return json.load(handle)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    
+    def attach(self):
+        manifest = self._read_manifest()
+        if manifest is None:
+            return False
+        stamp = os.stat(self.manifest_path).st_mtime_ns
+        self.arrays = {
+            name: np.load(os.path.join(manifest["path"], f"{name}.npy"), mmap_mode="r")
+            for name in manifest["arrays"]
+        }
+        self.manifest = manifest
+        self.generation = manifest["generation"]
+        self._manifest_stamp = stamp
+        self._vessel_type_index = {int(i): row for row, i in enumerate(self.arrays.get("vessel_type_ids", ()))}
+        self._cargo_type_index = {int(i): column for column, i in enumerate(self.arrays.get("cargo_type_ids", ()))}
+        return True
+    
+    def compatibility(self, vessel_type_id, cargo_type_id):
+        row = self._vessel_type_index.get(vessel_type_id)
+        column = self._cargo_type_index.get(cargo_type_id)
+        if row is None or column is None:
+            return None
+        return float(self.arrays["compatibility"][row, column])
+    
+    def service_speed(self, vessel_type_id):
+        row = self._vessel_type_index.get(vessel_type_id)
+        return None if row is None else float(self.arrays["vessel_type_speeds"][row])
+    
+    def refresh_if_stale(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        try:
+            stamp = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if stamp == self._manifest_stamp:
+            return False
+        return self.attach()
+    
+    def __getattr__(self, name):
+        arrays = self.__dict__.get("arrays", {})
+        if name in arrays:
+            return arrays[name]
+        raise AttributeError(name)
+
+class ReferencePublisher:
+    def __init__(self, app, publish, debounce_seconds=2.0):
+        self.app = app
+        self.publish = publish
+        self.debounce_seconds = debounce_seconds
+        self.requested = 0
+        self.published = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+    
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+        return self
+    
+    def request(self):
+        with self._lock:
+            self.requested += 1
+            ticket = self.requested
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="reference-publisher", daemon=True)
+                self._worker.start()
+        self._wakeup.set()
+        return ticket
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # A bulk edit of ports or vessels commits many times; publish once it has settled.
+            while self._wakeup.wait(self.debounce_seconds):
+                self._wakeup.clear()
+            with self._lock:
+                covered = self.requested
+            with self.app.app_context():
+                try:
+                    self.publish()
+                except Exception:
+                    self.app.logger.exception("Publishing shared reference data failed")
+            # Listeners are released even after a failure; they then work from the previous generation.
+            self.published = covered
+            for listener in self._listeners:
+                listener()
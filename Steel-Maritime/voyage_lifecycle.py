@@ -0,0 +1,247 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import DateTime, Float, Integer, String, and_, bindparam, exists, func, insert, or_, select, update
+from datagen import DELAY_CAUSES
+from laytime import allowed_laytime_hours, spread_record_costs
+from live_feed import VOYAGE_FIELDS, queue_changes, voyage_change
+from rescoring import OPEN_STATUSES
+
+LIFECYCLE_STATUSES = ("planned", "in_progress", "arrived", "completed", "cancelled")
+TIMESTAMP_FIELDS = ("ata", "berthing_time", "departure_time")
+CAUSE_NAMES = {category: cause for cause, category in DELAY_CAUSES}
+
+def _timestamp(value):
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        # Stored voyage times are naive UTC.
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def parse_events(events):
+    if not isinstance(events, list):
+        raise ValueError("events must be a list")
+    updates = {}
+    for event in events:
+        # Several events for one voyage fold into one update; later fields win.
+        changes = updates.setdefault(int(event["voyage_id"]), {})
+        for field in TIMESTAMP_FIELDS:
+            if event.get(field) is not None:
+                changes[field] = _timestamp(event[field])
+        status = event.get("status")
+        if status is not None:
+            if status not in LIFECYCLE_STATUSES:
+                raise ValueError(f"Unknown status {status!r}; choose from {', '.join(LIFECYCLE_STATUSES)}")
+            changes["status"] = status
+        category = event.get("cause_category")
+        if category is not None:
+            if category not in CAUSE_NAMES:
+                raise ValueError(f"Unknown cause_category {category!r}; choose from {', '.join(CAUSE_NAMES)}")
+            changes["cause_category"] = category
+            changes.setdefault("cause", CAUSE_NAMES[category])
+        if event.get("cause"):
+            changes["cause"] = str(event["cause"])[:200]
+    return updates
+
+def _voyage_query(models, voyage_ids):
+    voyages = models['Voyage'].__table__
+    vessels = models['Vessel'].__table__
+    ports = models['Port'].__table__
+    cargo_types = models['CargoType'].__table__
+    return select(
+        *(voyages.c[name] for name in VOYAGE_FIELDS),
+        voyages.c.cargo_volume,
+        voyages.c.eta,
+        voyages.c.ata,
+        voyages.c.berthing_time,
+        voyages.c.departure_time,
+        voyages.c.actual_delay_hours,
+        voyages.c.actual_demurrage_cost,
+        vessels.c.demurrage_rate,
+        func.coalesce(ports.c.cargo_handling_rate, cargo_types.c.typical_loading_rate).label("loading_rate"),
+    ).select_from(
+        voyages.join(vessels, vessels.c.id == voyages.c.vessel_id)
+        .join(ports, ports.c.id == voyages.c.destination_port_id)
+        .outerjoin(cargo_types, cargo_types.c.id == voyages.c.cargo_type_id)
+    ).where(voyages.c.id.in_(voyage_ids)).order_by(voyages.c.id).with_for_update(of=voyages)
+
+def _record_totals(models, voyage_ids):
+    records = models['DemurrageRecord'].__table__
+    return select(
+        records.c.voyage_id, func.sum(records.c.cost), func.sum(records.c.delay_hours), func.count(records.c.id)
+    ).where(records.c.voyage_id.in_(voyage_ids)).group_by(records.c.voyage_id)
+
+def _merge(row, changes):
+    merged = {field: changes.get(field, getattr(row, field)) for field in TIMESTAMP_FIELDS}
+    departed = merged["departure_time"]
+    if departed is not None:
+        for field in ("ata", "berthing_time"):
+            if merged[field] is not None and merged[field] > departed:
+                raise ValueError(f"Voyage {row.id}: {field} is after departure_time")
+    
+    status = changes.get("status")
+    if status is None:
+        if departed is not None:
+            status = "completed"
+        elif (merged["ata"] or merged["berthing_time"]) and row.status in OPEN_STATUSES:
+            status = "arrived"
+        else:
+            status = row.status
+    merged["status"] = status
+    
+    # Berth delay against the scheduled arrival, as recorded for seeded and generated voyages.
+    arrival = row.eta or merged["ata"]
+    if merged["berthing_time"] is not None and arrival is not None:
+        merged["actual_delay_hours"] = round(max(0.0, (merged["berthing_time"] - arrival).total_seconds() / 3600), 2)
+    else:
+        merged["actual_delay_hours"] = row.actual_delay_hours
+    merged["actual_demurrage_cost"] = row.actual_demurrage_cost
+    return merged
+
+def _inserted_records(db, models, record_rows):
+    # The guard skipped some rows; keep the ones whose record is now stored as this call wrote it.
+    records = models['DemurrageRecord'].__table__
+    stored = db.session.execute(select(records.c.voyage_id).where(or_(*(and_(
+        records.c.voyage_id == r["r_voyage_id"],
+        records.c.recorded_at == r["r_recorded_at"],
+        records.c.cost == r["r_cost"],
+        records.c.delay_hours == r["r_delay"],
+    ) for r in record_rows)))).scalars().all()
+    stored = set(stored)
+    return [r for r in record_rows if r["r_voyage_id"] in stored]
+
+def apply_lifecycle_events(db, models, calculator, events, congestion_store=None, chunk_size=2000):
+    voyages = models['Voyage'].__table__
+    records = models['DemurrageRecord'].__table__
+    updates = parse_events(events)
+    
+    voyage_update = update(voyages).where(voyages.c.id == bindparam("b_id")).values(
+        ata=bindparam("b_ata", type_=DateTime),
+        berthing_time=bindparam("b_berthing_time", type_=DateTime),
+        departure_time=bindparam("b_departure_time", type_=DateTime),
+        status=bindparam("b_status", type_=String),
+        actual_delay_hours=bindparam("b_delay", type_=Float),
+        actual_demurrage_cost=bindparam("b_cost", type_=Float),
+    )
+    # Voyage rows are locked (in id order) before their records are read, so a concurrent call for
+    # the same voyages waits and then sees the records this one created. The NOT EXISTS guard
+    # still covers writers that do not take the lock, such as recompute-demurrage.
+    record_insert = insert(records).from_select(
+        ["voyage_id", "delay_hours", "cost", "cause", "cause_category", "recorded_at"],
+        select(
+            bindparam("r_voyage_id", type_=Integer),
+            bindparam("r_delay", type_=Float),
+            bindparam("r_cost", type_=Float),
+            bindparam("r_cause", type_=String),
+            bindparam("r_category", type_=String),
+            bindparam("r_recorded_at", type_=DateTime),
+        ).where(~exists().where(records.c.voyage_id == bindparam("r_voyage_id", type_=Integer)))
+    )
+    
+    stats = {"received": len(updates), "updated": 0, "unchanged": 0, "completed": 0,
+             "records_created": 0, "records_repriced": 0, "unknown_voyage_ids": []}
+    feed_changes = []
+    observations = []
+    record_delta = [0.0, 0.0, 0]
+    ids = sorted(updates)
+    try:
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            rows = db.session.execute(_voyage_query(models, chunk)).all()
+            totals = {voyage_id: (cost, delay, count) for voyage_id, cost, delay, count
+                      in db.session.execute(_record_totals(models, chunk)).all()}
+            found = {row.id for row in rows}
+            stats["unknown_voyage_ids"].extend(voyage_id for voyage_id in chunk if voyage_id not in found)
+            merged = [_merge(row, updates[row.id]) for row in rows]
+            
+            # Actual demurrage follows the laytime calculation used by recompute-demurrage.
+            completed = [i for i, values in enumerate(merged) if values["departure_time"] is not None]
+            if completed:
+                result = calculator.compute(
+                    nor_tendered=[merged[i]["ata"] for i in completed],
+                    berthed=[merged[i]["berthing_time"] for i in completed],
+                    completed=[merged[i]["departure_time"] for i in completed],
+                    allowed_hours=allowed_laytime_hours(
+                        np.array([rows[i].cargo_volume for i in completed], dtype=float),
+                        np.array([rows[i].loading_rate for i in completed], dtype=float)
+                    ),
+                    demurrage_rate=np.array([rows[i].demurrage_rate for i in completed], dtype=float),
+                    port_ids=np.array([rows[i].destination_port_id for i in completed]),
+                )
+                for i, ok, cost in zip(completed, result["valid"], result["demurrage_cost"]):
+                    if ok:
+                        merged[i]["actual_demurrage_cost"] = float(cost)
+            
+            voyage_rows, record_rows, repriced = [], [], []
+            for row, values in zip(rows, merged):
+                if any(values[name] != getattr(row, name) for name in values):
+                    voyage_rows.append({
+                        "b_id": row.id,
+                        "b_ata": values["ata"],
+                        "b_berthing_time": values["berthing_time"],
+                        "b_departure_time": values["departure_time"],
+                        "b_status": values["status"],
+                        "b_delay": values["actual_delay_hours"],
+                        "b_cost": values["actual_demurrage_cost"],
+                    })
+                    feed_changes.append(voyage_change(row, status=values["status"]))
+                    if values["ata"] != row.ata or values["berthing_time"] != row.berthing_time:
+                        observations.append(SimpleNamespace(id=row.id, destination_port_id=row.destination_port_id,
+                                                            ata=values["ata"], berthing_time=values["berthing_time"]))
+                    if values["status"] == "completed" and row.status != "completed":
+                        stats["completed"] += 1
+                else:
+                    stats["unchanged"] += 1
+                
+                if values["departure_time"] is None:
+                    continue
+                delay = values["actual_delay_hours"] or 0.0
+                cost = values["actual_demurrage_cost"] or 0.0
+                existing = totals.get(row.id)
+                if existing is None:
+                    if delay > 0 or cost > 0:
+                        changes = updates[row.id]
+                        record_rows.append({
+                            "r_voyage_id": row.id,
+                            "r_delay": delay,
+                            "r_cost": cost,
+                            "r_cause": changes.get("cause"),
+                            "r_category": changes.get("cause_category"),
+                            "r_recorded_at": values["departure_time"],
+                        })
+                elif values["actual_demurrage_cost"] != row.actual_demurrage_cost and existing[2] and existing[1]:
+                    repriced.append(row.id)
+                    record_delta[0] += cost - (existing[0] or 0.0)
+            
+            if voyage_rows:
+                db.session.execute(voyage_update, voyage_rows)
+            created = 0
+            if record_rows:
+                created = db.session.execute(record_insert, record_rows).rowcount
+                if created != len(record_rows):
+                    record_rows = _inserted_records(db, models, record_rows)
+                    created = len(record_rows)
+                record_delta[0] += sum(r["r_cost"] for r in record_rows)
+                record_delta[1] += sum(r["r_delay"] for r in record_rows)
+                record_delta[2] += created
+            if repriced:
+                spread_record_costs(db, models, repriced)
+            stats["updated"] += len(voyage_rows)
+            stats["records_created"] += created
+            stats["records_repriced"] += len(repriced)
+        
+        # Core statements bypass the ORM flush events, so queue what they would have recorded
+        # for the commit hooks that feed the dashboard and the congestion series.
+        if record_delta[2] or record_delta[0]:
+            feed_changes.append(["record", *record_delta])
+        queue_changes(db.session, feed_changes)
+        if observations and congestion_store is not None:
+            db.session.info.setdefault("congestion_observations", []).extend(
+                congestion_store.voyage_observations(observations)
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return stats
@@ -0,0 +1,44 @@
+import json
+import time
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select
+
+class WaitProfileStore:
+    def __init__(self, db, models, refresh_interval=5.0):
+        self.db = db
+        self.Profile = models['PortWaitProfile']
+        self.refresh_interval = refresh_interval
+        self.profiles = []
+        self._stamp = None
+        self._last_refresh = 0.0
+    
+    def save(self, profiles):
+        table = self.Profile.__table__
+        now = datetime.utcnow()
+        rows = [{"port_id": int(profile["port_id"]), "profile": json.dumps(profile), "updated_at": now}
+                for profile in profiles]
+        with self.db.engine.begin() as connection:
+            # A simulation run covers every port, so its profiles replace the previous set.
+            connection.execute(delete(table))
+            if rows:
+                connection.execute(insert(table), rows)
+        self.refresh()
+        return len(rows)
+    
+    def refresh(self):
+        table = self.Profile.__table__
+        with self.db.engine.connect() as connection:
+            stamp = tuple(connection.execute(select(func.max(table.c.updated_at), func.count())).one())
+            changed = stamp != self._stamp
+            if changed:
+                rows = connection.execute(select(table.c.profile).order_by(table.c.port_id)).scalars().all()
+        self._last_refresh = time.monotonic()
+        if changed:
+            self.profiles = [json.loads(row) for row in rows]
+            self._stamp = stamp
+        return changed
+    
+    def refresh_if_stale(self):
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return False
+        return self.refresh()
@@ -0,0 +1,165 @@
+import numpy as np
+from sqlalchemy import or_, select
+from sqlalchemy.orm import joinedload
+from demurrage_model import SCORING_WEIGHTS
+from rescoring import OPEN_STATUSES
+
+# Perturbable fields and the scoring input each one feeds. A port's congestion_level is the
+# level the predictor actually uses: live observations, then a simulated profile, then the
+# static avg_congestion_level.
+PORT_PARAMETERS = {
+    "congestion_level": "congestion_level",
+    "weather_delay_factor": "weather_factor",
+    "cargo_handling_rate": "cargo_handling_rate",
+    "num_berths": "num_berths",
+}
+VESSEL_PARAMETERS = {
+    "demurrage_rate": "demurrage_rate",
+}
+
+FACTORS = ("congestion", "cargo_handling", "weather", "port_efficiency", "vessel_compatibility")
+
+def _perturb(values, change):
+    if not isinstance(change, dict):
+        return np.full_like(values, float(change))
+    unknown = set(change) - {"set", "add", "scale"}
+    if unknown:
+        raise ValueError(f"Unknown perturbation {sorted(unknown)}; use set, add or scale")
+    if "set" in change:
+        return np.full_like(values, float(change["set"]))
+    return values * float(change.get("scale", 1.0)) + float(change.get("add", 0.0))
+
+def _parse_targets(scenario, key, parameters):
+    targets = {}
+    for target_id, changes in (scenario.get(key) or {}).items():
+        unknown = set(changes) - set(parameters)
+        if unknown:
+            raise ValueError(f"Cannot vary {sorted(unknown)} on {key}; choose from {sorted(parameters)}")
+        targets[int(target_id)] = changes
+    return targets
+
+def parse_scenarios(scenarios):
+    if not scenarios:
+        raise ValueError("At least one scenario is required")
+    parsed = []
+    for index, scenario in enumerate(scenarios):
+        weights = scenario.get("weights") or {}
+        unknown = set(weights) - set(SCORING_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown weights {sorted(unknown)}; choose from {list(SCORING_WEIGHTS)}")
+        parsed.append({
+            "name": scenario.get("name", f"scenario_{index}"),
+            "ports": _parse_targets(scenario, "ports", PORT_PARAMETERS),
+            "vessels": _parse_targets(scenario, "vessels", VESSEL_PARAMETERS),
+            "weights": weights,
+        })
+    return parsed
+
+def affected_voyages(db, models, scenarios):
+    Voyage = models['Voyage']
+    query = select(Voyage.id, Voyage.vessel_id, Voyage.destination_port_id, Voyage.cargo_type_id,
+                   Voyage.cargo_volume, Voyage.eta).where(Voyage.status.in_(OPEN_STATUSES))
+    
+    # A weight change moves every open voyage; otherwise only those touching a varied port or vessel.
+    if not any(scenario["weights"] for scenario in scenarios):
+        port_ids = {port_id for scenario in scenarios for port_id in scenario["ports"]}
+        vessel_ids = {vessel_id for scenario in scenarios for vessel_id in scenario["vessels"]}
+        conditions = []
+        if port_ids:
+            conditions.append(Voyage.destination_port_id.in_(port_ids))
+        if vessel_ids:
+            conditions.append(Voyage.vessel_id.in_(vessel_ids))
+        if not conditions:
+            return []
+        query = query.where(or_(*conditions))
+    return db.session.execute(query.order_by(Voyage.id)).all()
+
+def _stack(base, scenarios, voyage_port_ids, voyage_vessel_ids):
+    stacked = dict(base)
+    count = len(scenarios) + 1
+    for key, target_ids, parameters in (("ports", voyage_port_ids, PORT_PARAMETERS),
+                                        ("vessels", voyage_vessel_ids, VESSEL_PARAMETERS)):
+        for row, scenario in enumerate(scenarios, start=1):
+            for target_id, changes in scenario[key].items():
+                mask = target_ids == target_id
+                for field, change in changes.items():
+                    name = parameters[field]
+                    if stacked[name].ndim == 1:
+                        stacked[name] = np.tile(base[name], (count, 1))
+                    stacked[name][row, mask] = _perturb(stacked[name][row, mask], change)
+    return stacked
+
+def _stack_weights(predictor, scenarios):
+    weights = {}
+    for name in SCORING_WEIGHTS:
+        if any(name in scenario["weights"] for scenario in scenarios):
+            base = float(getattr(predictor, name))
+            column = [base] + [_perturb(np.array(base), scenario["weights"][name]).item()
+                               if name in scenario["weights"] else base for scenario in scenarios]
+            weights[name] = np.array(column)[:, None]
+    return weights
+
+def _summary(cost, delay, base_cost, factor_costs):
+    return {
+        "total_cost": round(float(cost.sum()), 2),
+        "mean_delay_hours": round(float(delay.mean()), 2) if delay.size else 0,
+        "cost_by_factor": {"base": round(float(base_cost.sum()), 2),
+                           **{name: round(float(factor_costs[name].sum()), 2) for name in FACTORS}},
+    }
+
+def run_what_if(db, models, predictor, ontology, scenarios, top_voyages=10):
+    scenarios = parse_scenarios(scenarios)
+    voyages = affected_voyages(db, models, scenarios)
+    
+    ports = {p.id: p for p in models['Port'].query.all()}
+    vessels = {v.id: v for v in models['Vessel'].query.options(joinedload(models['Vessel'].vessel_type)).all()}
+    cargo_types = {c.id: c for c in models['CargoType'].query.all()}
+    # predict_demurrage returns an empty prediction for these, so there is nothing to vary.
+    voyages = [v for v in voyages if v.vessel_id in vessels and v.destination_port_id in ports]
+    
+    voyage_ids = np.array([v.id for v in voyages], dtype=np.int64)
+    port_ids = np.array([v.destination_port_id for v in voyages], dtype=np.int64)
+    vessel_ids = np.array([v.vessel_id for v in voyages], dtype=np.int64)
+    base = predictor.scoring_inputs(voyages, ports, vessels, cargo_types, ontology)
+    
+    # Row 0 is the baseline, row i the i-th scenario; every scenario is scored in the same pass.
+    result = predictor.score_arrays(_stack(base, scenarios, port_ids, vessel_ids), _stack_weights(predictor, scenarios))
+    shape = (len(scenarios) + 1, len(voyages))
+    cost = np.broadcast_to(result["predicted_cost"], shape)
+    delay = np.broadcast_to(result["predicted_delay_hours"], shape)
+    base_cost = np.broadcast_to(result["base_cost"], shape)
+    factor_costs = {name: np.broadcast_to(result["factor_costs"][name], shape) for name in FACTORS}
+    
+    baseline = _summary(cost[0], delay[0], base_cost[0], {name: f[0] for name, f in factor_costs.items()})
+    unique_ports, port_index = np.unique(port_ids, return_inverse=True)
+    
+    report = {"voyages": len(voyages), "baseline": baseline, "scenarios": []}
+    for row, scenario in enumerate(scenarios, start=1):
+        summary = _summary(cost[row], delay[row], base_cost[row], {name: f[row] for name, f in factor_costs.items()})
+        deltas = cost[row] - cost[0]
+        delta_by_port = np.bincount(port_index, weights=deltas, minlength=len(unique_ports))
+        changed = np.flatnonzero(np.abs(deltas) >= 0.005)
+        top = changed[np.argsort(-np.abs(deltas[changed]), kind="stable")[:top_voyages]]
+        
+        report["scenarios"].append({
+            "name": scenario["name"],
+            **summary,
+            "cost_delta": round(summary["total_cost"] - baseline["total_cost"], 2),
+            "cost_delta_pct": (round((summary["total_cost"] / baseline["total_cost"] - 1) * 100, 2)
+                               if baseline["total_cost"] else None),
+            "delay_delta_hours": round(float((delay[row] - delay[0]).sum()), 2),
+            "factor_deltas": {name: round(summary["cost_by_factor"][name] - baseline["cost_by_factor"][name], 2)
+                              for name in summary["cost_by_factor"]},
+            "voyages_changed": int(changed.size),
+            "by_port": sorted(
+                ({"port_id": int(port_id), "name": ports[port_id].name, "cost_delta": round(float(value), 2)}
+                 for port_id, value in zip(unique_ports.tolist(), delta_by_port) if abs(value) >= 0.005),
+                key=lambda entry: abs(entry["cost_delta"]), reverse=True
+            ),
+            "top_voyages": [
+                {"voyage_id": int(voyage_ids[i]), "baseline_cost": round(float(cost[0, i]), 2),
+                 "scenario_cost": round(float(cost[row, i]), 2), "cost_delta": round(float(deltas[i]), 2)}
+                for i in top
+            ],
+        })
+    return report